@@ -0,0 +1,15 @@
+"""
+Benchmarks de los caminos críticos de la aplicación 'core'.
+
+Cada módulo se ejecuta desde la carpeta del proyecto (donde está manage.py):
+    python -m benchmarks.carga_masiva --filas 20000
+
+Solo al ejecutarse así configuran Django (django.setup()); importados desde
+otro código, como 'manage.py bench', usan la configuración ya cargada. Los
+datos sintéticos comunes están en benchmarks/datos.py.
+
+La suite completa, con datos sintéticos reproducibles y resultados en JSON
+comparables contra una línea base, se corre con:
+    python manage.py bench --filas 100k --salida base.json
+    python manage.py bench --filas 100k --comparar base.json
+"""
@@ -0,0 +1,100 @@
+"""
+Benchmark de la búsqueda del mantenedor (core/busqueda.py): llena una base
+de prueba, construye la tabla de tokens y mide la primera ventana de la
+grilla para distintas búsquedas, comparada con el LIKE '%...%' equivalente.
+
+Uso:
+    python -m benchmarks.busqueda --filas 1000000 [--objetivo-ms 100]
+"""
+import argparse
+import os
+import statistics
+import time
+
+import django
+
+if __name__ == '__main__':
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nuam_project.settings')
+    django.setup()
+
+from django.http import QueryDict  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.db.models import Q  # noqa: E402
+
+from benchmarks.datos import poblar  # noqa: E402
+from core.busqueda import buscar, reindexar_todo  # noqa: E402
+from core.models import CalificacionTributaria, Instrumento, Mercado, TokenBusqueda  # noqa: E402
+from core.paginacion import paginar_keyset  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos), resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--filas', type=int, default=1_000_000)
+    parser.add_argument('--instrumentos', type=int, default=5000)
+    parser.add_argument('--repeticiones', type=int, default=10)
+    parser.add_argument('--objetivo-ms', type=float, default=100, help="Latencia máxima aceptada por ventana")
+    args = parser.parse_args()
+
+    nombre_db = connection.creation.create_test_db(verbosity=0)
+    try:
+        usuarios = User.objects.bulk_create(User(username=f'corredor{i}') for i in range(50))
+        admin = User.objects.create_superuser('admin', password='bench')
+        mercado = Mercado.objects.create(codigo='BCS', nombre='Bolsa de Santiago')
+        instrumentos = Instrumento.objects.bulk_create(
+            Instrumento(mercado=mercado, codigo=f'INST{i:05d}', nombre=f'Instrumento {i}') for i in range(args.instrumentos)
+        )
+        poblar(args.filas, usuarios, instrumentos)
+
+        inicio = time.perf_counter()
+        reindexar_todo()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        print(f'{args.filas:,} filas ({connection.vendor}); {TokenBusqueda.objects.count():,} tokens '
+              f'construidos en {time.perf_counter() - inicio:.1f}s')
+
+        muestra = CalificacionTributaria.objects.filter(usuario=usuarios[0]).order_by('id').first()
+        rut = muestra.rut_propietario.split('-')[0]
+        casos = [
+            # (nombre, parámetros de búsqueda, filtro LIKE equivalente)
+            ('RUT exacto', {'q': muestra.rut_propietario}, Q(rut_propietario__icontains=muestra.rut_propietario)),
+            ('RUT sin DV (prefijo)', {'q': rut}, Q(rut_propietario__icontains=rut)),
+            ('código de instrumento', {'q': 'inst00042'}, Q(instrumento__codigo__icontains='inst00042')),
+            ('palabra de descripción', {'q': 'eventual'}, Q(descripcion__icontains='eventual')),
+            ('dos palabras', {'q': 'reparto capital'}, Q(descripcion__icontains='reparto') & Q(descripcion__icontains='capital')),
+            ('ejercicio + rango de fechas', {'ejercicio': '2024', 'desde': '2024-03-01', 'hasta': '2024-03-31'},
+             Q(ejercicio=2024, fecha_pago__range=('2024-03-01', '2024-03-31'))),
+        ]
+
+        fallas = 0
+        for usuario in (usuarios[0], admin):
+            base = CalificacionTributaria.objects.visibles_para(usuario).para_listado()
+            print(f'\n== {"superusuario" if usuario.is_superuser else "usuario"} '
+                  f'({base.count():,} filas visibles), primera ventana de 200')
+            for nombre, parametros, like in casos:
+                consulta = QueryDict(mutable=True)
+                consulta.update(parametros)
+                t_busqueda, (filas, _, _) = medir(lambda: paginar_keyset(buscar(base, consulta), tamano=200), args.repeticiones)
+                t_like, (filas_like, _, _) = medir(lambda: paginar_keyset(base.filter(like), tamano=200), args.repeticiones)
+                # Mismo resultado que el LIKE (salvo instrumento, donde la búsqueda también mira el nombre)
+                assert [f.id for f in filas] == [f.id for f in filas_like] or nombre == 'código de instrumento', nombre
+                ok = t_busqueda * 1000 <= args.objetivo_ms
+                fallas += not ok
+                print(f'  {nombre:<28} {t_busqueda * 1000:8.1f} ms  (LIKE {t_like * 1000:8.1f} ms)  '
+                      f'{len(filas):>3} filas  {"OK" if ok else "SOBRE OBJETIVO"}')
+        print(f'\nobjetivo {args.objetivo_ms:.0f} ms: {"cumplido" if not fallas else f"{fallas} casos sobre el objetivo"}')
+    finally:
+        connection.creation.destroy_test_db(nombre_db, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
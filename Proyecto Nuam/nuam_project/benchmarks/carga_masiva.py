@@ -0,0 +1,98 @@
+"""
+Benchmark de procesar_carga_masiva: genera un CSV sintético (separador ';'
+y coma decimal, como los archivos de corredoras) y mide filas/segundo
+sobre una base de datos de prueba creada desde las migraciones.
+
+Uso:
+    python -m benchmarks.carga_masiva --filas 20000 [--procesos 4] [--min-filas-s 1000]
+
+Línea base (20.000 filas, SQLite, 1 CPU, con la deduplicación por clave
+natural y las huellas de fila): ~1.300-1.500 filas/s. Con --min-filas-s el
+benchmark termina con error si queda bajo ese umbral, para detectar
+regresiones; 1000 deja margen para el ruido de la máquina.
+"""
+import argparse
+import io
+import os
+import random
+import time
+
+try:
+    import resource
+except ImportError:  # Windows: no hay getrusage
+    resource = None
+
+import django
+
+if __name__ == '__main__':
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nuam_project.settings')
+    django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+from django.db import connection  # noqa: E402
+
+from core.models import CalificacionTributaria, Instrumento, Mercado  # noqa: E402
+from core.utils import procesar_carga_masiva  # noqa: E402
+
+
+def generar_csv(filas, instrumentos, semilla=42):
+    """Arma un CSV en memoria con las columnas que exporta una corredora."""
+    rnd = random.Random(semilla)
+    encabezado = ['RUT', 'INSTRUMENTO', 'FECHA PAGO', 'MONTO HISTORICO', 'FACTOR ACTUALIZACION']
+    encabezado += [f'F{i:02d}' for i in range(8, 38)]
+    salida = io.StringIO()
+    salida.write(';'.join(encabezado) + '\n')
+    for _ in range(filas):
+        celdas = [
+            f'{rnd.randint(1000000, 25000000)}-{rnd.randint(0, 9)}',
+            rnd.choice(instrumentos),
+            f'{rnd.randint(1, 28):02d}-{rnd.randint(1, 12):02d}-2025',
+            str(rnd.randint(1000, 5000000)),
+            f'1,{rnd.randint(0, 99999):06d}',
+        ]
+        celdas += [f'0,{rnd.randint(0, 999999):06d}' for _ in range(30)]
+        salida.write(';'.join(celdas) + '\n')
+    return salida.getvalue().encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--filas', type=int, default=20000)
+    parser.add_argument('--procesos', type=int, default=1, help="Procesos para la etapa de validación")
+    parser.add_argument('--min-filas-s', type=float, default=0,
+                        help="Falla si las filas/s guardadas quedan bajo este umbral (0 = no revisar)")
+    args = parser.parse_args()
+
+    nombre_db = connection.creation.create_test_db(verbosity=0)
+    try:
+        usuario = User.objects.create_user('bench', password='bench')
+        mercado = Mercado.objects.create(codigo='BCS', nombre='Bolsa de Santiago')
+        codigos = [f'INST{i:03d}' for i in range(200)]
+        Instrumento.objects.bulk_create(
+            Instrumento(mercado=mercado, codigo=c, nombre=f'Instrumento {c}') for c in codigos
+        )
+        contenido = generar_csv(args.filas, [c.lower() for c in codigos])
+
+        archivo = SimpleUploadedFile('bench.csv', contenido)
+        inicio = time.perf_counter()
+        guardados, errores = procesar_carga_masiva(archivo, usuario, procesos=args.procesos)
+        duracion = time.perf_counter() - inicio
+
+        assert CalificacionTributaria.objects.count() == guardados
+        print(f'filas={args.filas} procesos={args.procesos} guardados={guardados} errores={len(errores)}')
+        for error in errores[:5]:
+            print('  ', error)
+        filas_s = guardados / duracion
+        print(f'tiempo={duracion:.2f}s  filas/s={filas_s:,.0f}')
+        # ru_maxrss viene en KB en Linux; incluye el CSV sintético que se generó en memoria
+        if resource: print(f'memoria máxima del proceso={resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:,.0f} MB '
+              f'(archivo de {len(contenido) / 2**20:,.1f} MB)')
+    finally:
+        connection.creation.destroy_test_db(nombre_db, verbosity=0)
+    if filas_s < args.min_filas_s:
+        raise SystemExit(f'regresión: {filas_s:,.0f} filas/s, bajo el mínimo de {args.min_filas_s:,.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark de concurrencia: lecturas del mantenedor (grilla, detalle y
+página) mezcladas con cargas masivas, en hilos, contra una base de prueba
+en disco con el perfil de base de datos configurado (ver DATABASES en
+settings.py). Cuenta operaciones por segundo, latencias y errores, en
+particular los "database is locked" de SQLite.
+
+Uso:
+    python -m benchmarks.concurrencia --filas 100000 --lectores 8 --cargas 2 --segundos 30
+    DB_SQLITE_AJUSTADO=False python -m benchmarks.concurrencia ...   # SQLite sin ajustes, para comparar
+    DB_MOTOR=postgres DB_POOL=True python -m benchmarks.concurrencia ...
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import django
+
+if __name__ == '__main__':
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nuam_project.settings')
+    django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+from django.db import connection, connections  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from benchmarks.datos import archivo_carga, filas_de, poblar_base  # noqa: E402
+from core.models import CalificacionTributaria  # noqa: E402
+from core.utils import procesar_carga_masiva  # noqa: E402
+
+
+class Resultados:
+    def __init__(self):
+        self.candado = threading.Lock()
+        self.tiempos = defaultdict(list)
+        self.errores = defaultdict(list)
+
+    def anotar(self, tipo, segundos, error=None):
+        with self.candado:
+            if error is None: self.tiempos[tipo].append(segundos * 1000)
+            else: self.errores[tipo].append(error)
+
+
+def lector(numero, usuario, ids, hasta, resultados):
+    rnd = random.Random(numero)
+    cliente = Client()
+    cliente.force_login(usuario)
+    urls = [
+        ('grilla', lambda: reverse('calificaciones_api')),
+        ('detalle', lambda: reverse('obtener_detalle', args=[rnd.choice(ids)])),
+        ('mantenedor', lambda: reverse('mantenedor')),
+    ]
+    try:
+        while time.monotonic() < hasta:
+            tipo, url = rnd.choices(urls, weights=(6, 3, 1))[0]
+            inicio = time.perf_counter()
+            try:
+                respuesta = cliente.get(url())
+                error = None if respuesta.status_code == 200 else f'HTTP {respuesta.status_code}'
+                # Las APIs informan los errores con HTTP 200 y status 'error' en el JSON
+                if error is None and respuesta['Content-Type'] == 'application/json' and respuesta.json().get('status') == 'error':
+                    error = f"{tipo}: {respuesta.json().get('msg')}"
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+            resultados.anotar(tipo, time.perf_counter() - inicio, error)
+    finally:
+        connections.close_all()
+
+
+def cargador(numero, codigos, filas, hasta, resultados):
+    usuario = User.objects.create_user(f'cargador{numero}')
+    try:
+        vuelta = 0
+        while time.monotonic() < hasta:
+            contenido = archivo_carga(filas, codigos, semilla=numero * 1000 + vuelta)
+            vuelta += 1
+            inicio = time.perf_counter()
+            try:
+                guardados, errores = procesar_carga_masiva(SimpleUploadedFile('carga.csv', contenido), usuario)
+                error = errores[0] if errores else None
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+            resultados.anotar('carga', time.perf_counter() - inicio, error)
+    finally:
+        connections.close_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filas', default='100k', help="Calificaciones iniciales: 10k, 100k, 1m o un número")
+    parser.add_argument('--lectores', type=int, default=8)
+    parser.add_argument('--cargas', type=int, default=2, help="Hilos que suben archivos sin parar")
+    parser.add_argument('--filas-carga', type=int, default=2000, help="Filas de cada archivo subido")
+    parser.add_argument('--segundos', type=int, default=30)
+    args = parser.parse_args()
+
+    # SQLite de prueba en disco (la de memoria no se comparte entre hilos)
+    if connection.vendor == 'sqlite':
+        directorio = tempfile.mkdtemp()
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = str(Path(directorio) / 'concurrencia.sqlite3')
+    nombre_db = connection.creation.create_test_db(verbosity=0)
+    try:
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver']):
+            usuarios, _, instrumentos = poblar_base(filas_de(args.filas))
+            codigos = [i.codigo for i in instrumentos[:200]]
+            opciones = connection.settings_dict.get('OPTIONS', {})
+            print(f'{CalificacionTributaria.objects.count():,} filas ({connection.vendor}, opciones {opciones or "por defecto"})')
+            print(f'{args.lectores} lectores y {args.cargas} cargas de {args.filas_carga} filas durante {args.segundos}s')
+            connections.close_all()
+
+            resultados = Resultados()
+            hasta = time.monotonic() + args.segundos
+            hilos = []
+            for i in range(args.lectores):
+                # Cada lector pide detalles de sus propias calificaciones (las de otro dan error)
+                usuario = usuarios[i % len(usuarios)]
+                ids = list(CalificacionTributaria.objects.filter(usuario=usuario).values_list('id', flat=True)[:1000])
+                hilos.append(threading.Thread(target=lector, args=(i, usuario, ids, hasta, resultados)))
+            connections.close_all()
+            hilos += [threading.Thread(target=cargador, args=(i, codigos, args.filas_carga, hasta, resultados))
+                      for i in range(args.cargas)]
+            inicio = time.monotonic()
+            for hilo in hilos: hilo.start()
+            for hilo in hilos: hilo.join()
+            duracion = time.monotonic() - inicio
+
+        for tipo in sorted(resultados.tiempos.keys() | resultados.errores.keys()):
+            tiempos, errores = sorted(resultados.tiempos[tipo]), resultados.errores[tipo]
+            linea = f'  {tipo:<11} {len(tiempos):6} ok  {len(tiempos) / duracion:8.1f}/s'
+            if tiempos:
+                p95 = tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))]
+                linea += f'  p50 {statistics.median(tiempos):8.1f} ms  p95 {p95:8.1f} ms'
+            print(linea + f'  {len(errores)} errores')
+            bloqueos = sum('locked' in e for e in errores)
+            if bloqueos: print(f'              {bloqueos} "database is locked"')
+            if errores: print(f'              ej.: {errores[0][:150]}')
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(nombre_db, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
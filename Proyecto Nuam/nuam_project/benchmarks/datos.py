@@ -0,0 +1,129 @@
+"""
+Datos sintéticos reproducibles (misma semilla, mismos datos) para los
+benchmarks: mercados, instrumentos, usuarios y calificaciones en la BD, y
+archivos de carga masiva CSV o XLSX como los que mandan las corredoras.
+"""
+import io
+import random
+from datetime import timedelta
+
+import openpyxl
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.busqueda import reindexar_todo
+from core.models import CalificacionTributaria, Instrumento, Mercado
+from core.resumen import reconciliar
+
+# Tamaños con nombre para --filas
+TAMANOS = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+MERCADOS = (('BCS', 'Bolsa de Santiago'), ('BVL', 'Bolsa de Lima'), ('BVC', 'Bolsa de Colombia'))
+LOTE = 5000
+
+
+def filas_de(tamano):
+    """'10k', '100k', '1m' o un número."""
+    return TAMANOS[tamano.lower()] if tamano.lower() in TAMANOS else int(tamano)
+
+
+def poblar(filas, usuarios, instrumentos, semilla=42):
+    """
+    Inserta 'filas' calificaciones repartidas en ~2 años, usuarios e
+    instrumentos, sin tokens de búsqueda ni resumen (ver poblar_base).
+    """
+    rnd = random.Random(semilla)
+    palabras = ('Dividendo', 'definitivo', 'provisorio', 'eventual', 'Reparto', 'utilidades', 'acumuladas', 'Devolución', 'capital')
+    ahora = timezone.now()
+    for inicio in range(0, filas, LOTE):
+        nuevas = [
+            (CalificacionTributaria(
+                usuario=rnd.choice(usuarios), instrumento=rnd.choice(instrumentos),
+                rut_propietario=f'{rnd.randint(1000000, 25000000)}-{rnd.choice("0123456789K")}',
+                descripcion=' '.join(rnd.sample(palabras, 3)) + f' N° {rnd.randint(1, 9999)}',
+                fecha_pago=(ahora - timedelta(days=rnd.randint(0, 3 * 365))).date(),
+                ejercicio=rnd.choice((2023, 2024, 2025)), secuencia=rnd.randint(1, 400),
+                monto_historico=rnd.randint(1000, 5000000),
+             ), ahora - timedelta(seconds=rnd.randint(0, 2 * 365 * 86400)))
+            for _ in range(min(LOTE, filas - inicio))
+        ]
+        with transaction.atomic():
+            creadas = CalificacionTributaria.objects.bulk_create([c for c, _ in nuevas])
+            # created_at es auto_now_add: las fechas repartidas se escriben después de insertar
+            for calif, (_, creada) in zip(creadas, nuevas): calif.created_at = creada
+            CalificacionTributaria.objects.bulk_update(creadas, ['created_at'], batch_size=1000)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def poblar_base(filas, instrumentos=5000, usuarios=50, semilla=42):
+    """
+    Llena la BD (vacía, recién migrada) y deja al día los tokens de búsqueda
+    y el resumen, como si las filas hubieran entrado por la aplicación.
+    Retorna (usuarios, admin, instrumentos).
+    """
+    corredores = User.objects.bulk_create(User(username=f'corredor{i}') for i in range(usuarios))
+    admin = User.objects.create_superuser('admin', password='bench')
+    mercados = Mercado.objects.bulk_create(Mercado(codigo=c, nombre=n) for c, n in MERCADOS)
+    creados = Instrumento.objects.bulk_create(
+        Instrumento(mercado=mercados[i % len(mercados)], codigo=f'INST{i:05d}', nombre=f'Instrumento {i}')
+        for i in range(instrumentos)
+    )
+    poblar(filas, corredores, creados, semilla=semilla)
+    reindexar_todo()
+    reconciliar()
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return corredores, admin, creados
+
+
+def _filas_carga(filas, codigos, semilla):
+    rnd = random.Random(semilla)
+    for i in range(filas):
+        yield [
+            f'{rnd.randint(1000000, 25000000)}-{rnd.choice("0123456789K")}',
+            rnd.choice(codigos).lower(),
+            f'{rnd.randint(1, 28):02d}-{rnd.randint(1, 12):02d}-2025',
+            i + 1,
+            rnd.choice(('Dividendo definitivo', 'Dividendo provisorio', 'Devolución de capital')),
+            rnd.randint(1000, 5000000),
+            1 + rnd.randint(0, 99999) / 1e6,
+            *(rnd.randint(0, 999999) / 1e6 for _ in range(30)),
+        ]
+
+
+ENCABEZADO = ['RUT', 'INSTRUMENTO', 'FECHA PAGO', 'SECUENCIA', 'DESCRIPCION', 'MONTO HISTORICO', 'FACTOR ACTUALIZACION',
+              *(f'F{i:02d}' for i in range(8, 38))]
+
+
+def archivo_carga(filas, codigos, formato='csv', coma_decimal=True, encoding='utf-8', semilla=42):
+    """
+    Contenido (bytes) de un archivo de carga masiva con 'filas' filas sobre
+    los códigos de instrumento dados. CSV con ';' y coma decimal o con ',' y
+    punto decimal, en UTF-8 o Latin-1; XLSX con números como celdas numéricas.
+    """
+    if formato == 'xlsx':
+        libro = openpyxl.Workbook(write_only=True)
+        hoja = libro.create_sheet()
+        hoja.append(ENCABEZADO)
+        for fila in _filas_carga(filas, codigos, semilla): hoja.append(fila)
+        salida = io.BytesIO()
+        libro.save(salida)
+        return salida.getvalue()
+
+    separador = ';' if coma_decimal else ','
+    numero = (lambda v: f'{v:.6f}'.replace('.', ',')) if coma_decimal else (lambda v: f'{v:.6f}')
+    salida = io.StringIO()
+    salida.write(separador.join(ENCABEZADO) + '\n')
+    for fila in _filas_carga(filas, codigos, semilla):
+        salida.write(separador.join(numero(v) if isinstance(v, float) else str(v) for v in fila) + '\n')
+    return salida.getvalue().encode(encoding)
+
+
+# Variantes de archivo que mide la suite: (nombre, extensión, argumentos de archivo_carga)
+VARIANTES_CARGA = (
+    ('csv_coma_utf8', 'csv', {'coma_decimal': True, 'encoding': 'utf-8'}),
+    ('csv_coma_latin1', 'csv', {'coma_decimal': True, 'encoding': 'latin-1'}),
+    ('csv_punto_utf8', 'csv', {'coma_decimal': False, 'encoding': 'utf-8'}),
+    ('xlsx', 'xlsx', {'formato': 'xlsx'}),
+)
@@ -0,0 +1,79 @@
+"""
+Benchmark de la exportación (core/exportacion.py): llena una base de prueba y
+mide MB/s de CSV, XLSX y Parquet (si está pyarrow), junto con cuánto crece la
+memoria máxima del proceso en cada formato, que debe quedar plana aunque
+crezcan las filas.
+
+Uso:
+    python -m benchmarks.exportacion --filas 1000000 [--lote 2000]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows: no hay getrusage
+    resource = None
+
+import django
+
+if __name__ == '__main__':
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nuam_project.settings')
+    django.setup()
+
+from benchmarks.datos import poblar  # noqa: E402
+from core.exportacion import exportar_csv, exportar_parquet, exportar_xlsx, parquet_disponible  # noqa: E402
+from core.models import CalificacionTributaria, Instrumento, Mercado  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+
+
+def memoria_maxima_mb():
+    # ru_maxrss viene en KB en Linux; sin 'resource' (Windows) se informa 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else 0
+
+
+def a_csv(qs, destino, lote):
+    for pedazo in exportar_csv(qs, lote):
+        destino.write(pedazo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--filas', type=int, default=1_000_000)
+    parser.add_argument('--instrumentos', type=int, default=5000)
+    parser.add_argument('--lote', type=int, default=2000)
+    args = parser.parse_args()
+
+    nombre_db = connection.creation.create_test_db(verbosity=0)
+    try:
+        usuarios = User.objects.bulk_create(User(username=f'corredor{i}') for i in range(50))
+        mercado = Mercado.objects.create(codigo='BCS', nombre='Bolsa de Santiago')
+        instrumentos = Instrumento.objects.bulk_create(
+            Instrumento(mercado=mercado, codigo=f'INST{i:05d}', nombre=f'Instrumento {i}') for i in range(args.instrumentos)
+        )
+        poblar(args.filas, usuarios, instrumentos)
+        qs = CalificacionTributaria.objects.order_by('-created_at', '-id')
+        print(f'{args.filas:,} filas ({connection.vendor}), lotes de {args.lote}')
+
+        formatos = [('csv', a_csv), ('xlsx', exportar_xlsx)]
+        if parquet_disponible(): formatos.append(('parquet', exportar_parquet))
+        else: print('pyarrow no está instalado: se omite Parquet')
+
+        for nombre, exportar in formatos:
+            antes = memoria_maxima_mb()
+            with tempfile.TemporaryFile() as destino:
+                inicio = time.perf_counter()
+                exportar(qs, destino, args.lote)
+                duracion = time.perf_counter() - inicio
+                megas = destino.tell() / 2**20
+            print(f'  {nombre:<8} {megas:8.1f} MB en {duracion:6.1f}s  {megas / duracion:6.1f} MB/s  '
+                  f'{args.filas / duracion:9,.0f} filas/s  memoria máxima +{memoria_maxima_mb() - antes:,.0f} MB')
+    finally:
+        connection.creation.destroy_test_db(nombre_db, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark de los índices de core (migración 0009): llena una base de prueba
+con calificaciones sintéticas, muestra el plan (EXPLAIN) y el tiempo de las
+consultas frecuentes sin los índices y con ellos.
+
+Uso:
+    python -m benchmarks.indices --filas 1000000 [--repeticiones 20]
+"""
+import argparse
+import os
+import statistics
+import time
+
+import django
+
+if __name__ == '__main__':
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nuam_project.settings')
+    django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.db.models.functions import Upper  # noqa: E402
+
+from benchmarks.datos import poblar  # noqa: E402
+from core.models import CalificacionTributaria, Instrumento, Mercado  # noqa: E402
+from core.paginacion import anteriores_a  # noqa: E402
+
+
+def consultas(usuario, admin, instrumento, codigos):
+    """Consultas que hacen el mantenedor y la carga masiva, como (nombre, queryset)."""
+    propias = CalificacionTributaria.objects.visibles_para(usuario).para_listado().order_by('-created_at', '-id')
+    todas = CalificacionTributaria.objects.visibles_para(admin).para_listado().order_by('-created_at', '-id')
+
+    # Cursor a mitad de las filas del usuario, como si hubiera hecho mucho scroll
+    medio = propias[propias.count() // 2]
+    profunda = anteriores_a(propias, medio.created_at, medio.id)
+
+    return [
+        ('mantenedor usuario, 1a ventana', propias[:201]),
+        ('mantenedor usuario, ventana profunda', profunda[:201]),
+        ('mantenedor superusuario, 1a ventana', todas[:201]),
+        ('instrumento + ejercicio + secuencia', CalificacionTributaria.objects.filter(
+            instrumento=instrumento, ejercicio=2025, secuencia=7)),
+        ('carga masiva: códigos sin mayúsculas', Instrumento.objects.annotate(
+            codigo_mayus=Upper('codigo')).filter(codigo_mayus__in=codigos)),
+        ('filtro de mercado (icontains)', propias.filter(instrumento__mercado__nombre__icontains='santiago')[:201]),
+    ]
+
+
+def medir(casos, repeticiones):
+    resultado = {}
+    for nombre, qs in casos:
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            list(qs.all())
+            tiempos.append(time.perf_counter() - inicio)
+        resultado[nombre] = (statistics.median(tiempos), qs.explain())
+    return resultado
+
+
+def indices():
+    return [(modelo, indice) for modelo in (CalificacionTributaria, Instrumento) for indice in modelo._meta.indexes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--filas', type=int, default=1_000_000)
+    parser.add_argument('--instrumentos', type=int, default=5000)
+    parser.add_argument('--repeticiones', type=int, default=20)
+    args = parser.parse_args()
+
+    nombre_db = connection.creation.create_test_db(verbosity=0)
+    try:
+        usuarios = User.objects.bulk_create(User(username=f'corredor{i}') for i in range(50))
+        admin = User.objects.create_superuser('admin', password='bench')
+        mercados = Mercado.objects.bulk_create(
+            Mercado(codigo=c, nombre=n) for c, n in (('BCS', 'Bolsa de Santiago'), ('BVL', 'Bolsa de Lima'), ('BVC', 'Bolsa de Colombia'))
+        )
+        instrumentos = Instrumento.objects.bulk_create(
+            Instrumento(mercado=mercados[i % 3], codigo=f'INST{i:05d}', nombre=f'Instrumento {i}') for i in range(args.instrumentos)
+        )
+        inicio = time.perf_counter()
+        poblar(args.filas, usuarios, instrumentos)
+        print(f'{args.filas:,} filas insertadas en {time.perf_counter() - inicio:.1f}s ({connection.vendor})')
+
+        casos = consultas(usuarios[0], admin, instrumentos[0], [f'inst{i:05d}'.upper() for i in range(0, args.instrumentos, 25)])
+
+        with connection.schema_editor() as editor:
+            for modelo, indice in indices():
+                editor.remove_index(modelo, indice)
+        sin_indices = medir(casos, args.repeticiones)
+
+        inicio = time.perf_counter()
+        with connection.schema_editor() as editor:
+            for modelo, indice in indices():
+                editor.add_index(modelo, indice)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        print(f'índices creados en {time.perf_counter() - inicio:.1f}s')
+        con_indices = medir(casos, args.repeticiones)
+
+        for nombre, _ in casos:
+            antes, plan_antes = sin_indices[nombre]
+            despues, plan_despues = con_indices[nombre]
+            print(f'\n== {nombre}: {antes * 1000:,.1f} ms -> {despues * 1000:,.1f} ms ({antes / despues:,.1f}x)')
+            print('  sin índices:\n    ' + plan_antes.replace('\n', '\n    '))
+            print('  con índices:\n    ' + plan_despues.replace('\n', '\n    '))
+    finally:
+        connection.creation.destroy_test_db(nombre_db, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
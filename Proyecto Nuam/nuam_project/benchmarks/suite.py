@@ -0,0 +1,169 @@
+"""
+Suite de benchmarks de los caminos críticos: carga masiva (CSV y XLSX),
+render del mantenedor, JSON de detalle, filtros de la grilla y exportación.
+La ejecuta 'manage.py bench', que arma la base sintética (benchmarks/datos.py)
+y guarda o compara los resultados en JSON.
+
+Cada caso es una función (contexto, repeticiones) -> {'ms': [...], ...} y se
+registra con @caso. El contexto tiene los usuarios, instrumentos y un Client
+con sesión de corredor y de administrador.
+"""
+import platform
+import random
+import statistics
+import time
+from types import SimpleNamespace
+
+import django
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from benchmarks.datos import VARIANTES_CARGA, archivo_carga, poblar_base
+from core.models import CalificacionTributaria
+from core.utils import procesar_carga_masiva
+
+CASOS = {}
+
+
+def caso(funcion):
+    CASOS[funcion.__name__] = funcion
+    return funcion
+
+
+def cronometrar(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return tiempos
+
+
+def _get(cliente, url, **parametros):
+    respuesta = cliente.get(url, parametros)
+    assert respuesta.status_code == 200, (url, respuesta.status_code)
+    # Las respuestas en streaming se consumen enteras para medir todo el trabajo
+    if respuesta.streaming: return b''.join(respuesta.streaming_content)
+    return respuesta.content
+
+
+def preparar(filas, semilla=42):
+    usuarios, admin, instrumentos = poblar_base(filas, semilla=semilla)
+    corredor, administrador = Client(), Client()
+    corredor.force_login(usuarios[0])
+    administrador.force_login(admin)
+    ids = list(CalificacionTributaria.objects.filter(usuario=usuarios[0]).values_list('id', flat=True)[:1000])
+    return SimpleNamespace(
+        filas=filas, semilla=semilla, usuarios=usuarios, admin=admin, instrumentos=instrumentos,
+        corredor=corredor, administrador=administrador, ids=ids,
+    )
+
+
+@caso
+def carga_masiva(ctx, repeticiones):
+    """Una carga por variante de archivo, cada una con un usuario nuevo (sin claves ni huellas previas)."""
+    filas = min(ctx.filas, 20_000)
+    codigos = [i.codigo for i in ctx.instrumentos[:200]]
+    resultado = {}
+    for nombre, extension, argumentos in VARIANTES_CARGA:
+        contenido = archivo_carga(filas, codigos, semilla=ctx.semilla, **argumentos)
+        tiempos = []
+        for n in range(repeticiones):
+            usuario = User.objects.create_user(f'carga_{nombre}_{n}')
+            archivo = SimpleUploadedFile(f'bench.{extension}', contenido)
+            inicio = time.perf_counter()
+            guardados, errores = procesar_carga_masiva(archivo, usuario)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+            assert guardados == filas and not errores, (nombre, guardados, errores[:3])
+        resultado[nombre] = {'ms': tiempos, 'filas': filas}
+    return resultado
+
+
+@caso
+def mantenedor(ctx, repeticiones):
+    return {
+        'corredor': {'ms': cronometrar(lambda: _get(ctx.corredor, reverse('mantenedor')), repeticiones)},
+        'administrador': {'ms': cronometrar(lambda: _get(ctx.administrador, reverse('mantenedor')), repeticiones)},
+    }
+
+
+@caso
+def detalle(ctx, repeticiones):
+    rnd = random.Random(ctx.semilla)
+    return {'json': {'ms': cronometrar(
+        lambda: _get(ctx.corredor, reverse('obtener_detalle', args=[rnd.choice(ctx.ids)])), repeticiones * 5,
+    )}}
+
+
+@caso
+def filtros(ctx, repeticiones):
+    muestra = CalificacionTributaria.objects.get(id=ctx.ids[0])
+    url = reverse('calificaciones_api')
+    casos = {
+        'rut': {'q': muestra.rut_propietario},
+        'palabra': {'q': 'eventual'},
+        'mercado': {'q_mercado': 'lima'},
+        'ejercicio_fechas': {'ejercicio': '2024', 'desde': '2024-03-01', 'hasta': '2024-03-31'},
+    }
+    return {nombre: {'ms': cronometrar(lambda p=parametros: _get(ctx.corredor, url, **p), repeticiones)}
+            for nombre, parametros in casos.items()}
+
+
+@caso
+def exportacion(ctx, repeticiones):
+    # Las filas de un corredor (~1/50 de la tabla)
+    filas = CalificacionTributaria.objects.filter(usuario=ctx.usuarios[0]).count()
+    return {formato: {'ms': cronometrar(lambda f=formato: _get(ctx.corredor, reverse('exportar', args=[f])), repeticiones),
+                      'filas': filas}
+            for formato in ('csv', 'xlsx')}
+
+
+def resumir(tiempos):
+    ordenados = sorted(tiempos)
+    return {
+        'mediana_ms': round(statistics.median(ordenados), 2),
+        'p95_ms': round(ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))], 2),
+        'min_ms': round(ordenados[0], 2),
+        'n': len(ordenados),
+    }
+
+
+def ejecutar(ctx, casos, repeticiones, al_terminar=None):
+    """Corre los casos y retorna el documento de resultados {'meta': ..., 'resultados': {'caso.variante': ...}}."""
+    resultados = {}
+    for nombre in casos:
+        for variante, medicion in CASOS[nombre](ctx, repeticiones).items():
+            clave = f'{nombre}.{variante}'
+            resultados[clave] = resumir(medicion.pop('ms'))
+            if 'filas' in medicion:
+                resultados[clave]['filas'] = medicion['filas']
+                resultados[clave]['filas_s'] = round(medicion['filas'] / (resultados[clave]['mediana_ms'] / 1000))
+            if al_terminar: al_terminar(clave, resultados[clave])
+    return {
+        'meta': {
+            'fecha': timezone.now().isoformat(timespec='seconds'), 'filas': ctx.filas, 'semilla': ctx.semilla,
+            'repeticiones': repeticiones, 'bd': connection.vendor, 'python': platform.python_version(),
+            'django': django.get_version(), 'maquina': platform.machine(),
+        },
+        'resultados': resultados,
+    }
+
+
+def comparar(actual, base, tolerancia):
+    """
+    [(clave, mediana base, mediana actual, razón, estado)] de los casos que
+    están en ambos. 'lento' si la mediana creció más que 'tolerancia' (0.1 = 10 %),
+    'rapido' si bajó en la misma proporción.
+    """
+    filas = []
+    for clave, resultado in actual['resultados'].items():
+        anterior = base['resultados'].get(clave)
+        if anterior is None: continue
+        razon = resultado['mediana_ms'] / anterior['mediana_ms'] if anterior['mediana_ms'] else 1.0
+        estado = 'lento' if razon > 1 + tolerancia else 'rapido' if razon < 1 - tolerancia else 'igual'
+        filas.append((clave, anterior['mediana_ms'], resultado['mediana_ms'], razon, estado))
+    return filas
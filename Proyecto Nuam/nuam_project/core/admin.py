@@ -1,6 +1,9 @@
 from django.contrib import admin
-from .models import Mercado, Instrumento, CalificacionTributaria
+from .models import Mercado, Instrumento, CalificacionTributaria, OperacionMasiva, ResumenCalificaciones, TrabajoCarga
 
 admin.site.register(Mercado)
 admin.site.register(Instrumento)
 admin.site.register(CalificacionTributaria)
+admin.site.register(TrabajoCarga)
+admin.site.register(ResumenCalificaciones)
+admin.site.register(OperacionMasiva)
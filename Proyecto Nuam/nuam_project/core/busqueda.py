@@ -0,0 +1,116 @@
+"""
+Búsqueda del mantenedor por RUT, instrumento, descripción, ejercicio y fechas.
+
+El texto libre se resuelve con la tabla TokenBusqueda (palabras normalizadas
+de RUT y descripción, una fila por palabra) usando rangos sobre su índice en
+vez de LIKE '%...%'. Código y nombre de instrumento se buscan en la tabla de
+instrumentos, que es chica. Los tokens se mantienen con las señales de
+core/signals.py y se reconstruyen con 'manage.py reindexar_busqueda'.
+"""
+import re
+import unicodedata
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from .models import CalificacionTributaria, Instrumento, TokenBusqueda
+
+LARGO_TOKEN = 64
+# Con más coincidencias que esto un término se considera común (ver _termino)
+MAX_IDS_TERMINO = 2000
+_RUT = re.compile(r'^[\d.]{6,}-?[\dK]$')
+_SEPARADOR = re.compile(r'[^0-9A-Z]+')
+
+
+def normalizar(texto):
+    """Mayúsculas y sin tildes: 'Dividendo Único' -> 'DIVIDENDO UNICO'."""
+    texto = unicodedata.normalize('NFKD', str(texto or ''))
+    return ''.join(c for c in texto if not unicodedata.combining(c)).upper()
+
+
+def tokenizar(texto):
+    """Palabras normalizadas del texto. Un RUT queda como un solo token sin puntos ni guion."""
+    tokens = set()
+    for palabra in normalizar(texto).split():
+        if _RUT.match(palabra):
+            tokens.add(palabra.replace('.', '').replace('-', ''))
+        else:
+            tokens.update(p for p in _SEPARADOR.split(palabra) if p)
+    return {t[:LARGO_TOKEN] for t in tokens}
+
+
+def tokens_de(calif):
+    # Las palabras de una letra no sirven para buscar y solo agrandan la tabla
+    return {t for t in tokenizar(calif.rut_propietario) | tokenizar(calif.descripcion) if len(t) > 1}
+
+
+def indexar(calificaciones, nuevas=False):
+    """Reemplaza los tokens de las calificaciones (ya guardadas). 'nuevas' evita el DELETE previo."""
+    if not nuevas:
+        TokenBusqueda.objects.filter(calificacion_id__in=[c.id for c in calificaciones]).delete()
+    TokenBusqueda.objects.bulk_create(
+        [TokenBusqueda(calificacion_id=c.id, token=t) for c in calificaciones for t in tokens_de(c)],
+        batch_size=5000,
+    )
+
+
+def _fecha(valor):
+    try: return date.fromisoformat(valor) if valor else None
+    except ValueError: return None
+
+
+def _termino(termino):
+    """
+    Q para un término: prefijo de un token de la calificación o de su instrumento.
+    Un término poco frecuente se resuelve como lista de ids (búsquedas por PK).
+    Uno común se verifica con EXISTS mientras se recorre el índice del listado,
+    que así encuentra pronto las filas de la primera ventana.
+    """
+    # token >= 'ABC' AND token < 'ABC' + U+FFFF recorre el índice como un prefijo
+    tokens = TokenBusqueda.objects.filter(token__gte=termino, token__lt=termino + '\uffff')
+    ids = list(tokens.values_list('calificacion_id', flat=True)[:MAX_IDS_TERMINO + 1])
+    if len(ids) <= MAX_IDS_TERMINO:
+        por_token = Q(id__in=ids)
+    else:
+        por_token = Q(Exists(tokens.filter(calificacion_id=OuterRef('id'))))
+    instrumentos = Instrumento.objects.filter(Q(codigo__istartswith=termino) | Q(nombre__icontains=termino))
+    return por_token | Q(instrumento_id__in=list(instrumentos.values_list('id', flat=True)))
+
+
+def buscar(qs, parametros):
+    """
+    Aplica a qs los filtros de búsqueda de un QueryDict (request.GET):
+    - q: texto libre; todos los términos deben calzar (RUT, descripción, código o nombre de instrumento)
+    - ejercicio, desde, hasta (fecha de pago, AAAA-MM-DD), q_mercado
+    Los valores inválidos se ignoran.
+    """
+    for termino in tokenizar(parametros.get('q')):
+        qs = qs.filter(_termino(termino))
+
+    ejercicio = parametros.get('ejercicio')
+    if ejercicio and ejercicio.isdigit(): qs = qs.filter(ejercicio=int(ejercicio))
+    desde, hasta = _fecha(parametros.get('desde')), _fecha(parametros.get('hasta'))
+    if desde: qs = qs.filter(fecha_pago__gte=desde)
+    if hasta: qs = qs.filter(fecha_pago__lte=hasta)
+
+    q_mercado = parametros.get('q_mercado')
+    if q_mercado: qs = qs.filter(instrumento__mercado__nombre__icontains=q_mercado)
+    return qs
+
+
+@transaction.atomic
+def reindexar_todo(tamano_lote=5000, al_avanzar=None):
+    """
+    Reconstruye la tabla de tokens completa en una transacción (las búsquedas
+    ven el índice anterior hasta el final). Retorna la cantidad de calificaciones.
+    """
+    TokenBusqueda.objects.all().delete()
+    total, ultimo = 0, 0
+    campos = CalificacionTributaria.objects.only('id', 'rut_propietario', 'descripcion')
+    while True:
+        lote = list(campos.filter(id__gt=ultimo).order_by('id')[:tamano_lote])
+        if not lote: return total
+        indexar(lote, nuevas=True)
+        total, ultimo = total + len(lote), lote[-1].id
+        if al_avanzar: al_avanzar(total)
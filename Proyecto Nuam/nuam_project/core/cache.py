@@ -0,0 +1,89 @@
+"""
+Caché en memoria del proceso para datos de referencia que cambian poco, y
+caché del JSON de detalle de cada calificación (backend de Django 'detalle',
+en memoria local o en archivos según DETALLE_CACHE en settings.py).
+Los instrumentos se invalidan con las señales de core/signals.py; el
+detalle lleva la versión en la clave.
+"""
+import threading
+import time
+
+from django.core.cache import caches
+from django.db.models.functions import Upper
+
+from .models import Instrumento
+
+# Otros procesos no reciben nuestras señales: pasado este plazo se relee la tabla igual
+TTL_INSTRUMENTOS = 300
+
+_lock = threading.Lock()
+_instrumentos = None  # (expira, lista ordenada por código, mapa por código en mayúsculas, mapa por id)
+
+def _instrumentos_vigentes():
+    global _instrumentos
+    with _lock:
+        if _instrumentos is None or _instrumentos[0] < time.monotonic():
+            lista = list(Instrumento.objects.order_by('codigo'))
+            mapa = {i.codigo.upper(): i for i in lista}
+            _instrumentos = (time.monotonic() + TTL_INSTRUMENTOS, lista, mapa, {i.id: i for i in lista})
+        return _instrumentos
+
+def invalidar_instrumentos():
+    global _instrumentos
+    with _lock:
+        _instrumentos = None
+
+def listar_instrumentos():
+    """Instrumentos ordenados por código (para el select del mantenedor)."""
+    return _instrumentos_vigentes()[1]
+
+def resolver_instrumentos(codigos):
+    """
+    Resuelve códigos de instrumento sin distinguir mayúsculas.
+    Retorna (mapa {CODIGO: Instrumento}, lista de códigos desconocidos).
+    Los códigos que no están en caché se buscan juntos en una sola consulta.
+    """
+    claves = {str(c).upper() for c in codigos}
+    en_cache = _instrumentos_vigentes()[2]
+    mapa = {c: en_cache[c] for c in claves if c in en_cache}
+
+    faltantes = claves - mapa.keys()
+    if faltantes:
+        nuevos = Instrumento.objects.annotate(codigo_mayus=Upper('codigo')).filter(codigo_mayus__in=faltantes)
+        for inst in nuevos:
+            mapa[inst.codigo_mayus] = inst
+        if len(mapa) > len(claves) - len(faltantes):
+            # Existían en la BD pero no en caché: la caché quedó vieja
+            invalidar_instrumentos()
+
+    return mapa, sorted(claves - mapa.keys())
+
+def mercados_de_instrumentos(ids):
+    """{instrumento_id: mercado_id}. Los ids que no están en caché se buscan juntos en una consulta."""
+    en_cache = _instrumentos_vigentes()[3]
+    mapa = {i: en_cache[i].mercado_id for i in ids if i in en_cache}
+    faltantes = set(ids) - mapa.keys()
+    if faltantes:
+        nuevos = dict(Instrumento.objects.filter(id__in=faltantes).values_list('id', 'mercado_id'))
+        # Existían en la BD pero no en caché: la caché quedó vieja
+        if nuevos: invalidar_instrumentos()
+        mapa.update(nuevos)
+    return mapa
+
+
+# --- DETALLE DE CALIFICACIONES ---
+# El JSON va por id y updated_at: una edición (aquí o en otro proceso, como 'procesar_cargas') cambia la
+# clave y la versión anterior queda sin uso hasta que expire, así que no hace falta invalidar
+
+def etag_detalle(id, updated_at):
+    return f'"{id}-{int(updated_at.timestamp() * 1_000_000)}"'
+
+def _clave_detalle(etag):
+    return f'detalle:{etag.strip(chr(34))}'
+
+def detalle_en_cache(etag):
+    """JSON (bytes) guardado para esa versión de la calificación, o None."""
+    return caches['detalle'].get(_clave_detalle(etag))
+
+def guardar_detalle(etag, cuerpo):
+    caches['detalle'].set(_clave_detalle(etag), cuerpo)
@@ -0,0 +1,134 @@
+"""
+Configuración del Certificado N° 70 (Anexo 3, Res. 98): secciones y factores
+del formulario del mantenedor.
+
+Se arma una sola vez al importar el módulo y es inmutable (NamedTuple y
+MappingProxyType). Cada versión rige desde un ejercicio; su 'version' es la
+clave de caché del fragmento del formulario en mantenedor.html, así que al
+cambiar textos o secciones hay que publicar una versión nueva.
+"""
+from bisect import bisect_right
+from types import MappingProxyType
+from typing import NamedTuple
+
+
+class Factor(NamedTuple):
+    id: str        # 'f08': id y name del input del formulario
+    numero: int    # 8 -> campo factor_08 del modelo
+    label: str
+    ayuda: str
+    seccion: str
+
+    @property
+    def campo(self): return f'factor_{self.numero:02d}'
+
+
+class Seccion(NamedTuple):
+    clave: str
+    titulo: str
+    color: str
+    factores: tuple
+
+
+class Certificado(NamedTuple):
+    version: str
+    desde_ejercicio: int
+    secciones: tuple
+    factores: tuple                # F08..F37 en orden
+    por_factor: MappingProxyType   # 'f08' -> Factor
+    por_seccion: MappingProxyType  # clave -> Seccion
+
+
+def _armar(version, desde_ejercicio, secciones):
+    """Valida que cada factor F08..F37 aparezca exactamente una vez y precalcula los índices."""
+    armadas = tuple(
+        Seccion(clave, titulo, color, tuple(Factor(id_, int(id_[1:]), label, ayuda, clave) for id_, label, ayuda in factores))
+        for clave, titulo, color, factores in secciones
+    )
+    ids = [f.id for s in armadas for f in s.factores]
+    esperados = [f'f{i:02d}' for i in range(8, 38)]
+    if sorted(ids) != esperados:
+        repetidos = sorted({i for i in ids if ids.count(i) > 1})
+        faltantes = sorted(set(esperados) - set(ids))
+        raise ValueError(f"Certificado {version}: factores repetidos {repetidos}, faltantes {faltantes}")
+    por_factor = {f.id: f for s in armadas for f in s.factores}
+    return Certificado(
+        version, desde_ejercicio, armadas, tuple(por_factor[i] for i in esperados),
+        MappingProxyType(por_factor),
+        MappingProxyType({s.clave: s for s in armadas}),
+    )
+
+
+# Incluye F22 (Tasa Adicional) y F34, F35, F36 (Retiros en Exceso).
+# F31 va solo en créditos históricos (antes aparecía también en la sección 3).
+CERTIFICADO_70_2025 = _armar('70-2025.1', 2025, (
+    # ----------------------------------------------------------------------
+    # 1. RENTAS AFECTAS (Base Imponible)
+    # ----------------------------------------------------------------------
+    ("SECCION_A_RENTAS_AFECTAS", "1. RENTAS AFECTAS A IMPUESTOS", "primary", (
+        ("f08", "F08 - CON CRÉDITO POR IDPC GENERADOS A CONTAR DEL 01.01.2017", "Monto base para grandes empresas (27%)."),
+        ("f09", "F09 - CON CRÉDITO POR IDPC  ACUMULADOS  HASTA EL 31.12.2016", "Monto base Pyme o Histórico."),
+        ("f10", "F10 - CON DERECHO A CRÉDITO POR PAGO DE IDPC VOLUNTARIO", "Crédito pagado voluntariamente."),
+        ("f11", "F11 - SIN DERECHO A CRÉDITO", "Renta afecta pura."),
+    )),
+
+    # ----------------------------------------------------------------------
+    # 2. RENTAS EXENTAS / INR
+    # ----------------------------------------------------------------------
+    ("SECCION_A_RENTAS_EXENTAS", "2. RENTAS EXENTAS / TRIBUTACIÓN CUMPLIDA", "success", (
+        ("f12", "F12 - RENTAS PROVENIENTES DEL REGISTRO RAP Y DIFERENCIA INICIAL DE SOCIEDAD ACOGIDA AL EX ART. 14 TER A) LIR", "Deuda pagada (2017-2019)."),
+        ("f13", "F13 - OTRAS RENTAS PERCIBIDAS SIN PRIORIDAD EN SU ORDEN DE IMPUTACIÓN", "Otras rentas cumplidas."),
+        ("f14", "F14 - EXCESO DISTRIBUCIONES DESPROPORCIONADAS (N°9 ART.14 A)", "Distribución desigual (Art 14A N°9)."),
+        ("f15", "F15 - UTILIDADES AFECTADAS CON IMPUESTO SUSTITUTIVO AL FUT (ISFUT) LEY N°20.780", "FUT Histórico sustitutivo."),
+        ("f16", "F16 - RENTAS GENERADAS HASTA EL 31.12.1983 Y/O UTILIDADES AFECTADAS CON IMPUESTO SUSTITUTIVO AL FUT (ISFUT) LEY N°21.21", "ISFUT Nuevo (Caso 3)."),
+        ("f17", "F17 - RENTAS EXENTAS DE IMPUESTO GLOBAL COMPLEMENTARIO (IGC) (ARTÍCULO 11, LEY 18.401), AFECTAS A IMPUESTO ADICIONAL", "Exentas por ley."),
+        ("f18", "F18 - RENTAS EXENTAS DE IMPUESTO GLOBAL COMPLEMENTARIO (IGC) Y/O IMPUESTO ADICIONAL (IA)", "Leyes regionales."),
+        ("f19", "F19 - INGRESOS NO CONSTITUTIVOS DE RENTA", "Devolución de Capital."),
+    )),
+
+    # ----------------------------------------------------------------------
+    # 3. CRÉDITOS (SAC y OTROS)
+    # ----------------------------------------------------------------------
+    ("SECCION_4_CREDITOS", "3. CRÉDITOS (Desde 2017)", "warning", (
+        ("f20", "F20 - No Suj. Restitución sin Derecho a Devolución (Hasta 2019)", "Saldo antiguo SAC."),
+        ("f21", "F21 - No Suj. Restitución con Derecho a Devolución (Hasta 2019)", "Saldo antiguo SAC."),
+        ("f22", "F22 - No Suj. Restitución sin Derecho a Devolución (Desde 2020)", "Crédito Pyme (100%)."),
+        ("f23", "F23 - No Suj. Restitución con Derecho a Devolución (Desde 2020)", "Crédito Pyme (100%)."),
+        ("f24", "F24 - Sujetos a Restitución (14 A) sin Derecho a Devolución", "Crédito 27% (Devuelve 35%)."),
+        ("f25", "F25 - Sujetos a Restitución (14 A) con Derecho a Devolución", "Crédito 27% (Devuelve 35%)."),
+        ("f26", "F26 - Sujetos a Restitución (Exentas)", "Asociado a rentas exentas."),
+        ("f27", "F27 - Sujetos a Restitución (Exentas)", "Asociado a rentas exentas."),
+        ("f28", "F28 - Crédito IPE", "Impuesto Extranjero."),
+    )),
+
+    # ----------------------------------------------------------------------
+    # 4. CRÉDITOS HISTÓRICOS (STUT)
+    # ----------------------------------------------------------------------
+    ("SECCION_4_STUT", "4. CRÉDITOS HISTÓRICOS (Hasta 2016)", "secondary", (
+        ("f29", "F29 - Asociado a  Rentas Afectas sin Derecho a Devolución", "Solo para pago impuestos."),
+        ("f30", "F30 - Asociado a  Rentas Afectas con Derecho a Devolución", "Se devuelve en efectivo."),
+        ("f31", "F31 - Asociado a  Rentas Exentas sin Derecho a Devolución", "Solo para pago impuestos."),
+        ("f32", "F32 - Asociado a  Rentas Exentas con Derecho a Devolución", "Se devuelve en efectivo."),
+        ("f33", "F33 - Crédito IPE", "Impuesto Extranjero."),
+        ("f34", "F34 - Credito por Impuesto Tasa Adicional (Ex Art.21)", "Impuesto castigo pagado por la empresa."),
+    )),
+
+    # ----------------------------------------------------------------------
+    # 5. SALDOS Y CONTROL (F35, F36, F37)
+    # ----------------------------------------------------------------------
+    ("SECCION_SALDOS", "5. INFORMACIÓN DE SALDOS Y EXCESOS", "info", (
+        ("f35", "F35 - Tasa Efec. Crédito FUT (TEF)", "Tasa Efectiva del Crédito del FUT. Se usa para asignar créditos antiguos."),
+        ("f36", "F36 - Tasa Efec. Crédito FUNT (TEX)", "Tasa Efectiva del Crédito del FUNT (Ingresos No Renta)."),
+        ("f37", "F37 - Devolución Capital (Art 17 N°7)", "Cantidades que NO constituyen renta (Devolución de capital real)."),
+    )),
+))
+
+# Versiones ordenadas por ejercicio de inicio
+VERSIONES = (CERTIFICADO_70_2025,)
+_INICIOS = [c.desde_ejercicio for c in VERSIONES]
+
+
+def certificado_para(ejercicio=None):
+    """Versión vigente para el ejercicio (la más reciente si no se indica; la más antigua si es anterior a todas)."""
+    if ejercicio is None: return VERSIONES[-1]
+    return VERSIONES[max(0, bisect_right(_INICIOS, int(ejercicio)) - 1)]
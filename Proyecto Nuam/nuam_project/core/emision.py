@@ -0,0 +1,177 @@
+"""
+Emisión en lote del Certificado N° 70: un HTML por RUT propietario y ejercicio,
+empaquetados en archivos ZIP en disco. Lo usa 'manage.py emitir_certificados'.
+
+Las calificaciones se leen en una sola consulta ordenada por (RUT, ejercicio)
+que se recorre en streaming y se agrupa al vuelo. El render (plantilla
+compilada una vez por proceso) se reparte en un ProcessPoolExecutor; los
+procesos no tocan la BD. La salida va en partes de N certificados
+(certificados_0001.zip, ...): cada parte se escribe como .tmp y se renombra
+al cerrarla, con el último (RUT, ejercicio) en su comentario, así una emisión
+cortada continúa desde la última parte completa.
+"""
+import json
+import re
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, ROUND_HALF_UP
+from itertools import groupby, islice
+from pathlib import Path
+from typing import NamedTuple
+
+import django
+from django.apps import apps
+from django.db.models import Q
+from django.template.loader import get_template
+
+from .certificado import certificado_para
+from .factores import CAMPOS_FACTORES, NUMEROS_FACTORES
+from .models import CalificacionTributaria
+
+PLANTILLA = 'core/certificado_70.html'
+CERTIFICADOS_POR_PARTE = 1000
+# Certificados por tarea que se envía a un proceso
+CERTIFICADOS_POR_TAREA = 50
+CAMPOS = (
+    'rut_propietario', 'ejercicio', 'fecha_pago', 'instrumento__codigo', 'instrumento__nombre', 'descripcion',
+    'monto_historico', 'monto_total', *CAMPOS_FACTORES,
+)
+UN_PESO = Decimal('1')
+
+_plantilla = None
+
+
+class ResultadoEmision(NamedTuple):
+    certificados: int
+    partes: int
+    segundos: float
+    tiempos: dict  # etapa -> segundos: 'consulta', 'render' (suma de los procesos), 'zip'
+
+
+def _pesos(valor):
+    return f"{valor.quantize(UN_PESO, rounding=ROUND_HALF_UP):,.0f}".replace(',', '.')
+
+
+def nombre_archivo(rut, ejercicio):
+    return f"{ejercicio}/certificado_70_{re.sub(r'[^0-9A-Za-z-]', '', rut) or 'sin-rut'}.html"
+
+
+def contexto_certificado(rut, ejercicio, filas):
+    """
+    Datos de un certificado a partir de sus filas (CAMPOS sin RUT ni ejercicio).
+    El monto de cada columna es monto actualizado * factor, en pesos; las
+    secciones sin montos no se muestran.
+    """
+    certificado = certificado_para(ejercicio)
+    montos = [[(fila[5] * factor).quantize(UN_PESO, rounding=ROUND_HALF_UP) for factor in fila[6:]] for fila in filas]
+    secciones = []
+    for seccion in certificado.secciones:
+        columnas = [f.numero - NUMEROS_FACTORES.start for f in seccion.factores]
+        totales = [sum((m[i] for m in montos), Decimal('0')) for i in columnas]
+        if not any(totales): continue
+        secciones.append({
+            'titulo': seccion.titulo,
+            'factores': seccion.factores,
+            'filas': [(f[0], f[1], [_pesos(m[i]) for i in columnas]) for f, m in zip(filas, montos)],
+            'totales': [_pesos(t) for t in totales],
+        })
+    return {
+        'rut': rut, 'ejercicio': ejercicio, 'version': certificado.version, 'secciones': secciones,
+        'dividendos': [(f[0], f[1], f[2], f[3], _pesos(f[4]), _pesos(f[5])) for f in filas],
+        'monto_total': _pesos(sum((f[5] for f in filas), Decimal('0'))),
+    }
+
+
+def _iniciar_proceso():
+    # Con 'spawn' (macOS, Windows) el proceso parte sin Django inicializado
+    if not apps.ready: django.setup()
+
+
+def renderizar(tarea):
+    """[(rut, ejercicio, filas)] -> ([(rut, ejercicio, nombre, html)], segundos). Corre en los procesos; no usa la BD."""
+    global _plantilla
+    inicio = time.perf_counter()
+    if _plantilla is None: _plantilla = get_template(PLANTILLA)
+    salida = [
+        (rut, ejercicio, nombre_archivo(rut, ejercicio), _plantilla.render(contexto_certificado(rut, ejercicio, filas)))
+        for rut, ejercicio, filas in tarea
+    ]
+    return salida, time.perf_counter() - inicio
+
+
+def _tareas(qs, tiempos):
+    """Grupos (rut, ejercicio, filas) de una consulta ordenada, en tareas de CERTIFICADOS_POR_TAREA."""
+    filas = qs.order_by('rut_propietario', 'ejercicio', 'fecha_pago', 'id').values_list(*CAMPOS).iterator(chunk_size=2000)
+    grupos = ((rut, ej, [f[2:] for f in grupo]) for (rut, ej), grupo in groupby(filas, key=lambda f: (f[0], f[1])))
+    while True:
+        inicio = time.perf_counter()
+        tarea = list(islice(grupos, CERTIFICADOS_POR_TAREA))
+        tiempos['consulta'] += time.perf_counter() - inicio
+        if not tarea: return
+        yield tarea
+
+
+def _renderizadas(tareas, procesos):
+    """Igual que _bloques_validados de la carga masiva: en orden y con a lo más 2 tareas por proceso en vuelo."""
+    if procesos <= 1:
+        yield from map(renderizar, tareas)
+        return
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso) as pool:
+        en_vuelo = deque()
+        for tarea in tareas:
+            en_vuelo.append(pool.submit(renderizar, tarea))
+            if len(en_vuelo) >= 2 * procesos: yield en_vuelo.popleft().result()
+        while en_vuelo:
+            yield en_vuelo.popleft().result()
+
+
+def emitir_certificados(destino, ejercicio=None, usuario=None, procesos=1, por_parte=CERTIFICADOS_POR_PARTE, al_avanzar=None):
+    """
+    Emite los certificados de las calificaciones (opcionalmente de un ejercicio
+    y un usuario, por username) en la carpeta 'destino'. Si ya hay partes de
+    una emisión anterior con los mismos filtros se continúa después de la última.
+    al_avanzar(certificados, partes) se llama al cerrar cada parte.
+    """
+    inicio = time.perf_counter()
+    destino = Path(destino)
+    destino.mkdir(parents=True, exist_ok=True)
+    filtros = {'ejercicio': ejercicio, 'usuario': usuario}
+
+    qs = CalificacionTributaria.objects.all()
+    if ejercicio: qs = qs.filter(ejercicio=ejercicio)
+    if usuario: qs = qs.filter(usuario__username=usuario)
+    partes = sorted(destino.glob('certificados_*.zip'))
+    if partes:
+        with zipfile.ZipFile(partes[-1]) as ultima:
+            anterior = json.loads(ultima.comment)
+        if anterior['filtros'] != filtros:
+            raise ValueError(f"{destino} tiene certificados de otra emisión ({anterior['filtros']})")
+        rut, ej = anterior['ultimo']
+        qs = qs.filter(Q(rut_propietario__gt=rut) | Q(rut_propietario=rut, ejercicio__gt=ej))
+
+    tiempos = {'consulta': 0.0, 'render': 0.0, 'zip': 0.0}
+    certificados, numero, parte, en_parte, ultimo = 0, len(partes), None, 0, None
+
+    def cerrar():
+        parte.comment = json.dumps({'filtros': filtros, 'ultimo': ultimo}).encode()
+        parte.close()
+        Path(parte.filename).rename(parte.filename[:-len('.tmp')])
+        if al_avanzar: al_avanzar(certificados, numero)
+
+    for salida, segundos in _renderizadas(_tareas(qs, tiempos), procesos):
+        tiempos['render'] += segundos
+        t = time.perf_counter()
+        for rut, ej, nombre, html in salida:
+            if parte is None:
+                numero += 1
+                parte, en_parte = zipfile.ZipFile(destino / f'certificados_{numero:04d}.zip.tmp', 'w', zipfile.ZIP_DEFLATED), 0
+            parte.writestr(nombre, html)
+            certificados, en_parte, ultimo = certificados + 1, en_parte + 1, (rut, ej)
+            if en_parte >= por_parte:
+                cerrar()
+                parte = None
+        tiempos['zip'] += time.perf_counter() - t
+    if parte is not None: cerrar()
+    return ResultadoEmision(certificados, numero - len(partes), time.perf_counter() - inicio, tiempos)
@@ -0,0 +1,98 @@
+"""
+Exportación de calificaciones a CSV, XLSX y Parquet (este último solo si está
+instalado pyarrow).
+
+Las filas se leen por lotes con values_list(...).iterator(chunk_size) y se
+escriben a medida que llegan, así la memoria no crece con la cantidad de filas.
+El CSV sale directo a la respuesta; XLSX y Parquet se cierran al final, por lo
+que se escriben en un archivo temporal en disco (openpyxl en modo write_only)
+y después se envían. Los encabezados son los que reconoce la carga masiva:
+un CSV o XLSX exportado se puede volver a cargar tal cual.
+"""
+import csv
+from itertools import islice
+
+import openpyxl
+
+from .factores import CAMPOS_FACTORES, NUMEROS_FACTORES
+
+TAMANO_LOTE = 2000
+
+# (encabezado en el archivo, columna de values_list)
+COLUMNAS = (
+    ('INSTRUMENTO', 'instrumento__codigo'),
+    ('RUT PROPIETARIO', 'rut_propietario'),
+    ('EJERCICIO', 'ejercicio'),
+    ('FECHA PAGO', 'fecha_pago'),
+    ('SECUENCIA', 'secuencia'),
+    ('DESCRIPCION', 'descripcion'),
+    ('ISFUT', 'es_isfut'),
+    ('MONTO HISTORICO', 'monto_historico'),
+    ('FACTOR ACTUALIZACION', 'factor_actualizacion'),
+    ('MONTO TOTAL', 'monto_total'),
+    *((f'F{i:02d}', campo) for i, campo in zip(NUMEROS_FACTORES, CAMPOS_FACTORES)),
+)
+ENCABEZADOS = [encabezado for encabezado, _ in COLUMNAS]
+
+
+def lotes(qs, tamano_lote=TAMANO_LOTE):
+    """Filas de qs (tuplas en el orden de COLUMNAS) en listas de hasta tamano_lote."""
+    filas = qs.values_list(*(columna for _, columna in COLUMNAS)).iterator(chunk_size=tamano_lote)
+    while lote := list(islice(filas, tamano_lote)):
+        yield lote
+
+
+def _celdas(fila):
+    # Fecha, ISFUT y descripción en el formato que lee la carga masiva; los montos quedan como vienen
+    instrumento, rut, ejercicio, fecha, secuencia, descripcion, isfut, *montos = fila
+    return [instrumento, rut, ejercicio, fecha, secuencia, descripcion or '', 'SI' if isfut else 'NO', *montos]
+
+
+class _Eco:
+    """Archivo falso para csv.writer: writerow retorna el texto en vez de guardarlo."""
+    def write(self, texto): return texto
+
+
+def exportar_csv(qs, tamano_lote=TAMANO_LOTE):
+    """Genera el CSV en pedazos de bytes, uno por lote (UTF-8 con BOM para Excel y separador ';')."""
+    escritor = csv.writer(_Eco(), delimiter=';')
+    yield ('\ufeff' + escritor.writerow(ENCABEZADOS)).encode('utf-8')
+    for lote in lotes(qs, tamano_lote):
+        yield ''.join(
+            escritor.writerow([v.isoformat() if hasattr(v, 'isoformat') else v for v in _celdas(fila)]) for fila in lote
+        ).encode('utf-8')
+
+
+def exportar_xlsx(qs, destino, tamano_lote=TAMANO_LOTE):
+    """Escribe el XLSX en 'destino' (ruta o archivo binario) con openpyxl en modo write_only."""
+    libro = openpyxl.Workbook(write_only=True)
+    hoja = libro.create_sheet('Calificaciones')
+    hoja.append(ENCABEZADOS)
+    for lote in lotes(qs, tamano_lote):
+        for fila in lote: hoja.append(_celdas(fila))
+    libro.save(destino)
+
+
+def parquet_disponible():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def exportar_parquet(qs, destino, tamano_lote=TAMANO_LOTE):
+    """Escribe un Parquet en 'destino', un row group por lote, con montos y factores como decimal128."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tipos = {
+        'ejercicio': pa.int32(), 'secuencia': pa.int32(), 'fecha_pago': pa.date32(), 'es_isfut': pa.bool_(),
+        'monto_historico': pa.decimal128(20, 2), 'monto_total': pa.decimal128(20, 2),
+        'factor_actualizacion': pa.decimal128(10, 6), **{c: pa.decimal128(15, 6) for c in CAMPOS_FACTORES},
+    }
+    esquema = pa.schema([(encabezado, tipos.get(columna, pa.string())) for encabezado, columna in COLUMNAS])
+    with pq.ParquetWriter(destino, esquema) as escritor:
+        for lote in lotes(qs, tamano_lote):
+            columnas = [pa.array(valores, type=tipo) for valores, tipo in zip(zip(*lote), esquema.types)]
+            escritor.write_table(pa.Table.from_arrays(columnas, schema=esquema))
@@ -0,0 +1,145 @@
+"""
+Cálculos de montos y factores de una calificación, sin tocar la BD.
+Los usan el modelo, el mantenedor y la validación de la carga masiva
+(por eso este módulo tampoco importa Django).
+
+Para lotes, MatrizFactores guarda los factores F08..F37 como enteros int64
+escalados por 10^6 (valor exacto con 6 decimales) y calcular_factores_lote
+hace el mismo cálculo que calcular_factores sobre todas las filas a la vez.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+
+DOS_DECIMALES = Decimal('0.01')
+SEIS_DECIMALES = Decimal('0.000001')
+
+NUMEROS_FACTORES = range(8, 38)
+CAMPOS_FACTORES = tuple(f'factor_{i:02d}' for i in NUMEROS_FACTORES)
+ESCALA = 10 ** 6
+# Centavos máximos para que 2 * monto * ESCALA + total quepa en int64 (~46 mil millones de pesos)
+_MAX_CENTAVOS = (2 ** 63 - 1) // (2 * ESCALA + 1)
+# Distancia relativa a un empate (x.xxxxxx5) bajo la cual se recalcula con Decimal:
+# la división Decimal redondea a 28 dígitos antes del quantize y cerca del empate
+# ese primer redondeo puede cambiar el resultado
+_CERCA_DE_EMPATE = 1e-6
+_MAX_FACTOR = 2 ** 63 - 1
+
+
+def calcular_monto_total(monto_historico, factor_actualizacion, actual=Decimal('0.00')):
+    """
+    Monto actualizado = histórico * factor, exacto en pesos (2 decimales).
+    Si falta el histórico o el factor se conserva el monto 'actual'.
+    """
+    if monto_historico and factor_actualizacion:
+        return (monto_historico * factor_actualizacion).quantize(DOS_DECIMALES, rounding=ROUND_HALF_UP)
+    return actual
+
+
+def calcular_factores(montos, monto_total):
+    """
+    Convierte los montos ingresados por columna (F08..F37) en factores sobre
+    el monto total, con 6 decimales. Con monto total 0 todos quedan en 0.
+    """
+    if monto_total > 0:
+        return [(m / monto_total).quantize(SEIS_DECIMALES, rounding=ROUND_HALF_UP) for m in montos]
+    return [Decimal('0.000000')] * len(montos)
+
+
+def a_entero(valor, escala=ESCALA):
+    """Decimal -> entero escalado (redondeo ROUND_HALF_UP si trae más decimales)."""
+    return int((Decimal(valor) * escala).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+class MatrizFactores:
+    """
+    Factores F08..F37 de varias calificaciones: una fila por calificación y
+    una columna por factor, en enteros int64 escalados por 10^6.
+    """
+    __slots__ = ('valores', 'ids')
+
+    def __init__(self, valores, ids=()):
+        self.valores = np.asarray(valores, dtype=np.int64).reshape(-1, len(CAMPOS_FACTORES))
+        self.ids = tuple(ids)
+
+    @classmethod
+    def desde_decimales(cls, filas, ids=()):
+        return cls([[a_entero(v) for v in fila] for fila in filas], ids)
+
+    @classmethod
+    def desde_objetos(cls, objetos):
+        objetos = list(objetos)
+        return cls.desde_decimales(([getattr(o, c) for c in CAMPOS_FACTORES] for o in objetos), [o.id for o in objetos])
+
+    @classmethod
+    def desde_queryset(cls, qs):
+        """Solo lee id y los 30 factores (values_list, sin instanciar modelos)."""
+        filas = list(qs.values_list('id', *CAMPOS_FACTORES))
+        return cls.desde_decimales((f[1:] for f in filas), [f[0] for f in filas])
+
+    def __len__(self): return len(self.valores)
+
+    def columna(self, numero):
+        """Vista (sin copia) de un factor para todas las filas: columna(8) -> F08."""
+        return self.valores[:, numero - NUMEROS_FACTORES.start]
+
+    def fila(self, i):
+        """Vista (sin copia) de los 30 factores de una fila."""
+        return self.valores[i]
+
+    def decimales(self, i):
+        return [Decimal(int(v)).scaleb(-6) for v in self.valores[i]]
+
+    def textos(self, i, separador='.'):
+        """Factores de la fila con 6 decimales exactos: 500000 -> '0.500000'."""
+        return [f"{'-' if v < 0 else ''}{abs(v) // ESCALA}{separador}{abs(v) % ESCALA:06d}" for v in self.valores[i].tolist()]
+
+    def asignar(self, i, obj):
+        """Copia los factores de la fila i a los campos factor_XX del objeto."""
+        for campo, valor in zip(CAMPOS_FACTORES, self.decimales(i)):
+            setattr(obj, campo, valor)
+
+
+def _centavos(valor):
+    """Monto (Decimal o int) en centavos enteros, o None si tiene más de 2 decimales o no cabe en int64."""
+    numerador, denominador = valor.as_integer_ratio()
+    if 100 % denominador: return None
+    centavos = numerador * (100 // denominador)
+    return centavos if abs(centavos) <= _MAX_CENTAVOS else None
+
+
+def calcular_factores_lote(montos, montos_totales):
+    """
+    calcular_factores para muchas filas: 'montos' son filas de 30 montos y
+    'montos_totales' un total por fila. El resultado (MatrizFactores) es
+    idéntico al de calcular_factores fila por fila: los montos en centavos
+    se dividen en enteros con redondeo ROUND_HALF_UP, y las filas que no
+    caben en int64 o los factores cerca de un empate se calculan con Decimal.
+    """
+    montos, montos_totales = [list(f) for f in montos], list(montos_totales)
+    n = len(montos)
+    m = np.zeros((n, len(CAMPOS_FACTORES)), dtype=np.int64)
+    t = np.zeros((n, 1), dtype=np.int64)
+    con_decimal = np.zeros(n, dtype=bool)
+    for i, (fila, total) in enumerate(zip(montos, montos_totales)):
+        centavos = [_centavos(v) for v in fila]
+        total_centavos = _centavos(total)
+        if total_centavos is None or None in centavos:
+            con_decimal[i] = True
+        else:
+            m[i], t[i] = centavos, total_centavos
+
+    # factor * 10^6 = redondeo(m * 10^6 / t) = floor((2|m| * 10^6 + t) / 2t), con el signo de m
+    positivo = (t > 0) & ~con_decimal[:, None]
+    divisor = np.where(positivo, 2 * t, 1)
+    cociente, resto = np.divmod(2 * np.abs(m) * ESCALA + t, divisor)
+    resultado = np.where(positivo, np.sign(m) * cociente, 0)
+
+    # En el empate exacto el resto es 0; cerca de él, el resto queda cerca de 0 o del divisor
+    cerca = positivo & (np.minimum(resto, divisor - resto) < _CERCA_DE_EMPATE * divisor)
+    for i in np.flatnonzero(con_decimal | cerca.any(axis=1)):
+        fila = [a_entero(f) for f in calcular_factores(montos[i], montos_totales[i])]
+        if max(map(abs, fila)) > _MAX_FACTOR:
+            raise ValueError(f"Fila {i}: factor fuera de rango para int64")
+        resultado[i] = fila
+    return MatrizFactores(resultado)
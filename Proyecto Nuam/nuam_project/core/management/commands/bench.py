@@ -0,0 +1,67 @@
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from benchmarks.datos import filas_de
+from benchmarks.suite import CASOS, comparar, ejecutar, preparar
+
+
+class Command(BaseCommand):
+    help = ("Corre la suite de benchmarks (benchmarks/suite.py) sobre una base de prueba con datos sintéticos "
+            "y escribe los resultados en JSON; con --comparar los contrasta con una línea base.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', default='10k', help="Calificaciones en la base: 10k, 100k, 1m o un número.")
+        parser.add_argument('--casos', nargs='+', choices=sorted(CASOS), default=list(CASOS),
+                            help="Casos a correr (por defecto todos).")
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--salida', help="Archivo JSON donde guardar los resultados (por defecto solo se muestran).")
+        parser.add_argument('--comparar', help="JSON de una corrida anterior (línea base).")
+        parser.add_argument('--tolerancia', type=float, default=0.10,
+                            help="Aumento de la mediana aceptado antes de marcar un caso como más lento (0.10 = 10 %%).")
+
+    def handle(self, *args, **options):
+        base = None
+        if options['comparar']:
+            try:
+                base = json.loads(Path(options['comparar']).read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f"No se pudo leer la línea base: {e}")
+        filas = filas_de(options['filas'])
+
+        nombre_db = connection.creation.create_test_db(verbosity=0)
+        # Sin DEBUG (no guarda cada SQL en memoria) y con el host del Client de pruebas
+        try:
+            with override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver']):
+                inicio = time.monotonic()
+                ctx = preparar(filas, semilla=options['semilla'])
+                self.stdout.write(f"{filas:,} calificaciones ({connection.vendor}) en {time.monotonic() - inicio:.1f}s")
+                documento = ejecutar(ctx, options['casos'], options['repeticiones'], al_terminar=lambda clave, r: self.stdout.write(
+                    f"  {clave:<32} mediana {r['mediana_ms']:10.1f} ms  p95 {r['p95_ms']:10.1f} ms"
+                    + (f"  {r['filas_s']:,} filas/s" if 'filas_s' in r else '')
+                ))
+        finally:
+            connection.creation.destroy_test_db(nombre_db, verbosity=0)
+
+        if options['salida']:
+            Path(options['salida']).write_text(json.dumps(documento, indent=2, ensure_ascii=False))
+            self.stdout.write(f"Resultados en {options['salida']}")
+        else:
+            self.stdout.write(json.dumps(documento, indent=2, ensure_ascii=False))
+
+        if base is None: return
+        if base['meta'].get('filas') != filas:
+            self.stdout.write(self.style.WARNING(f"La línea base es de {base['meta'].get('filas'):,} filas, no {filas:,}"))
+        lentos = 0
+        for clave, antes, ahora, razon, estado in comparar(documento, base, options['tolerancia']):
+            estilo = {'lento': self.style.ERROR, 'rapido': self.style.SUCCESS}.get(estado, str)
+            self.stdout.write(estilo(f"  {clave:<32} {antes:10.1f} -> {ahora:10.1f} ms  x{razon:5.2f}  {estado}"))
+            lentos += estado == 'lento'
+        if lentos:
+            raise CommandError(f"{lentos} casos más lentos que la línea base (tolerancia {options['tolerancia']:.0%})")
+        self.stdout.write(self.style.SUCCESS("Sin regresiones respecto de la línea base"))
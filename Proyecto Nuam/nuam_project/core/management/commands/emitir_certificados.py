@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.emision import CERTIFICADOS_POR_PARTE, emitir_certificados
+
+
+class Command(BaseCommand):
+    help = "Emite el Certificado N° 70 (HTML) por RUT propietario y ejercicio, en partes ZIP dentro de una carpeta."
+
+    def add_arguments(self, parser):
+        parser.add_argument('destino', help="Carpeta de salida. Si ya tiene partes, se continúa desde la última.")
+        parser.add_argument('--ejercicio', type=int, help="Solo este ejercicio.")
+        parser.add_argument('--usuario', help="Solo calificaciones de este usuario (username).")
+        parser.add_argument('--procesos', type=int, default=1,
+                            help="Procesos para renderizar (por defecto 1).")
+        parser.add_argument('--por-parte', type=int, default=CERTIFICADOS_POR_PARTE,
+                            help=f"Certificados por archivo ZIP (por defecto {CERTIFICADOS_POR_PARTE}).")
+
+    def handle(self, *args, **options):
+        try:
+            r = emitir_certificados(
+                options['destino'], ejercicio=options['ejercicio'], usuario=options['usuario'],
+                procesos=options['procesos'], por_parte=options['por_parte'],
+                al_avanzar=lambda n, parte: self.stdout.write(f"  parte {parte:04d} cerrada ({n} certificados)"),
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        etapas = ', '.join(f"{etapa} {segundos:.1f}s" for etapa, segundos in r.tiempos.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"{r.certificados} certificados en {r.partes} partes, {r.segundos:.1f}s "
+            f"({r.certificados / max(r.segundos, 1e-9):,.0f}/s; {etapas})"
+        ))
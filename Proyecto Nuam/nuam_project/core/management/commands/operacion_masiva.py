@@ -0,0 +1,53 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core.operaciones import OPERACIONES, aplicar
+from core.recalculo import filtrar
+
+
+class Command(BaseCommand):
+    help = ("Elimina, reasigna o cambia el ejercicio o el factor de actualización de muchas calificaciones "
+            "por lotes, dejando un registro OperacionMasiva.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('operacion', choices=OPERACIONES)
+        parser.add_argument('--valor', help="Username (reasignar), ejercicio o factor (ej. 1,052300) nuevo.")
+        parser.add_argument('--ids', type=int, nargs='+', help="Solo estas calificaciones.")
+        parser.add_argument('--ejercicio', type=int, action='append',
+                            help="Solo este ejercicio (se puede repetir).")
+        parser.add_argument('--mercado', help="Solo instrumentos de este mercado (código, ej. BCS).")
+        parser.add_argument('--usuario', help="Solo calificaciones de este usuario (username).")
+        parser.add_argument('--autor', help="Username que queda como autor en el registro.")
+        parser.add_argument('--lote', type=int, default=2000,
+                            help="Calificaciones por lote (por defecto 2000).")
+        parser.add_argument('--simular', action='store_true',
+                            help="Cuenta las filas que cambiarían sin escribir nada.")
+
+    def handle(self, *args, **options):
+        filtros = {'ejercicios': options['ejercicio'], 'mercado': options['mercado'], 'usuario': options['usuario']}
+        qs = filtrar(**filtros)
+        if options['ids']:
+            qs = qs.filter(id__in=options['ids'])
+            filtros['ids'] = options['ids']
+        filtros = {k: v for k, v in filtros.items() if v}
+        if not filtros:
+            raise CommandError("Indique --ids o al menos un filtro (--ejercicio, --mercado, --usuario).")
+        autor = None
+        if options['autor']:
+            autor = User.objects.filter(username=options['autor']).first()
+            if autor is None: raise CommandError(f"No existe el usuario '{options['autor']}'")
+
+        try:
+            r = aplicar(
+                options['operacion'], qs, valor=options['valor'], autor=autor, filtros=filtros,
+                tamano_lote=options['lote'], simular=options['simular'],
+                al_avanzar=lambda r: self.stdout.write(f"  {r.revisadas} revisadas, {r.afectadas} afectadas (id {r.ultimo_id})"),
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if r.estado == 'fallido':
+            raise CommandError(f"Operación #{r.id}: {r.afectadas} filas afectadas antes del error. {r.error}")
+        verbo = "cambiarían" if options['simular'] else "afectadas"
+        sufijo = "" if options['simular'] else f" (operación #{r.id})"
+        self.stdout.write(self.style.SUCCESS(f"{r.revisadas} revisadas, {r.afectadas} {verbo}{sufijo}"))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.trabajos import ejecutar_trabajo, tomar_siguiente_trabajo
+
+
+class Command(BaseCommand):
+    help = "Worker de cargas masivas: procesa los trabajos pendientes de TrabajoCarga."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true',
+                            help="Procesa lo que esté pendiente y termina.")
+        parser.add_argument('--intervalo', type=float, default=2.0,
+                            help="Segundos de espera cuando no hay trabajos (por defecto 2).")
+        parser.add_argument('--procesos', type=int, default=None,
+                            help="Procesos para validar cada carga (por defecto CARGA_MASIVA_PROCESOS).")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Esperando cargas masivas...")
+        while True:
+            trabajo = tomar_siguiente_trabajo()
+            if trabajo is None:
+                if options['una_vez']: return
+                time.sleep(options['intervalo'])
+                continue
+
+            inicio = time.monotonic()
+            trabajo = ejecutar_trabajo(trabajo, procesos=options['procesos'])
+            self.stdout.write(
+                f"Carga #{trabajo.id} {trabajo.estado}: {trabajo.guardados} guardados, "
+                f"{trabajo.cantidad_errores} errores ({time.monotonic() - inicio:.1f}s)"
+            )
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.db.models import Count, Max
+
+from core.resumen import reconciliar
+
+# Clave natural de la restricción calif_clave_natural (migración 0012); sin fecha de pago no aplica
+CLAVE = ('usuario_id', 'rut_propietario', 'instrumento_id', 'ejercicio', 'fecha_pago', 'secuencia')
+# Claves repetidas que se muestran en detalle
+MAX_DETALLE = 50
+LOTE = 500
+
+
+def modelo_migrado():
+    """
+    CalificacionTributaria tal como la dejaron las migraciones aplicadas. El
+    comando corre antes de la 0012, cuando aún no existen tablas posteriores
+    (HuellaFila, ...) a las que el modelo actual borraría en cascada.
+    """
+    cargador = MigrationLoader(connection)
+    aplicadas = {n for n in cargador.applied_migrations if n in cargador.graph.node_map}
+    hojas = [n for n in aplicadas if not {h.key for h in cargador.graph.node_map[n].children} & aplicadas]
+    return cargador.project_state(hojas, at_end=True).apps.get_model('core', 'CalificacionTributaria')
+
+
+def repetidas(Calificacion):
+    """[(clave, [ids del más nuevo al más antiguo])] de las claves con más de una calificación."""
+    grupos = (Calificacion.objects.filter(fecha_pago__isnull=False).values(*CLAVE)
+              .annotate(n=Count('id')).filter(n__gt=1).order_by(*CLAVE))
+    return [
+        (tuple(g[c] for c in CLAVE),
+         list(Calificacion.objects.filter(**{c: g[c] for c in CLAVE}).order_by('-id').values_list('id', flat=True)))
+        for g in grupos
+    ]
+
+
+class Command(BaseCommand):
+    help = ("Limpia las calificaciones que repiten la clave natural (usuario, RUT, instrumento, ejercicio, fecha de "
+            "pago y secuencia) para poder aplicar la migración 0012. Por defecto deja la más reciente de cada clave "
+            "y borra las otras; con --renumerar las conserva con una secuencia nueva.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--simular', action='store_true',
+                            help="Muestra las claves repetidas y lo que se haría, sin escribir nada.")
+        parser.add_argument('--renumerar', action='store_true',
+                            help="En vez de borrar, da a las filas más antiguas la siguiente secuencia libre de su dividendo.")
+
+    def handle(self, *args, **options):
+        Calificacion = modelo_migrado()
+        grupos = repetidas(Calificacion)
+        if not grupos:
+            self.stdout.write(self.style.SUCCESS("Sin claves repetidas"))
+            return
+
+        for (usuario_id, rut, instrumento_id, ejercicio, fecha_pago, secuencia), ids in grupos[:MAX_DETALLE]:
+            self.stdout.write(f"  usuario {usuario_id}, RUT {rut}, instrumento {instrumento_id}, ejercicio {ejercicio}, "
+                              f"pago {fecha_pago}, secuencia {secuencia}: queda #{ids[0]}, "
+                              f"{'se renumeran' if options['renumerar'] else 'se borran'} {', '.join(f'#{i}' for i in ids[1:])}")
+        if len(grupos) > MAX_DETALLE:
+            self.stdout.write(f"  ... y {len(grupos) - MAX_DETALLE} claves más")
+        sobrantes = [i for _, ids in grupos for i in ids[1:]]
+        verbo = "renumeradas" if options['renumerar'] else "borradas"
+        if options['simular']:
+            self.stdout.write(f"{len(grupos)} claves repetidas: {len(sobrantes)} calificaciones serían {verbo}")
+            return
+
+        with transaction.atomic():
+            if options['renumerar']:
+                for clave, ids in grupos:
+                    dividendo = {c: v for c, v in zip(CLAVE, clave) if c != 'secuencia'}
+                    siguiente = Calificacion.objects.filter(**dividendo).aggregate(m=Max('secuencia'))['m'] + 1
+                    for n, id_ in enumerate(ids[1:]):
+                        Calificacion.objects.filter(id=id_).update(secuencia=siguiente + n)
+            else:
+                # Modelo histórico: sin señales, así que el resumen se recalcula al final
+                for i in range(0, len(sobrantes), LOTE):
+                    Calificacion.objects.filter(id__in=sobrantes[i:i + LOTE]).delete()
+                reconciliar()
+        self.stdout.write(self.style.SUCCESS(f"{len(grupos)} claves repetidas: {len(sobrantes)} calificaciones {verbo}"))
@@ -0,0 +1,56 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.recalculo import filtrar, recalcular_montos
+
+
+class Command(BaseCommand):
+    help = "Recalcula monto_total (histórico * factor de actualización) por lotes, sin pasar por save()."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ejercicio', type=int, action='append',
+                            help="Solo este ejercicio (se puede repetir).")
+        parser.add_argument('--mercado', help="Solo instrumentos de este mercado (código, ej. BCS).")
+        parser.add_argument('--usuario', help="Solo calificaciones de este usuario (username).")
+        parser.add_argument('--lote', type=int, default=2000,
+                            help="Calificaciones por lote (por defecto 2000).")
+        parser.add_argument('--simular', action='store_true',
+                            help="Muestra las diferencias sin escribir nada.")
+        parser.add_argument('--desde-id', type=int, default=0,
+                            help="Empieza después de este id (para continuar un recálculo cortado).")
+        parser.add_argument('--checkpoint',
+                            help="Archivo JSON con el último id procesado; si existe se continúa desde ahí.")
+
+    def handle(self, *args, **options):
+        filtros = {'ejercicios': options['ejercicio'], 'mercado': options['mercado'], 'usuario': options['usuario']}
+        desde_id = options['desde_id']
+        checkpoint = Path(options['checkpoint']) if options['checkpoint'] else None
+        if checkpoint and checkpoint.exists():
+            guardado = json.loads(checkpoint.read_text())
+            if guardado['filtros'] != filtros:
+                raise CommandError(f"El checkpoint {checkpoint} es de otros filtros: {guardado['filtros']}")
+            desde_id = max(desde_id, guardado['ultimo_id'])
+            self.stdout.write(f"Continuando desde el id {desde_id}")
+
+        def al_avanzar(r):
+            if checkpoint and not options['simular']:
+                checkpoint.write_text(json.dumps({'filtros': filtros, 'ultimo_id': r.ultimo_id}))
+            self.stdout.write(f"  {r.revisadas} revisadas, {r.cambiadas} cambiadas (id {r.ultimo_id}, "
+                              f"{r.revisadas / max(r.segundos, 1e-9):,.0f} filas/s)")
+
+        r = recalcular_montos(filtrar(**filtros), tamano_lote=options['lote'], desde_id=desde_id,
+                              simular=options['simular'], al_avanzar=al_avanzar)
+
+        for id_, actual, nuevo in r.ejemplos:
+            self.stdout.write(f"  #{id_}: {actual} -> {nuevo}")
+        if options['simular'] and r.cambiadas > len(r.ejemplos):
+            self.stdout.write(f"  ... y {r.cambiadas - len(r.ejemplos)} más")
+        verbo = "cambiarían" if options['simular'] else "actualizadas"
+        self.stdout.write(self.style.SUCCESS(
+            f"{r.revisadas} revisadas, {r.cambiadas} {verbo} en {r.segundos:.1f}s "
+            f"({r.revisadas / max(r.segundos, 1e-9):,.0f} filas/s)"
+        ))
+        if checkpoint and not options['simular'] and checkpoint.exists():
+            checkpoint.unlink()
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.resumen import TOTALES, reconciliar
+
+# Diferencias que se muestran en detalle
+MAX_DETALLE = 20
+
+
+class Command(BaseCommand):
+    help = "Recalcula la tabla de resumen (ResumenCalificaciones) desde las calificaciones y muestra las diferencias."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--solo-verificar', action='store_true',
+                            help="No corrige la tabla; termina con error si hay diferencias.")
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        diferencias = reconciliar(corregir=not options['solo_verificar'])
+        for (usuario_id, ejercicio, mercado_id), antes, despues in diferencias[:MAX_DETALLE]:
+            detalle = ', '.join(f"{c} {a} -> {d}" for c, a, d in zip(TOTALES, antes, despues) if a != d)
+            self.stdout.write(f"  usuario {usuario_id}, ejercicio {ejercicio}, mercado {mercado_id}: {detalle}")
+        if len(diferencias) > MAX_DETALLE:
+            self.stdout.write(f"  ... y {len(diferencias) - MAX_DETALLE} grupos más")
+
+        segundos = time.monotonic() - inicio
+        if options['solo_verificar'] and diferencias:
+            raise CommandError(f"{len(diferencias)} grupos del resumen no cuadran ({segundos:.1f}s)")
+        verbo = "corregidos" if diferencias else "con diferencias"
+        self.stdout.write(self.style.SUCCESS(f"Resumen verificado: {len(diferencias)} grupos {verbo} en {segundos:.1f}s"))
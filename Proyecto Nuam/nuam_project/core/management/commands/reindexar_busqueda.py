@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.busqueda import reindexar_todo
+
+
+class Command(BaseCommand):
+    help = "Reconstruye la tabla de tokens de búsqueda del mantenedor (TokenBusqueda)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000,
+                            help="Calificaciones por lote (por defecto 5000).")
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        total = reindexar_todo(
+            tamano_lote=options['lote'],
+            al_avanzar=lambda n: self.stdout.write(f"  {n} calificaciones indexadas..."),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} calificaciones indexadas en {time.monotonic() - inicio:.1f}s"
+        ))
@@ -0,0 +1,24 @@
+from .rendimiento import SIN_RUTA, medir
+
+
+class RendimientoMiddleware:
+    """
+    Mide cada request con core.rendimiento.medir usando el nombre de la vista
+    (SIN_RUTA si la URL no calza con ninguna, p. ej. un 404) y agrega el encabezado Server-Timing para verlo
+    en las herramientas del navegador.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # No se usa request.path: cada ruta distinta sería un nombre nuevo en las estadísticas
+        with medir(SIN_RUTA) as medicion:
+            respuesta = self.get_response(request)
+            coincidencia = request.resolver_match
+            if coincidencia: medicion.nombre = coincidencia.view_name
+        respuesta['Server-Timing'] = ', '.join([
+            f'total;dur={medicion.segundos * 1000:.1f}',
+            f'bd;dur={medicion.segundos_bd * 1000:.1f};desc="{medicion.consultas} consultas"',
+            f'plantillas;dur={medicion.segundos_plantillas * 1000:.1f}',
+        ])
+        return respuesta
@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-17 00:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_alter_calificaciontributaria_factor_08_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoCarga',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('archivo', models.FileField(blank=True, upload_to='cargas/%Y/%m/')),
+                ('nombre_archivo', models.CharField(max_length=255)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('terminado', 'Terminado'), ('fallido', 'Fallido')], db_index=True, default='pendiente', max_length=20)),
+                ('filas_procesadas', models.IntegerField(default=0)),
+                ('guardados', models.IntegerField(default=0)),
+                ('cantidad_errores', models.IntegerField(default=0)),
+                ('errores', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('iniciado_en', models.DateTimeField(blank=True, null=True)),
+                ('terminado_en', models.DateTimeField(blank=True, null=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
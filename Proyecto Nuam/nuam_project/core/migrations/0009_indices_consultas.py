@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-17 00:17
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_trabajocarga'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='calificaciontributaria',
+            index=models.Index(fields=['usuario', '-created_at', '-id'], name='calif_usuario_creado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='calificaciontributaria',
+            index=models.Index(fields=['-created_at', '-id'], name='calif_creado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='calificaciontributaria',
+            index=models.Index(fields=['instrumento', 'ejercicio', 'secuencia'], name='calif_inst_ejercicio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='instrumento',
+            index=models.Index(django.db.models.functions.text.Upper('codigo'), name='instrumento_codigo_upper_idx'),
+        ),
+    ]
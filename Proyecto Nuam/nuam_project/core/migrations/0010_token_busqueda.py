@@ -0,0 +1,61 @@
+# Generated by Django 6.0 on 2026-10-17 00:30
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Copia fija de la tokenización de core/busqueda.py al crear la tabla: si esa cambia,
+# la migración debe seguir dejando los mismos tokens
+LARGO_TOKEN = 64
+_RUT = re.compile(r'^[\d.]{6,}-?[\dK]$')
+_SEPARADOR = re.compile(r'[^0-9A-Z]+')
+
+
+def tokenizar(texto):
+    texto = unicodedata.normalize('NFKD', str(texto or ''))
+    tokens = set()
+    for palabra in ''.join(c for c in texto if not unicodedata.combining(c)).upper().split():
+        if _RUT.match(palabra):
+            tokens.add(palabra.replace('.', '').replace('-', ''))
+        else:
+            tokens.update(p for p in _SEPARADOR.split(palabra) if p)
+    return {t[:LARGO_TOKEN] for t in tokens}
+
+
+def tokens_de(calif):
+    return {t for t in tokenizar(calif.rut_propietario) | tokenizar(calif.descripcion) if len(t) > 1}
+
+
+def poblar_tokens(apps, schema_editor):
+    Calificacion = apps.get_model('core', 'CalificacionTributaria')
+    TokenBusqueda = apps.get_model('core', 'TokenBusqueda')
+    calificaciones = Calificacion.objects.only('id', 'rut_propietario', 'descripcion').iterator(chunk_size=5000)
+    TokenBusqueda.objects.bulk_create(
+        (TokenBusqueda(calificacion_id=c.id, token=t) for c in calificaciones for t in tokens_de(c)),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenBusqueda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('calificacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tokens', to='core.calificaciontributaria')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token', 'calificacion'], name='token_busqueda_idx')],
+            },
+        ),
+        migrations.RunPython(poblar_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 6.0 on 2026-10-17 01:16
+
+from collections import defaultdict
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Copia fija de core/resumen.py al crear la tabla: si esa cambia, la migración debe dejar los mismos totales
+CAMPOS_BASE = tuple(f'factor_{i:02d}' for i in range(8, 20))  # F08..F19
+TOTALES = ('cantidad', 'monto_historico', 'monto_total', 'suma_bases')
+
+
+def poblar_resumen(apps, schema_editor):
+    Calificacion = apps.get_model('core', 'CalificacionTributaria')
+    Resumen = apps.get_model('core', 'ResumenCalificaciones')
+    grupos = defaultdict(lambda: [0, Decimal('0'), Decimal('0'), Decimal('0')])
+    for usuario_id, ejercicio, mercado_id, historico, total, *bases in Calificacion.objects.values_list(
+        'usuario_id', 'ejercicio', 'instrumento__mercado_id', 'monto_historico', 'monto_total', *CAMPOS_BASE,
+    ).iterator(chunk_size=5000):
+        d = grupos[(usuario_id, ejercicio, mercado_id)]
+        d[0] += 1
+        d[1] += historico
+        d[2] += total
+        d[3] += sum(bases, Decimal('0'))
+    Resumen.objects.bulk_create(
+        Resumen(usuario_id=u, ejercicio=e, mercado_id=m, **dict(zip(TOTALES, d))) for (u, e, m), d in grupos.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_token_busqueda'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenCalificaciones',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ejercicio', models.IntegerField()),
+                ('cantidad', models.IntegerField(default=0)),
+                ('monto_historico', models.DecimalField(decimal_places=2, default=0, max_digits=26)),
+                ('monto_total', models.DecimalField(decimal_places=2, default=0, max_digits=26)),
+                ('suma_bases', models.DecimalField(decimal_places=6, default=0, max_digits=26)),
+                ('mercado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.mercado')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'ejercicio', 'mercado'), name='resumen_grupo_unico')],
+            },
+        ),
+        migrations.RunPython(poblar_resumen, migrations.RunPython.noop),
+    ]
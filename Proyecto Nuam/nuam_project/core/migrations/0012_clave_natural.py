@@ -0,0 +1,66 @@
+# Generated by Django 6.0 on 2026-10-17 01:30
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+# Claves con más de una calificación que se muestran en el error
+MAX_DETALLE = 20
+
+
+def verificar_claves(apps, schema_editor):
+    # Una migración no borra datos: si hay claves repetidas se detiene con los ids y se
+    # limpian antes con 'manage.py quitar_duplicados' (--simular muestra qué haría)
+    Calificacion = apps.get_model('core', 'CalificacionTributaria')
+    clave = ('usuario_id', 'rut_propietario', 'instrumento_id', 'ejercicio', 'fecha_pago', 'secuencia')
+    repetidas = list(Calificacion.objects.filter(fecha_pago__isnull=False).values(*clave)
+                     .annotate(n=Count('id')).filter(n__gt=1).order_by(*clave))
+    if not repetidas: return
+    detalle = []
+    for grupo in repetidas[:MAX_DETALLE]:
+        del grupo['n']
+        ids = Calificacion.objects.filter(**grupo).order_by('id').values_list('id', flat=True)
+        detalle.append(f"  ids {', '.join(map(str, ids))}")
+    if len(repetidas) > MAX_DETALLE: detalle.append(f"  ... y {len(repetidas) - MAX_DETALLE} claves más")
+    raise RuntimeError(
+        f"{len(repetidas)} claves (usuario, RUT, instrumento, ejercicio, fecha de pago, secuencia) tienen más de "
+        "una calificación y no se puede crear la restricción calif_clave_natural:\n" + '\n'.join(detalle)
+        + "\nRevíselas con 'manage.py quitar_duplicados --simular' y vuelva a migrar después de limpiarlas."
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_resumen_calificaciones'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajocarga',
+            name='actualizados',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trabajocarga',
+            name='insertados',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trabajocarga',
+            name='modo',
+            field=models.CharField(choices=[('insertar', 'Insertar (las filas que ya existen se informan como error)'), ('actualizar', 'Actualizar las existentes e insertar las nuevas')], default='insertar', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='trabajocarga',
+            name='sin_cambios',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(verificar_claves, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='calificaciontributaria',
+            constraint=models.UniqueConstraint(fields=('usuario', 'rut_propietario', 'instrumento', 'ejercicio', 'fecha_pago', 'secuencia'), name='calif_clave_natural'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 6.0 on 2026-10-17 01:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_clave_natural'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajocarga',
+            name='duplicado_de',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.trabajocarga'),
+        ),
+        migrations.AddField(
+            model_name='trabajocarga',
+            name='huellas',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trabajocarga',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.CreateModel(
+            name='HuellaFila',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('huella', models.CharField(max_length=32)),
+                ('calificacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='huellas', to='core.calificaciontributaria')),
+                ('trabajo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.trabajocarga')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['usuario', 'huella'], name='huella_fila_idx')],
+            },
+        ),
+    ]
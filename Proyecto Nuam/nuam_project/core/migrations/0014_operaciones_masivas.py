@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-17 01:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_registro_cargas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OperacionMasiva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operacion', models.CharField(choices=[('eliminar', 'Eliminar'), ('reasignar', 'Reasignar a otro usuario'), ('ejercicio', 'Cambiar ejercicio'), ('factor', 'Cambiar factor de actualización')], max_length=20)),
+                ('valor', models.CharField(blank=True, max_length=150)),
+                ('filtros', models.JSONField(blank=True, default=dict)),
+                ('estado', models.CharField(choices=[('procesando', 'Procesando'), ('terminado', 'Terminado'), ('fallido', 'Fallido')], default='procesando', max_length=20)),
+                ('revisadas', models.IntegerField(default=0)),
+                ('afectadas', models.IntegerField(default=0)),
+                ('ultimo_id', models.BigIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('terminado_en', models.DateTimeField(blank=True, null=True)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-17 02:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_operaciones_masivas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajocarga',
+            name='actualizado_en',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trabajocarga',
+            name='intentos',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-17 02:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_latido_trabajos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='huellafila',
+            name='ultima_carga',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.trabajocarga'),
+        ),
+    ]
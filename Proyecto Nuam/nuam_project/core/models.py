@@ -1,6 +1,8 @@
 from django.db import models
+from django.db.models.functions import Upper
 from django.contrib.auth.models import User
-from decimal import Decimal
+
+from .factores import CAMPOS_FACTORES, calcular_monto_total
 
 class Mercado(models.Model):
     codigo = models.CharField(max_length=10, unique=True)
@@ -13,6 +15,32 @@ class Instrumento(models.Model):
     nombre = models.CharField(max_length=150)
     def __str__(self): return self.codigo
 
+    class Meta:
+        indexes = [
+            # La carga masiva y la caché buscan por código sin distinguir mayúsculas
+            models.Index(Upper('codigo'), name='instrumento_codigo_upper_idx'),
+        ]
+
+# Campos de la clave natural de CalificacionTributaria (restricción calif_clave_natural)
+CLAVE_NATURAL = ('usuario', 'rut_propietario', 'instrumento', 'ejercicio', 'fecha_pago', 'secuencia')
+
+class CalificacionQuerySet(models.QuerySet):
+    # Columnas que muestra la tabla del mantenedor (origen y updated_at no se usan)
+    CAMPOS_LISTADO = (
+        'id', 'rut_propietario', 'ejercicio', 'fecha_pago', 'secuencia', 'es_isfut', 'descripcion',
+        'monto_historico', 'factor_actualizacion', 'monto_total', 'created_at',
+        *CAMPOS_FACTORES,
+        'instrumento__codigo', 'instrumento__nombre', 'usuario__username',
+    )
+
+    def visibles_para(self, usuario):
+        """El superusuario ve todo; el resto solo sus registros."""
+        return self if usuario.is_superuser else self.filter(usuario=usuario)
+
+    def para_listado(self):
+        """Trae instrumento y usuario en la misma consulta (sin N+1) y solo las columnas de la tabla."""
+        return self.select_related('instrumento', 'usuario').only(*self.CAMPOS_LISTADO)
+
 class CalificacionTributaria(models.Model):
     # NOMBRE DEL CAMPO CORREGIDO A 'usuario' PARA QUE COINCIDA CON VIEWS.PY
     usuario = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -88,9 +116,175 @@ class CalificacionTributaria(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CalificacionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Listado del mantenedor: filtra por usuario y pagina por (-created_at, -id)
+            models.Index(fields=['usuario', '-created_at', '-id'], name='calif_usuario_creado_idx'),
+            # Listado del superusuario (sin filtro de usuario)
+            models.Index(fields=['-created_at', '-id'], name='calif_creado_idx'),
+            # Búsqueda de un dividendo por instrumento, ejercicio y secuencia
+            models.Index(fields=['instrumento', 'ejercicio', 'secuencia'], name='calif_inst_ejercicio_idx'),
+        ]
+        constraints = [
+            # Clave natural de un dividendo por corredor: la carga masiva en modo 'actualizar' la usa
+            # para no duplicar. Con fecha_pago nula la BD no la impone (NULL no choca en un índice único),
+            # pero la carga igual busca esas filas por el resto de la clave (ver _existentes en utils.py)
+            models.UniqueConstraint(fields=CLAVE_NATURAL, name='calif_clave_natural'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Valores tal como vinieron de la BD, para saber después qué columnas cambiaron
+        instancia._estado_original = dict(zip(field_names, values))
+        return instancia
+
+    def campos_modificados(self):
+        """Columnas cuyo valor difiere del leído de la BD (solo para instancias ya guardadas)."""
+        original = getattr(self, '_estado_original', {})
+        return [
+            f.attname for f in self._meta.concrete_fields
+            if not f.primary_key and f.attname in original and f.to_python(getattr(self, f.attname)) != original[f.attname]
+        ]
+
     def save(self, *args, **kwargs):
-        if self.monto_historico and self.factor_actualizacion:
-            # Forzamos que el monto actualizado (total) sea exacto en pesos (2 decimales)
-            resultado = self.monto_historico * self.factor_actualizacion
-            self.monto_total = resultado.quantize(Decimal('0.01'), rounding='ROUND_HALF_UP')
-        super().save(*args, **kwargs)
\ No newline at end of file
+        # Forzamos que el monto actualizado (total) sea exacto en pesos (2 decimales)
+        self.monto_total = calcular_monto_total(self.monto_historico, self.factor_actualizacion, self.monto_total)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            extra = {'updated_at'}
+            if {'monto_historico', 'factor_actualizacion'} & set(update_fields): extra.add('monto_total')
+            kwargs['update_fields'] = {*update_fields, *extra}
+        super().save(*args, **kwargs)
+        self._estado_original = {
+            f.attname: f.to_python(getattr(self, f.attname)) for f in self._meta.concrete_fields if f.attname in self.__dict__
+        }
+
+class TokenBusqueda(models.Model):
+    """Palabra normalizada del RUT o la descripción de una calificación (ver core/busqueda.py)."""
+    calificacion = models.ForeignKey(CalificacionTributaria, on_delete=models.CASCADE, related_name='tokens')
+    token = models.CharField(max_length=64)
+
+    class Meta:
+        indexes = [models.Index(fields=['token', 'calificacion'], name='token_busqueda_idx')]
+
+    def __str__(self): return self.token
+
+class ResumenCalificaciones(models.Model):
+    """
+    Totales de las calificaciones por usuario, ejercicio y mercado, mantenidos
+    en cada escritura (ver core/resumen.py). 'suma_bases' suma F08..F19.
+    """
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    ejercicio = models.IntegerField()
+    mercado = models.ForeignKey(Mercado, on_delete=models.CASCADE)
+
+    cantidad = models.IntegerField(default=0)
+    monto_historico = models.DecimalField(max_digits=26, decimal_places=2, default=0)
+    monto_total = models.DecimalField(max_digits=26, decimal_places=2, default=0)
+    suma_bases = models.DecimalField(max_digits=26, decimal_places=6, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'ejercicio', 'mercado'], name='resumen_grupo_unico'),
+        ]
+
+    def __str__(self): return f"{self.usuario} {self.ejercicio} {self.mercado}: {self.cantidad}"
+
+class TrabajoCarga(models.Model):
+    """Carga masiva encolada: el archivo queda en disco y lo procesa 'manage.py procesar_cargas'."""
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('terminado', 'Terminado'),
+        ('fallido', 'Fallido'),
+    ]
+
+    MODOS = [
+        ('insertar', 'Insertar (las filas que ya existen se informan como error)'),
+        ('actualizar', 'Actualizar las existentes e insertar las nuevas'),
+    ]
+
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    archivo = models.FileField(upload_to='cargas/%Y/%m/', blank=True)
+    modo = models.CharField(max_length=20, choices=MODOS, default='insertar')
+    nombre_archivo = models.CharField(max_length=255)
+    # SHA-256 del archivo, calculado al copiarlo a disco (ver encolar_carga)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    # Archivo idéntico a una carga anterior cuyas filas no han cambiado: no se procesa
+    duplicado_de = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente', db_index=True)
+
+    filas_procesadas = models.IntegerField(default=0)
+    guardados = models.IntegerField(default=0)
+    insertados = models.IntegerField(default=0)
+    actualizados = models.IntegerField(default=0)
+    sin_cambios = models.IntegerField(default=0)
+    huellas = models.IntegerField(default=0)  # Filas que quedaron en el registro de HuellaFila con esta carga
+    cantidad_errores = models.IntegerField(default=0)
+    errores = models.JSONField(default=list, blank=True)  # Solo los primeros mensajes
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    iniciado_en = models.DateTimeField(null=True, blank=True)
+    # Latido del worker: se renueva con cada avance; si se detiene, otro worker retoma el trabajo
+    actualizado_en = models.DateTimeField(null=True, blank=True)
+    intentos = models.IntegerField(default=0)  # Veces que un worker tomó el trabajo
+    terminado_en = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self): return f"Carga #{self.id} - {self.nombre_archivo} ({self.estado})"
+
+class HuellaFila(models.Model):
+    """
+    Registro de filas ya cargadas: huella de una fila validada de la carga
+    masiva y la calificación que quedó con esos valores. La misma fila en
+    otra carga del usuario se omite sin leer la calificación. Cualquier
+    cambio posterior de la calificación borra sus huellas (core/signals.py).
+    """
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    huella = models.CharField(max_length=32)
+    calificacion = models.ForeignKey(CalificacionTributaria, on_delete=models.CASCADE, related_name='huellas')
+    trabajo = models.ForeignKey(TrabajoCarga, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    # Última carga que trajo la fila sin cambios y la omitió ('trabajo' sigue siendo la que la dejó así)
+    ultima_carga = models.ForeignKey(TrabajoCarga, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+
+    class Meta:
+        indexes = [models.Index(fields=['usuario', 'huella'], name='huella_fila_idx')]
+
+    def __str__(self): return self.huella
+
+class OperacionMasiva(models.Model):
+    """
+    Registro de una operación masiva sobre calificaciones (core/operaciones.py):
+    quién la pidió, sobre qué filtro o ids, el valor nuevo y cuántas filas tocó.
+    """
+    OPERACIONES = [
+        ('eliminar', 'Eliminar'),
+        ('reasignar', 'Reasignar a otro usuario'),
+        ('ejercicio', 'Cambiar ejercicio'),
+        ('factor', 'Cambiar factor de actualización'),
+    ]
+
+    ESTADOS = [
+        ('procesando', 'Procesando'),
+        ('terminado', 'Terminado'),
+        ('fallido', 'Fallido'),
+    ]
+
+    # Queda aunque se borre el usuario que la pidió (None también en 'manage.py operacion_masiva' sin --autor)
+    usuario = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    operacion = models.CharField(max_length=20, choices=OPERACIONES)
+    valor = models.CharField(max_length=150, blank=True)  # username, ejercicio o factor, tal como se pidió
+    filtros = models.JSONField(default=dict, blank=True)  # Filtros de búsqueda o {'ids': [...]}
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='procesando')
+
+    revisadas = models.IntegerField(default=0)
+    afectadas = models.IntegerField(default=0)
+    ultimo_id = models.BigIntegerField(default=0)  # Última calificación revisada (lo anterior ya quedó escrito)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    terminado_en = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self): return f"Operación #{self.id} - {self.get_operacion_display()} ({self.afectadas} filas, {self.estado})"
@@ -0,0 +1,136 @@
+"""
+Operaciones masivas sobre calificaciones (el resultado de un filtro o ids
+elegidos): eliminar, reasignar a otro usuario, cambiar el ejercicio o el
+factor de actualización (recalculando monto_total). Las usan el mantenedor
+y 'manage.py operacion_masiva'.
+
+Se recorren por id en lotes, como el recálculo: cada lote se lee con values,
+se escribe con una sola consulta (DELETE, UPDATE o bulk_update) en su propia
+transacción y se avisa con calificaciones_modificadas, así el resumen, los
+tokens, las huellas y la caché del detalle quedan al día sin un save() por
+fila. Cada operación deja un OperacionMasiva con lo pedido y los conteos.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .factores import calcular_monto_total
+from .models import CalificacionTributaria, HuellaFila, OperacionMasiva, TokenBusqueda
+from .resumen import CAMPOS_RESUMEN
+from .signals import calificaciones_modificadas
+
+OPERACIONES = [codigo for codigo, _ in OperacionMasiva.OPERACIONES]
+# Columna que escribe cada operación de cambio ('eliminar' no escribe ninguna)
+COLUMNAS = {'reasignar': 'usuario_id', 'ejercicio': 'ejercicio', 'factor': 'factor_actualizacion'}
+CAMPOS = ('id', *CAMPOS_RESUMEN, 'factor_actualizacion')
+
+
+def interpretar_valor(operacion, valor):
+    """Valor nuevo de la columna: id de usuario, ejercicio o factor (None para 'eliminar'). ValueError si no sirve."""
+    if operacion not in OPERACIONES: raise ValueError(f"Operación desconocida: {operacion}")
+    if operacion == 'eliminar': return None
+    valor = (valor or '').strip()
+    if operacion == 'reasignar':
+        usuario_id = User.objects.filter(username=valor).values_list('id', flat=True).first()
+        if usuario_id is None: raise ValueError(f"No existe el usuario '{valor}'")
+        return usuario_id
+    if operacion == 'ejercicio':
+        if not valor.isdigit(): raise ValueError(f"Ejercicio inválido: '{valor}'")
+        return int(valor)
+    try:
+        factor = Decimal(valor.replace(',', '.')).quantize(Decimal('0.000001'))
+    except InvalidOperation:
+        raise ValueError(f"Factor de actualización inválido: '{valor}'") from None
+    # La columna es DECIMAL(10, 6)
+    if not 0 < factor < 10_000: raise ValueError(f"El factor de actualización debe estar entre 0 y 10.000: {factor}")
+    return factor
+
+
+def _eliminar(filas, columna, nuevo):
+    ids = [f['id'] for f in filas]
+    # Sin el Collector de Django, que leería cada fila y mandaría un post_delete por cada una: primero
+    # las tablas que apuntan a la calificación (ver models.py) y después las calificaciones en un DELETE
+    TokenBusqueda.objects.filter(calificacion_id__in=ids).delete()
+    HuellaFila.objects.filter(calificacion_id__in=ids).delete()
+    borradas = CalificacionTributaria.objects.filter(id__in=ids)
+    borradas._raw_delete(borradas.db)
+    calificaciones_modificadas.send(sender=CalificacionTributaria, eliminadas=filas)
+
+
+def _asignar(filas, columna, nuevo):
+    CalificacionTributaria.objects.filter(id__in=[f['id'] for f in filas]).update(**{columna: nuevo, 'updated_at': timezone.now()})
+    calificaciones_modificadas.send(
+        sender=CalificacionTributaria, actualizadas=[CalificacionTributaria(**{**f, columna: nuevo}) for f in filas],
+        campos=[columna], anteriores=filas,
+    )
+
+
+def _cambiar_factor(filas, columna, nuevo):
+    # El monto total depende del factor; los factores F08..F37 no (ver core/recalculo.py)
+    ahora = timezone.now()
+    objetos = [
+        CalificacionTributaria(**{**f, 'factor_actualizacion': nuevo, 'updated_at': ahora,
+                                  'monto_total': calcular_monto_total(f['monto_historico'], nuevo, f['monto_total'])})
+        for f in filas
+    ]
+    CalificacionTributaria.objects.bulk_update(objetos, ['factor_actualizacion', 'monto_total', 'updated_at'], batch_size=500)
+    calificaciones_modificadas.send(
+        sender=CalificacionTributaria, actualizadas=objetos, campos=['factor_actualizacion', 'monto_total'], anteriores=filas,
+    )
+
+
+_ESCRIBIR = {'eliminar': _eliminar, 'reasignar': _asignar, 'ejercicio': _asignar, 'factor': _cambiar_factor}
+
+
+def aplicar(operacion, qs, valor=None, autor=None, filtros=None, tamano_lote=2000, simular=False, al_avanzar=None):
+    """
+    Aplica la operación a las calificaciones de qs y retorna el OperacionMasiva
+    con los conteos. 'valor' es el texto pedido (username, ejercicio o factor) y
+    'filtros' se guarda tal cual en el registro. Las filas que ya tienen el valor
+    nuevo se revisan pero no se escriben. Con 'simular' solo se cuenta y el
+    registro no se guarda. ValueError si la operación o el valor no sirven.
+
+    Si un lote choca con la clave natural (el usuario o ejercicio destino ya
+    tiene ese dividendo) se deshace ese lote y la operación queda 'fallida'
+    con lo escrito hasta el lote anterior. Con cualquier otro error (BD
+    bloqueada, conexión perdida...) también queda 'fallida', con el error,
+    y la excepción se propaga. al_avanzar(registro) se llama después de
+    cada lote.
+    """
+    nuevo = interpretar_valor(operacion, valor)
+    columna = COLUMNAS.get(operacion)
+    registro = OperacionMasiva(usuario=autor, operacion=operacion, valor=valor or '', filtros=filtros or {})
+    if not simular: registro.save()
+
+    campos = qs.order_by('id').values(*CAMPOS)
+    # Se bloquea el lote mientras se escribe para no pisar una edición concurrente (no aplica en SQLite)
+    if not simular: campos = campos.select_for_update(of=('self',))
+    try:
+        while True:
+            with transaction.atomic():
+                filas = list(campos.filter(id__gt=registro.ultimo_id)[:tamano_lote])
+                if not filas: break
+                cambian = filas if columna is None else [f for f in filas if f[columna] != nuevo]
+                if cambian and not simular: _ESCRIBIR[operacion](cambian, columna, nuevo)
+            registro.revisadas += len(filas)
+            registro.afectadas += len(cambian)
+            registro.ultimo_id = filas[-1]['id']
+            if not simular: registro.save(update_fields=['revisadas', 'afectadas', 'ultimo_id'])
+            if al_avanzar: al_avanzar(registro)
+        registro.estado = 'terminado'
+    except IntegrityError as e:
+        registro.estado = 'fallido'
+        registro.error = (f"Lote después del id {registro.ultimo_id}: choca con una calificación que el destino "
+                          f"ya tiene (misma clave natural). No se aplicó desde ahí. {e}")
+    except Exception as e:
+        # El registro no debe quedar 'procesando': dice hasta dónde llegó para retomar con un filtro
+        registro.estado = 'fallido'
+        registro.error = f"Lote después del id {registro.ultimo_id}: {type(e).__name__}: {e}"
+        registro.terminado_en = timezone.now()
+        if not simular: registro.save()
+        raise
+    registro.terminado_en = timezone.now()
+    if not simular: registro.save()
+    return registro
@@ -0,0 +1,70 @@
+"""
+Paginación por keyset sobre (created_at, id), del más nuevo al más antiguo.
+A diferencia de OFFSET, el costo de cada página no crece con el número de página.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+TAMANO_PAGINA = 50
+TAMANO_PAGINA_MAX = 500
+
+
+def codificar_cursor(obj):
+    texto = f"{obj.created_at.isoformat()}|{obj.id}"
+    return base64.urlsafe_b64encode(texto.encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    """Retorna (created_at, id) o None si el cursor no es válido."""
+    try:
+        fecha, id_ = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(fecha), int(id_)
+    except (ValueError, UnicodeError):
+        return None
+
+
+def tamano_pagina(valor, defecto=TAMANO_PAGINA):
+    try: return max(1, min(int(valor), TAMANO_PAGINA_MAX))
+    except (TypeError, ValueError): return defecto
+
+
+def anteriores_a(qs, fecha, id_):
+    """Filas que van después de (fecha, id_) en el orden (-created_at, -id)."""
+    # El rango sobre created_at va aparte para que el índice (.., -created_at, -id)
+    # se recorra en orden; con solo el OR el motor termina ordenando en memoria
+    return qs.filter(created_at__lte=fecha).filter(Q(created_at__lt=fecha) | Q(id__lt=id_))
+
+
+def paginar_keyset(qs, despues=None, antes=None, tamano=TAMANO_PAGINA):
+    """
+    Una página de qs ordenada por (-created_at, -id).
+    - despues: cursor de la última fila vista -> página siguiente (más antiguos)
+    - antes: cursor de la primera fila vista -> página anterior (más nuevos)
+    Retorna (filas, cursor_siguiente, cursor_anterior); los cursores son None
+    cuando no hay más páginas en esa dirección.
+    """
+    clave_antes = decodificar_cursor(antes) if antes else None
+    clave_despues = decodificar_cursor(despues) if despues and not clave_antes else None
+
+    if clave_antes:
+        fecha, id_ = clave_antes
+        filas = list(qs.filter(created_at__gte=fecha).filter(Q(created_at__gt=fecha) | Q(id__gt=id_))
+                       .order_by('created_at', 'id')[:tamano + 1])
+        hay_mas = len(filas) > tamano
+        filas = filas[:tamano][::-1]
+        anterior = codificar_cursor(filas[0]) if hay_mas else None
+        siguiente = codificar_cursor(filas[-1]) if filas else None
+        return filas, siguiente, anterior
+
+    if clave_despues:
+        fecha, id_ = clave_despues
+        qs = anteriores_a(qs, fecha, id_)
+
+    filas = list(qs.order_by('-created_at', '-id')[:tamano + 1])
+    hay_mas = len(filas) > tamano
+    filas = filas[:tamano]
+    siguiente = codificar_cursor(filas[-1]) if hay_mas else None
+    anterior = codificar_cursor(filas[0]) if clave_despues and filas else None
+    return filas, siguiente, anterior
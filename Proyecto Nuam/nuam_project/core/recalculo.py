@@ -0,0 +1,82 @@
+"""
+Recálculo por lotes de monto_total (= monto histórico * factor de actualización)
+en calificaciones ya guardadas, sin pasar por save() fila por fila.
+Lo usa 'manage.py recalcular_calificaciones'.
+
+Los factores F08..F37 no se recalculan: son montos / monto_total y los montos
+por columna no se guardan, así que no cambian al cambiar el monto total.
+"""
+import time
+from typing import NamedTuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from .factores import calcular_monto_total
+from .models import CalificacionTributaria
+from .signals import calificaciones_modificadas
+
+# Diferencias que se guardan en el resultado para mostrar en --simular
+MAX_EJEMPLOS = 20
+
+
+class ResultadoRecalculo(NamedTuple):
+    revisadas: int
+    cambiadas: int
+    ultimo_id: int
+    segundos: float
+    ejemplos: list  # [(id, monto_total actual, monto_total nuevo), ...]
+
+
+def filtrar(ejercicios=None, mercado=None, usuario=None):
+    """Calificaciones a recalcular: ejercicios (lista), código de mercado y username, todos opcionales."""
+    qs = CalificacionTributaria.objects.all()
+    if ejercicios: qs = qs.filter(ejercicio__in=ejercicios)
+    if mercado: qs = qs.filter(instrumento__mercado__codigo__iexact=mercado)
+    if usuario: qs = qs.filter(usuario__username=usuario)
+    return qs
+
+
+def diferencias(filas):
+    """(id, actual, nuevo) de las filas (id, histórico, factor, monto_total, ...) cuyo monto cambia."""
+    cambios = []
+    for id_, historico, factor, actual, *_ in filas:
+        nuevo = calcular_monto_total(historico, factor, actual)
+        if nuevo != actual: cambios.append((id_, actual, nuevo))
+    return cambios
+
+
+def recalcular_montos(qs, tamano_lote=2000, desde_id=0, simular=False, al_avanzar=None):
+    """
+    Recorre qs por id (mayores que 'desde_id') en lotes. Cada lote se lee con
+    values_list y solo las filas que cambian se escriben con un bulk_update,
+    en una transacción por lote: si el proceso se corta, lo ya escrito queda
+    y basta con seguir desde el último id informado. Con 'simular' no se
+    escribe nada. al_avanzar(resultado) se llama después de cada lote.
+    """
+    inicio = time.perf_counter()
+    revisadas, cambiadas, ultimo, ejemplos = 0, 0, desde_id, []
+    campos = qs.order_by('id').values_list(
+        'id', 'monto_historico', 'factor_actualizacion', 'monto_total', 'usuario_id', 'ejercicio', 'instrumento_id',
+    )
+    # Se bloquea el lote mientras se recalcula para no pisar una edición concurrente (no aplica en SQLite)
+    if not simular: campos = campos.select_for_update(of=('self',))
+    while True:
+        with transaction.atomic():
+            filas = list(campos.filter(id__gt=ultimo)[:tamano_lote])
+            if not filas: break
+            cambios = diferencias(filas)
+            if cambios and not simular:
+                ahora = timezone.now()
+                # El grupo (usuario, ejercicio, instrumento) va para el resumen; bulk_update solo escribe el monto
+                grupos = {f[0]: dict(zip(('usuario_id', 'ejercicio', 'instrumento_id'), f[4:])) for f in filas}
+                objetos = [CalificacionTributaria(id=id_, monto_total=nuevo, updated_at=ahora, **grupos[id_]) for id_, _, nuevo in cambios]
+                CalificacionTributaria.objects.bulk_update(objetos, ['monto_total', 'updated_at'], batch_size=500)
+                calificaciones_modificadas.send(
+                    sender=CalificacionTributaria, actualizadas=objetos, campos=['monto_total'],
+                    anteriores=[{**grupos[id_], 'monto_total': actual} for id_, actual, _ in cambios],
+                )
+        revisadas, cambiadas, ultimo = revisadas + len(filas), cambiadas + len(cambios), filas[-1][0]
+        ejemplos.extend(cambios[:MAX_EJEMPLOS - len(ejemplos)])
+        if al_avanzar: al_avanzar(ResultadoRecalculo(revisadas, cambiadas, ultimo, time.perf_counter() - inicio, ejemplos))
+    return ResultadoRecalculo(revisadas, cambiadas, ultimo, time.perf_counter() - inicio, ejemplos)
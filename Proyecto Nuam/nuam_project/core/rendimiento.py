@@ -0,0 +1,194 @@
+"""
+Medición de rendimiento por vista y por etapa.
+
+medir(nombre) mide un bloque completo: tiempo, cantidad y tiempo de consultas
+a la BD (execute_wrapper), tiempo de render de plantillas y, si está activo
+RENDIMIENTO_MEMORIA, el pico de memoria con tracemalloc. Al terminar deja un
+registro JSON en el logger 'core.rendimiento', lo suma a las estadísticas en
+memoria del proceso (api/rendimiento/) y avisa con un warning si se pasó del
+presupuesto de consultas de RENDIMIENTO_PRESUPUESTOS.
+
+etapa(nombre) marca una parte dentro de la medición en curso (por ejemplo las
+etapas de procesar_carga_masiva); sin medición en curso no hace nada.
+
+RendimientoMiddleware (core/middleware.py) mide cada request con el nombre
+de su URL.
+"""
+import json
+import logging
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+try:
+    import resource
+except ImportError:  # Windows: no hay getrusage
+    resource = None
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Mediciones que se guardan por nombre para las estadísticas, y nombres distintos que se guardan;
+# pasado el máximo, los nombres nuevos van a OTROS
+MAX_REGISTROS = 500
+MAX_NOMBRES = 200
+SIN_RUTA = 'sin_ruta'
+OTROS = 'otros'
+
+_actual = ContextVar('medicion_actual', default=None)
+_registros = defaultdict(lambda: deque(maxlen=MAX_REGISTROS))
+_candado = Lock()
+
+
+class Medicion:
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.consultas = 0
+        self.segundos_bd = 0.0
+        self.segundos_plantillas = 0.0
+        self.etapas = defaultdict(lambda: [0.0, 0])  # nombre -> [segundos, consultas]
+        self.segundos = 0.0
+        self.memoria_kb = None
+
+    def como_dict(self):
+        return {
+            'nombre': self.nombre,
+            'ms': round(self.segundos * 1000, 2),
+            'consultas': self.consultas,
+            'ms_bd': round(self.segundos_bd * 1000, 2),
+            'ms_plantillas': round(self.segundos_plantillas * 1000, 2),
+            'memoria_pico_kb': self.memoria_kb,
+            'memoria_proceso_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1) if resource else None,
+            'etapas': {e: {'ms': round(s * 1000, 2), 'consultas': c} for e, (s, c) in self.etapas.items()},
+        }
+
+
+def _contar_consultas(medicion):
+    def envoltura(execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            medicion.consultas += 1
+            medicion.segundos_bd += time.perf_counter() - inicio
+    return envoltura
+
+
+@contextmanager
+def medir(nombre):
+    """Mide el bloque y lo registra al salir. Retorna la Medicion (el nombre se puede cambiar antes de salir)."""
+    medicion = Medicion(nombre)
+    memoria = getattr(settings, 'RENDIMIENTO_MEMORIA', False)
+    token = _actual.set(medicion)
+    inicio = time.perf_counter()
+    try:
+        with ExitStack() as pila:
+            for conexion in connections.all():
+                pila.enter_context(conexion.execute_wrapper(_contar_consultas(medicion)))
+            if memoria:
+                # Con varios hilos el pico es el del proceso durante la medición, no solo el de este request
+                if not tracemalloc.is_tracing(): tracemalloc.start()
+                tracemalloc.reset_peak()
+            yield medicion
+    finally:
+        medicion.segundos = time.perf_counter() - inicio
+        if memoria: medicion.memoria_kb = tracemalloc.get_traced_memory()[1] // 1024
+        _actual.reset(token)
+        registrar(medicion)
+
+
+@contextmanager
+def etapa(nombre):
+    medicion = _actual.get()
+    if medicion is None:
+        yield
+        return
+    inicio, consultas = time.perf_counter(), medicion.consultas
+    try:
+        yield
+    finally:
+        acumulado = medicion.etapas[nombre]
+        acumulado[0] += time.perf_counter() - inicio
+        acumulado[1] += medicion.consultas - consultas
+
+
+_FIN = object()
+
+
+def iterar_en_etapa(iterable, nombre):
+    """Recorre 'iterable' contando en la etapa 'nombre' solo el tiempo de producir cada elemento."""
+    iterador = iter(iterable)
+    while True:
+        with etapa(nombre):
+            elemento = next(iterador, _FIN)
+        if elemento is _FIN: return
+        yield elemento
+
+
+def presupuesto(nombre):
+    return getattr(settings, 'RENDIMIENTO_PRESUPUESTOS', {}).get(nombre)
+
+
+def registrar(medicion):
+    registro = medicion.como_dict()
+    limite = presupuesto(medicion.nombre)
+    registro['excedido'] = limite is not None and medicion.consultas > limite
+    with _candado:
+        nombre = medicion.nombre if medicion.nombre in _registros or len(_registros) < MAX_NOMBRES else OTROS
+        _registros[nombre].append(registro)
+    logger.info(json.dumps(registro, ensure_ascii=False))
+    if registro['excedido']:
+        logger.warning("%s hizo %d consultas (presupuesto %d)", medicion.nombre, medicion.consultas, limite)
+
+
+def _percentil(valores, p):
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def estadisticas():
+    """Resumen de las últimas MAX_REGISTROS mediciones de cada nombre en este proceso."""
+    with _candado:
+        copia = {nombre: list(registros) for nombre, registros in _registros.items()}
+    resultado = {}
+    for nombre, registros in sorted(copia.items()):
+        ms = sorted(r['ms'] for r in registros)
+        consultas = [r['consultas'] for r in registros]
+        resultado[nombre] = {
+            'n': len(registros),
+            'ms_p50': _percentil(ms, 0.5), 'ms_p95': _percentil(ms, 0.95), 'ms_max': ms[-1],
+            'consultas_promedio': round(sum(consultas) / len(consultas), 1), 'consultas_max': max(consultas),
+            'ms_bd_promedio': round(sum(r['ms_bd'] for r in registros) / len(registros), 2),
+            'ms_plantillas_promedio': round(sum(r['ms_plantillas'] for r in registros) / len(registros), 2),
+            'presupuesto': presupuesto(nombre),
+            'excedidos': sum(r['excedido'] for r in registros),
+        }
+    return resultado
+
+
+def reiniciar():
+    with _candado:
+        _registros.clear()
+
+
+def instalar_medicion_de_plantillas():
+    """Envuelve el render de las plantillas de Django para sumarlo a la medición en curso."""
+    from django.template.backends.django import Template
+    if getattr(Template.render, 'medido', False): return
+    original = Template.render
+
+    def render(self, context=None, request=None):
+        medicion = _actual.get()
+        if medicion is None: return original(self, context, request)
+        inicio = time.perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            medicion.segundos_plantillas += time.perf_counter() - inicio
+
+    render.medido = True
+    Template.render = render
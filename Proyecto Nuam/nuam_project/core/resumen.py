@@ -0,0 +1,172 @@
+"""
+Resumen de calificaciones por usuario, ejercicio y mercado (cantidad, montos y
+suma de los factores base F08..F19) en la tabla ResumenCalificaciones.
+
+Toda escritura pasa por actualizar_resumen(anteriores, nuevas): resta lo que
+aportaban las calificaciones antes y suma lo que aportan ahora, solo en los
+grupos afectados. Lo llaman las señales de core/signals.py (save, delete y
+calificaciones_modificadas). 'manage.py reconciliar_resumen' lo recalcula
+desde cero y muestra las diferencias.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .cache import mercados_de_instrumentos
+from .factores import CAMPOS_FACTORES
+from .models import CalificacionTributaria, ResumenCalificaciones
+
+CAMPOS_BASE = CAMPOS_FACTORES[:12]  # F08..F19
+CAMPOS_GRUPO = ('usuario_id', 'ejercicio', 'instrumento_id')
+# Columnas de una calificación que afectan el resumen
+CAMPOS_RESUMEN = (*CAMPOS_GRUPO, 'monto_historico', 'monto_total', *CAMPOS_BASE)
+TOTALES = ('cantidad', 'monto_historico', 'monto_total', 'suma_bases')
+
+_CAMPOS = {c: CalificacionTributaria._meta.get_field(c) for c in CAMPOS_RESUMEN}
+
+
+def _attnames(campos):
+    # update_fields acepta 'instrumento' o 'instrumento_id'
+    return {CalificacionTributaria._meta.get_field(c).attname for c in campos}
+
+
+def afecta_resumen(campos):
+    """Si un cambio de esas columnas (None = todas) mueve el resumen."""
+    return campos is None or bool(_attnames(campos) & set(CAMPOS_RESUMEN))
+
+
+def _cero(): return [0, Decimal('0'), Decimal('0'), Decimal('0')]
+
+
+def _valor(calif, campo):
+    # Calificación o dict de valores; to_python deja igual lo que viene del POST y de la BD
+    valor = calif.get(campo) if isinstance(calif, dict) else getattr(calif, campo, None)
+    return _CAMPOS[campo].to_python(valor) or 0
+
+
+def _acumular(calificaciones, signo, campos, deltas):
+    for calif in calificaciones:
+        d = deltas[tuple(_valor(calif, c) for c in CAMPOS_GRUPO)]
+        d[0] += signo
+        if 'monto_historico' in campos: d[1] += signo * _valor(calif, 'monto_historico')
+        if 'monto_total' in campos: d[2] += signo * _valor(calif, 'monto_total')
+        d[3] += signo * sum((_valor(calif, c) for c in CAMPOS_BASE if c in campos), Decimal('0'))
+
+
+def actualizar_resumen(anteriores=(), nuevas=(), campos=None):
+    """
+    Aplica al resumen el cambio de 'anteriores' (lo que había) a 'nuevas' (lo
+    que quedó). Son calificaciones o dicts de valores; una creación no trae
+    anteriores y un borrado no trae nuevas. 'campos' limita los totales que se
+    miran (como update_fields): los demás se dan por iguales en ambos lados.
+    Si entre ellos va una columna del grupo se miran todos, porque la fila
+    completa pasa de un grupo a otro.
+    """
+    campos = set(CAMPOS_RESUMEN) if campos is None else _attnames(campos)
+    if campos & set(CAMPOS_GRUPO): campos = set(CAMPOS_RESUMEN)
+    deltas = defaultdict(_cero)
+    _acumular(anteriores, -1, campos, deltas)
+    _acumular(nuevas, 1, campos, deltas)
+
+    mercados = mercados_de_instrumentos({i for _, _, i in deltas})
+    por_grupo = defaultdict(_cero)
+    for (usuario_id, ejercicio, instrumento_id), d in deltas.items():
+        # Instrumento ya borrado (borrado en cascada): su grupo se va con el mercado o queda para reconciliar
+        if instrumento_id not in mercados: continue
+        total = por_grupo[(usuario_id, ejercicio, mercados[instrumento_id])]
+        for i, valor in enumerate(d): total[i] += valor
+    por_grupo = {clave: d for clave, d in por_grupo.items() if any(d)}
+    if por_grupo: _aplicar(por_grupo)
+
+
+def _filtro_grupos(claves, prefijo=''):
+    filtro = Q()
+    for usuario_id, ejercicio, mercado_id in claves:
+        filtro |= Q(usuario_id=usuario_id, ejercicio=ejercicio, **{f'{prefijo}mercado_id': mercado_id})
+    return filtro
+
+
+def _aplicar(deltas):
+    # Dos procesos pueden crear el mismo grupo a la vez: el segundo choca con la
+    # restricción única y reintenta, ahora encontrando la fila del primero
+    for intento in range(2):
+        try:
+            with transaction.atomic():
+                existentes = {
+                    (r.usuario_id, r.ejercicio, r.mercado_id): r
+                    for r in ResumenCalificaciones.objects.select_for_update().filter(_filtro_grupos(deltas))
+                }
+                nuevos, cambiados, vacios = [], [], []
+                for (usuario_id, ejercicio, mercado_id), d in deltas.items():
+                    r = existentes.get((usuario_id, ejercicio, mercado_id))
+                    # Restar de un grupo que no existe pasa en los borrados en cascada de usuario o mercado
+                    if r is None and d[0] <= 0: continue
+                    if r is None:
+                        r = ResumenCalificaciones(usuario_id=usuario_id, ejercicio=ejercicio, mercado_id=mercado_id,
+                                                  monto_historico=Decimal('0'), monto_total=Decimal('0'), suma_bases=Decimal('0'))
+                    for campo, valor in zip(TOTALES, d): setattr(r, campo, getattr(r, campo) + valor)
+                    if r.cantidad == 0: vacios.append(r)
+                    else: (cambiados if r.pk else nuevos).append(r)
+                ResumenCalificaciones.objects.filter(id__in=[r.pk for r in vacios if r.pk]).delete()
+                ResumenCalificaciones.objects.bulk_update(cambiados, TOTALES)
+                ResumenCalificaciones.objects.bulk_create(nuevos)
+            return
+        except IntegrityError:
+            if intento: raise
+
+
+def grupos_de(calificaciones):
+    """Claves (usuario_id, ejercicio, mercado_id) de las calificaciones."""
+    claves = {tuple(_valor(c, campo) for campo in CAMPOS_GRUPO) for c in calificaciones}
+    mercados = mercados_de_instrumentos({i for _, _, i in claves})
+    return {(u, e, mercados[i]) for u, e, i in claves if i in mercados}
+
+
+def calcular_resumen(filas):
+    """Totales por grupo de filas (usuario_id, ejercicio, mercado_id, histórico, total, F08..F19)."""
+    grupos = defaultdict(_cero)
+    for usuario_id, ejercicio, mercado_id, historico, total, *bases in filas:
+        d = grupos[(usuario_id, ejercicio, mercado_id)]
+        d[0] += 1
+        d[1] += historico
+        d[2] += total
+        d[3] += sum(bases, Decimal('0'))
+    return grupos
+
+
+@transaction.atomic
+def reconciliar(corregir=True, grupos=None):
+    """
+    Recalcula el resumen leyendo todas las calificaciones (o solo las de 'grupos',
+    claves (usuario_id, ejercicio, mercado_id)) y lo compara con la tabla.
+    Retorna las diferencias [(clave, guardado, calculado)]; con 'corregir' la
+    tabla queda igual a lo calculado. Suma en Python para que sea exacto
+    también en SQLite, donde SUM de decimales usa punto flotante.
+    """
+    calificaciones, tabla = CalificacionTributaria.objects.all(), ResumenCalificaciones.objects.all()
+    if grupos is not None:
+        if not grupos: return []
+        calificaciones = calificaciones.filter(_filtro_grupos(grupos, prefijo='instrumento__'))
+        tabla = tabla.filter(_filtro_grupos(grupos))
+
+    calculado = calcular_resumen(calificaciones.values_list(
+        'usuario_id', 'ejercicio', 'instrumento__mercado_id', 'monto_historico', 'monto_total', *CAMPOS_BASE,
+    ).iterator(chunk_size=5000))
+    guardado = {(r.usuario_id, r.ejercicio, r.mercado_id): r for r in tabla.select_for_update()}
+
+    diferencias = []
+    for clave in guardado.keys() | calculado.keys():
+        r = guardado.get(clave)
+        antes = [getattr(r, c) for c in TOTALES] if r else _cero()
+        despues = calculado.get(clave, _cero())
+        if antes != despues: diferencias.append((clave, antes, despues))
+
+    if corregir and diferencias:
+        tabla.delete()
+        ResumenCalificaciones.objects.bulk_create(
+            ResumenCalificaciones(usuario_id=u, ejercicio=e, mercado_id=m, **dict(zip(TOTALES, d)))
+            for (u, e, m), d in calculado.items()
+        )
+    return sorted(diferencias)
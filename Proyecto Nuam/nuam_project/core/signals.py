@@ -0,0 +1,66 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from .busqueda import indexar
+from .cache import invalidar_instrumentos
+from .models import CalificacionTributaria, HuellaFila, Instrumento
+from .resumen import CAMPOS_RESUMEN, actualizar_resumen, afecta_resumen, grupos_de, reconciliar
+
+# Escrituras masivas que no pasan por save()/delete() (bulk_create, update, ...).
+# Se envía con listas de calificaciones: creadas=[...], actualizadas=[...], eliminadas=[...].
+# 'campos' (opcional) indica qué columnas cambiaron en las actualizadas, como update_fields, y
+# 'anteriores' sus valores de antes (calificaciones o dicts en el mismo orden) para el resumen.
+# Las eliminadas pueden ser dicts de valores (ver CAMPOS_RESUMEN en core/resumen.py)
+calificaciones_modificadas = Signal()
+
+
+@receiver([post_save, post_delete], sender=Instrumento)
+def instrumento_modificado(sender, **kwargs):
+    # Se invalida de inmediato y otra vez al confirmar, por si alguien
+    # recargó la caché dentro de la misma transacción
+    invalidar_instrumentos()
+    transaction.on_commit(invalidar_instrumentos)
+
+
+@receiver(pre_save, sender=CalificacionTributaria)
+def calificacion_por_guardar(sender, instance, **kwargs):
+    # El resumen resta los valores anteriores: si la instancia no se leyó completa de la BD, se completan
+    original = getattr(instance, '_estado_original', {})
+    if not instance._state.adding and not original.keys() >= set(CAMPOS_RESUMEN):
+        anteriores = CalificacionTributaria.objects.filter(pk=instance.pk).values(*CAMPOS_RESUMEN).first()
+        instance._estado_original = {**(anteriores or {}), **original}
+
+
+@receiver(post_save, sender=CalificacionTributaria)
+def calificacion_guardada(sender, instance, created, update_fields=None, **kwargs):
+    # Los tokens salen del RUT y la descripción; al borrar se van en cascada
+    if created or update_fields is None or {'rut_propietario', 'descripcion'} & set(update_fields):
+        indexar([instance], nuevas=created)
+    if created:
+        actualizar_resumen(nuevas=[instance])
+        return
+    # La calificación ya no es la fila que se cargó: la misma fila en otra carga debe volver a procesarse
+    HuellaFila.objects.filter(calificacion=instance).delete()
+    if afecta_resumen(update_fields):
+        actualizar_resumen([instance._estado_original], [instance], campos=update_fields)
+
+
+@receiver(post_delete, sender=CalificacionTributaria)
+def calificacion_eliminada(sender, instance, **kwargs):
+    actualizar_resumen(anteriores=[instance])
+
+
+@receiver(calificaciones_modificadas)
+def calificaciones_modificadas_en_bloque(sender, creadas=(), actualizadas=(), eliminadas=(), campos=None, anteriores=None, **kwargs):
+    if creadas:
+        indexar(creadas, nuevas=True)
+        actualizar_resumen(nuevas=creadas)
+    if actualizadas: HuellaFila.objects.filter(calificacion__in=[c.pk for c in actualizadas]).delete()
+    if actualizadas and (campos is None or {'rut_propietario', 'descripcion'} & set(campos)):
+        indexar(actualizadas)
+    if actualizadas and afecta_resumen(campos):
+        if anteriores is not None: actualizar_resumen(anteriores, actualizadas, campos=campos)
+        # Sin los valores anteriores no hay delta: se recalculan los grupos afectados
+        else: reconciliar(grupos=grupos_de(actualizadas))
+    if eliminadas: actualizar_resumen(anteriores=eliminadas)
@@ -1,3 +1,1076 @@
-from django.test import TestCase
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import io
+import random
+import tempfile
+import zipfile
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+import pandas as pd
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from benchmarks.datos import VARIANTES_CARGA, archivo_carga
+from benchmarks.suite import comparar
+
+from .busqueda import buscar, tokenizar
+from .cache import invalidar_instrumentos, listar_instrumentos, resolver_instrumentos
+from .certificado import _armar, certificado_para
+from .emision import emitir_certificados
+from .exportacion import ENCABEZADOS, parquet_disponible
+from .factores import MatrizFactores, a_entero, calcular_factores, calcular_factores_lote, calcular_monto_total
+from .models import (
+    CalificacionTributaria, HuellaFila, Instrumento, Mercado, OperacionMasiva, ResumenCalificaciones, TokenBusqueda, TrabajoCarga,
+)
+from .operaciones import aplicar
+from .paginacion import paginar_keyset
+from .recalculo import filtrar, recalcular_montos
+from .rendimiento import estadisticas, medir, reiniciar
+from .resumen import reconciliar
+from .trabajos import MAX_INTENTOS, TRABAJO_VENCIDO, ejecutar_trabajo, tomar_siguiente_trabajo
+from .utils import MUESTRA_BYTES, procesar_carga_masiva
+from .validacion import planificar_columnas, validar_bloque
+
+
+def archivo_csv(lineas, nombre='carga.csv', encoding='utf-8'):
+    return SimpleUploadedFile(nombre, '\n'.join(lineas).encode(encoding))
+
+
+class CargaMasivaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('corredor', password='x')
+        mercado = Mercado.objects.create(codigo='BCS', nombre='Bolsa de Santiago')
+        cls.inst = Instrumento.objects.create(mercado=mercado, codigo='CHILE', nombre='Banco de Chile')
+
+    def setUp(self):
+        # La caché es del proceso y no ve el rollback entre tests
+        invalidar_instrumentos()
+
+    def test_carga_con_historico_factor_y_factores(self):
+        guardados, errores = procesar_carga_masiva(archivo_csv([
+            'RUT;INSTRUMENTO;FECHA PAGO;MONTO HISTORICO;FACTOR ACTUALIZACION;F08;F25',
+            '11111111-1;chile;15-03-2025;1000;1,0155;0,5;0,123456',
+            '22222222-2;CHILE;2025-04-30;;;;',
+        ]), self.usuario)
+
+        self.assertEqual((guardados, errores), (2, []))
+        primero, segundo = CalificacionTributaria.objects.order_by('id')
+        self.assertEqual(primero.instrumento, self.inst)
+        self.assertEqual(primero.rut_propietario, '11111111-1')
+        self.assertEqual(primero.fecha_pago, date(2025, 3, 15))
+        self.assertEqual(primero.monto_total, Decimal('1015.50'))
+        self.assertEqual(primero.factor_08, Decimal('0.5'))
+        self.assertEqual(primero.factor_25, Decimal('0.123456'))
+        self.assertEqual(primero.origen, 'Carga Masiva')
+        self.assertEqual(segundo.fecha_pago, date(2025, 4, 30))
+        self.assertEqual(segundo.monto_historico, Decimal('0'))
+        self.assertEqual(segundo.factor_actualizacion, Decimal('1'))
+
+    def test_solo_monto_total_asume_factor_uno(self):
+        guardados, _ = procesar_carga_masiva(archivo_csv([
+            'INSTRUMENTO,MONTO TOTAL',
+            'CHILE,2500.456',
+        ]), self.usuario)
+
+        calif = CalificacionTributaria.objects.get()
+        self.assertEqual(guardados, 1)
+        self.assertEqual(calif.monto_historico, Decimal('2500.46'))
+        self.assertEqual(calif.monto_total, Decimal('2500.46'))
+        self.assertEqual(calif.factor_actualizacion, Decimal('1'))
+
+    def test_errores_por_fila_y_filas_vacias(self):
+        guardados, errores = procesar_carga_masiva(archivo_csv([
+            'INSTRUMENTO;MONTO HISTORICO;FECHA',
+            'NOEXISTE;100;01-01-2025',
+            ';100;01-01-2025',
+            'CHILE;abc;fecha mala',
+            'noexiste;100;01-01-2025',
+        ], encoding='iso-8859-1'), self.usuario)
+
+        self.assertEqual(guardados, 1)
+        self.assertEqual(errores, ["Instrumento 'NOEXISTE' no existe (filas 2, 5)."])
+        calif = CalificacionTributaria.objects.get()
+        self.assertIsNone(calif.fecha_pago)
+        self.assertEqual(calif.monto_total, Decimal('0'))
+
+    def test_bloques_mantienen_numeracion_de_filas(self):
+        lineas = ['INSTRUMENTO;SECUENCIA;MONTO HISTORICO;DESCRIPCION']
+        lineas += [f'CHILE;{i};100;Año' if i != 6 else 'OTRO;6;100;x' for i in range(9)]
+        lineas.append('otro;9;1;ñandú')
+        guardados, errores = procesar_carga_masiva(
+            archivo_csv(lineas, encoding='iso-8859-1'), self.usuario, tamano_lote=2, tamano_bloque=4)
+
+        self.assertEqual(guardados, 8)
+        self.assertEqual(errores, ["Instrumento 'OTRO' no existe (filas 8, 11)."])
+
+    def test_latin1_con_acentos_despues_de_la_muestra(self):
+        lineas = ['INSTRUMENTO;SECUENCIA;MONTO HISTORICO;DESCRIPCION']
+        lineas += [f'CHILE;{i};100;Dividendo definitivo' for i in range(3000)]
+        lineas.append('CHILE;3000;100;Distribución única')
+        archivo = archivo_csv(lineas, encoding='iso-8859-1')
+        self.assertGreater(archivo.size - len('Distribución única\n'), MUESTRA_BYTES)
+
+        guardados, errores = procesar_carga_masiva(archivo, self.usuario)
+        self.assertEqual((guardados, errores), (3001, []))
+        self.assertEqual(CalificacionTributaria.objects.get(secuencia=3000).descripcion, 'Distribución única')
+
+    def test_xlsx_por_filas(self):
+        libro = openpyxl.Workbook()
+        hoja = libro.active
+        hoja.append(['Instrumento', 'Fecha Pago', 'Monto Historico', 'F10'])
+        hoja.append(['chile', datetime(2025, 5, 3), 2000, 0.25])
+        hoja.append(['CHILE', '02-05-2025', 3000])
+        contenido = io.BytesIO()
+        libro.save(contenido)
+
+        guardados, errores = procesar_carga_masiva(
+            SimpleUploadedFile('carga.xlsx', contenido.getvalue()), self.usuario, tamano_bloque=1)
+
+        self.assertEqual((guardados, errores), (2, []))
+        primero, segundo = CalificacionTributaria.objects.order_by('id')
+        self.assertEqual(primero.factor_10, Decimal('0.25'))
+        self.assertEqual(segundo.fecha_pago, date(2025, 5, 2))
+        self.assertEqual(segundo.monto_total, Decimal('3000'))
+
+    def test_validacion_en_paralelo_igual_que_en_serie(self):
+        lineas = ['INSTRUMENTO;SECUENCIA;MONTO HISTORICO;FACTOR ACTUALIZACION;F08']
+        lineas += [f'CHILE;{i};{100 + i};1,{i:06d};0,{i:06d}' for i in range(40)]
+        valores = lambda: list(CalificacionTributaria.objects.order_by('id').values_list(
+            'monto_historico', 'factor_actualizacion', 'monto_total', 'factor_08'))
+
+        procesar_carga_masiva(archivo_csv(lineas), self.usuario, tamano_bloque=7, procesos=1)
+        en_serie = valores()
+        CalificacionTributaria.objects.all().delete()
+        guardados, errores = procesar_carga_masiva(archivo_csv(lineas), self.usuario, tamano_bloque=7, procesos=2)
+
+        self.assertEqual((guardados, errores), (40, []))
+        self.assertEqual(valores(), en_serie)
+
+    def test_recarga_en_modo_actualizar(self):
+        lineas = [
+            'RUT;INSTRUMENTO;FECHA PAGO;SECUENCIA;MONTO HISTORICO;F08',
+            '11111111-1;CHILE;15-03-2025;1;1000;0,5',
+            '11111111-1;CHILE;15-03-2025;2;2000;0,5',
+            '22222222-2;CHILE;15-03-2025;1;3000;0,5',
+        ]
+        procesar_carga_masiva(archivo_csv(lineas), self.usuario)
+
+        conteo = {}
+        guardados, errores = procesar_carga_masiva(archivo_csv(lineas), self.usuario, modo='actualizar', conteo=conteo)
+        self.assertEqual((guardados, errores), (0, []))
+        self.assertEqual(conteo, {'insertados': 0, 'actualizados': 0, 'sin_cambios': 3, 'huellas': 3})
+
+        lineas[2] = '11111111-1;CHILE;15-03-2025;2;2500;0,5'
+        lineas.append('33333333-3;CHILE;15-03-2025;1;4000;0,5')
+        conteo = {}
+        guardados, errores = procesar_carga_masiva(archivo_csv(lineas), self.usuario, modo='actualizar', conteo=conteo)
+        self.assertEqual((guardados, errores), (2, []))
+        self.assertEqual(conteo, {'insertados': 1, 'actualizados': 1, 'sin_cambios': 2, 'huellas': 4})
+        self.assertEqual(CalificacionTributaria.objects.count(), 4)
+        self.assertEqual(CalificacionTributaria.objects.get(secuencia=2).monto_total, Decimal('2500'))
+        self.assertEqual(reconciliar(corregir=False), [])
+
+    def test_filas_sin_fecha_se_actualizan_por_el_resto_de_la_clave(self):
+        lineas = ['RUT;INSTRUMENTO;SECUENCIA;MONTO HISTORICO', '1-9;CHILE;1;1000', '1-9;CHILE;2;2000']
+        procesar_carga_masiva(archivo_csv(lineas), self.usuario)
+
+        lineas[1] = '1-9;CHILE;1;1500'
+        conteo = {}
+        guardados, errores = procesar_carga_masiva(archivo_csv(lineas), self.usuario, modo='actualizar', conteo=conteo)
+        self.assertEqual((guardados, errores, conteo['actualizados']), (1, [], 1))
+        self.assertEqual(sorted(CalificacionTributaria.objects.values_list('monto_historico', flat=True)),
+                         [Decimal('1500'), Decimal('2000')])
+
+        guardados, errores = procesar_carga_masiva(archivo_csv([lineas[0], '1-9;CHILE;1;900']), self.usuario)
+        self.assertEqual(errores, ['Fila 2 (CHILE): ya existe en la base (use el modo actualizar para reemplazarla)'])
+
+    def test_modo_insertar_informa_claves_existentes(self):
+        lineas = ['RUT;INSTRUMENTO;FECHA PAGO;MONTO HISTORICO', '1-9;CHILE;15-03-2025;1000']
+        procesar_carga_masiva(archivo_csv(lineas), self.usuario)
+
+        guardados, errores = procesar_carga_masiva(archivo_csv(lineas + ['1-9;CHILE;15-03-2025;900']), self.usuario)
+
+        self.assertEqual(guardados, 0)
+        # La fila 2 es idéntica a la cargada (registro de huellas) y no es error
+        self.assertEqual(errores, ['Fila 3 (CHILE): ya existe en la base (use el modo actualizar para reemplazarla)'])
+        self.assertEqual(CalificacionTributaria.objects.get().monto_historico, Decimal('1000'))
+
+    def test_quitar_duplicados_simula_renumera_y_borra(self):
+        salida = io.StringIO()
+        call_command('quitar_duplicados', stdout=salida)
+        self.assertIn('Sin claves repetidas', salida.getvalue())
+
+        # La restricción no deja crear claves repetidas: se simula que 'b' repite la de 'a'
+        datos = dict(usuario=self.usuario, instrumento=self.inst, fecha_pago=date(2025, 3, 15), factor_actualizacion=Decimal('1'))
+        a = CalificacionTributaria.objects.create(secuencia=0, **datos)
+        b = CalificacionTributaria.objects.create(secuencia=4, monto_historico=Decimal('10'), **datos)
+        clave = (self.usuario.id, a.rut_propietario, self.inst.id, a.ejercicio, a.fecha_pago, 0)
+        with mock.patch('core.management.commands.quitar_duplicados.repetidas', return_value=[(clave, [b.id, a.id])]):
+            call_command('quitar_duplicados', simular=True, renumerar=True, stdout=io.StringIO())
+            self.assertEqual(CalificacionTributaria.objects.get(id=a.id).secuencia, 0)
+            call_command('quitar_duplicados', renumerar=True, stdout=io.StringIO())
+            self.assertEqual(CalificacionTributaria.objects.get(id=a.id).secuencia, 5)
+            call_command('quitar_duplicados', stdout=io.StringIO())
+        self.assertEqual(list(CalificacionTributaria.objects.values_list('id', flat=True)), [b.id])
+        self.assertEqual(reconciliar(corregir=False), [])
+
+    def test_archivo_sin_columna_instrumento(self):
+        guardados, errores = procesar_carga_masiva(archivo_csv([
+            'RUT;MONTO',
+            '1-9;100',
+        ]), self.usuario)
+
+        self.assertEqual(guardados, 0)
+        self.assertEqual(errores, ['Error archivo: No se encontró columna de Instrumento'])
+
+
+class PlanColumnasTests(TestCase):
+    def test_factor_numerado_no_se_confunde_con_factor_actualizacion(self):
+        plan = planificar_columnas(['FACTOR 08', 'NEMO', 'FACTOR ACTUALIZACION', 'MONTO HISTORICO', 'MONTO TOTAL', 'F09'])
+
+        self.assertEqual(plan.factores[:2], (0, 5))
+        self.assertEqual((plan.instrumento, plan.factor, plan.historico, plan.total), (1, 2, 3, 4))
+        self.assertEqual(plan.ambiguedades, ())
+
+    def test_registra_ambiguedades(self):
+        plan = planificar_columnas(['INSTRUMENTO', 'FECHA PAGO', 'FECHA CORTE'])
+
+        self.assertEqual(plan.fecha, 1)
+        self.assertEqual(plan.ambiguedades, ("'fecha' calza con FECHA PAGO, FECHA CORTE (se usa FECHA PAGO)",))
+
+    def test_validar_bloque_es_puro(self):
+        df = pd.DataFrame({'NEMO': ['chile', None, 'X'], 'MONTO': ['10,5', '1', 'abc'], 'F37': ['0,25', '', None]})
+        datos = validar_bloque(df, planificar_columnas(df.columns))
+
+        self.assertEqual(list(datos.index), [0, 2])
+        self.assertEqual(list(datos['monto_total']), [Decimal('10.50'), Decimal('0.00')])
+        self.assertEqual(list(datos['factor_37']), [Decimal('0.25'), Decimal('0')])
+
+    def test_preview_no_guarda_nada(self):
+        User.objects.create_user('corredor', password='x')
+        self.client.login(username='corredor', password='x')
+        respuesta = self.client.post(reverse('carga_masiva_preview'), {'archivo_excel': archivo_csv([
+            'NEMO;RUT;F08;OTRA',
+            'CHILE;1-9;0,1;x',
+        ])})
+
+        data = respuesta.json()['data']
+        self.assertEqual(data['columnas']['instrumento'], 'NEMO')
+        self.assertEqual(data['factores']['F08'], 'F08')
+        self.assertEqual(data['sin_usar'], ['OTRA'])
+        self.assertEqual(data['filas'], [['CHILE', '1-9', '0,1', 'x']])
+        self.assertFalse(CalificacionTributaria.objects.exists())
+
+
+class CacheInstrumentosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mercado = Mercado.objects.create(codigo='BCS', nombre='Bolsa de Santiago')
+        cls.inst = Instrumento.objects.create(mercado=cls.mercado, codigo='Falabella', nombre='Falabella')
+
+    def setUp(self):
+        invalidar_instrumentos()
+
+    def test_resuelve_sin_mayusculas_y_reutiliza_la_cache(self):
+        # Carga de la caché + una consulta para los códigos que no estaban
+        with self.assertNumQueries(2):
+            mapa, desconocidos = resolver_instrumentos(['falabella', 'FALABELLA', 'otro'])
+        self.assertEqual(mapa, {'FALABELLA': self.inst})
+        self.assertEqual(desconocidos, ['OTRO'])
+
+        with self.assertNumQueries(0):
+            resolver_instrumentos(['Falabella'])
+            listar_instrumentos()
+
+    def test_se_invalida_al_guardar_y_eliminar(self):
+        listar_instrumentos()
+        nuevo = Instrumento.objects.create(mercado=self.mercado, codigo='COPEC', nombre='Copec')
+        self.assertIn(nuevo, listar_instrumentos())
+        nuevo.delete()
+        self.assertEqual(listar_instrumentos(), [self.inst])
+
+
+class TrabajoCargaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('corredor', password='x')
+        mercado = Mercado.objects.create(codigo='BCS', nombre='Bolsa de Santiago')
+        Instrumento.objects.create(mercado=mercado, codigo='CHILE', nombre='Banco de Chile')
+
+    def setUp(self):
+        invalidar_instrumentos()
+        self.client.login(username='corredor', password='x')
+        directorio = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=directorio))
+
+    def test_encola_y_el_worker_procesa(self):
+        respuesta = self.client.post(reverse('carga_masiva'), {'archivo_excel': archivo_csv([
+            'INSTRUMENTO;MONTO HISTORICO', 'CHILE;100', 'NADA;5',
+        ])}, headers={'x-requested-with': 'XMLHttpRequest'})
+
+        trabajo = TrabajoCarga.objects.get(id=respuesta.json()['id'])
+        self.assertEqual(trabajo.estado, 'pendiente')
+        self.assertFalse(CalificacionTributaria.objects.exists())
+
+        call_command('procesar_cargas', '--una-vez', stdout=io.StringIO())
+
+        estado = self.client.get(respuesta.json()['url_estado']).json()['data']
+        self.assertEqual(estado['estado'], 'terminado')
+        self.assertEqual((estado['filas_procesadas'], estado['guardados'], estado['cantidad_errores']), (2, 1, 1))
+        self.assertEqual(CalificacionTributaria.objects.count(), 1)
+        trabajo.refresh_from_db()
+        self.assertFalse(trabajo.archivo)
+
+    def test_trabajo_abandonado_se_retoma_y_luego_falla(self):
+        respuesta = self.client.post(reverse('carga_masiva'), {'archivo_excel': archivo_csv([
+            'INSTRUMENTO;MONTO HISTORICO', 'CHILE;100',
+        ])}, headers={'x-requested-with': 'XMLHttpRequest'})
+        trabajo = TrabajoCarga.objects.get(id=respuesta.json()['id'])
+        self.assertEqual(tomar_siguiente_trabajo(), trabajo)
+        # El worker muere: con latido reciente nadie más lo toma
+        self.assertIsNone(tomar_siguiente_trabajo())
+
+        TrabajoCarga.objects.filter(id=trabajo.id).update(actualizado_en=timezone.now() - TRABAJO_VENCIDO - timedelta(seconds=1))
+        with self.assertLogs('core.trabajos', 'WARNING'):
+            retomado = tomar_siguiente_trabajo()
+        self.assertEqual((retomado, retomado.estado, retomado.intentos), (trabajo, 'procesando', 2))
+        self.assertEqual(ejecutar_trabajo(retomado).estado, 'terminado')
+
+        TrabajoCarga.objects.filter(id=trabajo.id).update(estado='procesando', intentos=MAX_INTENTOS, actualizado_en=None)
+        with self.assertLogs('core.trabajos', 'ERROR'):
+            self.assertIsNone(tomar_siguiente_trabajo())
+        trabajo.refresh_from_db()
+        self.assertEqual((trabajo.estado, trabajo.cantidad_errores), ('fallido', 1))
+
+    def test_estado_de_carga_ajena(self):
+        otro = User.objects.create_user('otro', password='x')
+        trabajo = TrabajoCarga.objects.create(usuario=otro, nombre_archivo='x.csv')
+
+        respuesta = self.client.get(reverse('estado_carga', args=[trabajo.id]))
+        self.assertEqual(respuesta.json()['status'], 'error')
+
+    def test_archivo_repetido_no_se_vuelve_a_procesar(self):
+        lineas = ['RUT;INSTRUMENTO;FECHA PAGO;MONTO HISTORICO', '1-9;CHILE;15-03-2025;100', '2-7;CHILE;15-03-2025;200']
+        subir = lambda lineas: TrabajoCarga.objects.get(id=self.client.post(
+            reverse('carga_masiva'), {'archivo_excel': archivo_csv(lineas)}, headers={'x-requested-with': 'XMLHttpRequest'},
+        ).json()['id'])
+        primero = subir(lineas)
+        call_command('procesar_cargas', '--una-vez', stdout=io.StringIO())
+        primero.refresh_from_db()
+        self.assertEqual((primero.insertados, primero.huellas, len(primero.sha256)), (2, 2, 64))
+
+        repetido = subir(lineas)
+        self.assertEqual((repetido.estado, repetido.duplicado_de, repetido.sin_cambios), ('terminado', primero, 2))
+        self.assertFalse(repetido.archivo)
+
+        # Las mismas filas en otro orden (otro SHA-256) se omiten todas, y esa carga también queda como completa
+        reordenadas = [lineas[0], lineas[2], lineas[1]]
+        segundo = subir(reordenadas)
+        call_command('procesar_cargas', '--una-vez', stdout=io.StringIO())
+        segundo.refresh_from_db()
+        self.assertEqual((segundo.sin_cambios, segundo.huellas), (2, 2))
+        self.assertEqual(subir(reordenadas).duplicado_de, segundo)
+        self.assertEqual(set(HuellaFila.objects.values_list('trabajo', flat=True)), {primero.id})
+
+        # Una calificación editada sale del registro: con el mismo archivo ya no basta el SHA-256
+        calif = CalificacionTributaria.objects.get(rut_propietario='2-7')
+        calif.monto_historico = Decimal('250')
+        calif.save()
+        reproceso = subir(lineas)
+        self.assertIsNone(reproceso.duplicado_de)
+        call_command('procesar_cargas', '--una-vez', stdout=io.StringIO())
+
+        # Los errores de filas que ya existen dicen qué carga las dejó así, aunque otras las hayan omitido después
+        tercero = subir([lineas[0], '1-9;CHILE;15-03-2025;150'])
+        call_command('procesar_cargas', '--una-vez', stdout=io.StringIO())
+        tercero.refresh_from_db()
+        self.assertEqual(tercero.errores, [
+            f'Fila 2 (CHILE): ya existe en la carga #{primero.id} (use el modo actualizar para reemplazarla)',
+        ])
+
+
+class RendimientoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('corredor', password='x')
+        cls.admin = User.objects.create_superuser('admin', password='x')
+        mercado = Mercado.objects.create(codigo='BCS', nombre='Bolsa de Santiago')
+        inst = Instrumento.objects.create(mercado=mercado, codigo='CHILE', nombre='Banco de Chile')
+        cls.calif = CalificacionTributaria.objects.create(usuario=cls.usuario, instrumento=inst, factor_actualizacion=Decimal('1'))
+
+    def setUp(self):
+        invalidar_instrumentos()
+        caches['detalle'].clear()
+        reiniciar()
+
+    @override_settings(RENDIMIENTO_PRESUPUESTOS={'obtener_detalle': 1})
+    def test_middleware_mide_y_avisa_presupuesto(self):
+        self.client.login(username='corredor', password='x')
+        with self.assertLogs('core.rendimiento', 'WARNING') as logs:
+            respuesta = self.client.get(reverse('obtener_detalle', args=[self.calif.id]))
+        self.assertIn('obtener_detalle hizo', logs.output[0])
+        self.assertIn('bd;dur=', respuesta['Server-Timing'])
+        self.assertEqual(self.client.get(reverse('rendimiento_api')).status_code, 403)
+
+        self.client.login(username='admin', password='x')
+        vistas = self.client.get(reverse('rendimiento_api')).json()['vistas']
+        self.assertEqual((vistas['obtener_detalle']['n'], vistas['obtener_detalle']['excedidos']), (1, 1))
+        self.assertGreater(vistas['obtener_detalle']['consultas_max'], 1)
+
+    def test_rutas_sin_vista_no_agregan_nombres(self):
+        for i in range(3): self.client.get(f'/no-existe/{i}/')
+        self.assertEqual(estadisticas()['sin_ruta']['n'], 3)
+        with mock.patch('core.rendimiento.MAX_NOMBRES', 2):
+            for nombre in ('a', 'b'):
+                with medir(nombre): pass
+        self.assertEqual(set(estadisticas()), {'sin_ruta', 'a', 'otros'})
+
+    def test_sin_resource_no_informa_memoria_del_proceso(self):
+        # Windows no tiene el módulo 'resource'
+        with mock.patch('core.rendimiento.resource', None):
+            with medir('x') as medicion: pass
+            self.assertIsNone(medicion.como_dict()['memoria_proceso_mb'])
+
+    def test_etapas_de_la_carga_masiva(self):
+        with medir('carga') as medicion:
+            procesar_carga_masiva(archivo_csv(['INSTRUMENTO;MONTO HISTORICO', 'CHILE;100']), self.usuario)
+
+        self.assertEqual(set(medicion.etapas), {'lectura', 'columnas', 'validacion', 'escritura'})
+        self.assertGreater(medicion.etapas['escritura'][1], 0)
+        self.assertEqual(medicion.etapas['lectura'][1], 0)
+        self.assertGreaterEqual(medicion.consultas, medicion.etapas['escritura'][1])
+
+
+class DetalleCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('corredor', password='x')
+        User.objects.create_user('otro', password='x')
+        mercado = Mercado.objects.create(codigo='BCS', nombre='Bolsa de Santiago')
+        inst = Instrumento.objects.create(mercado=mercado, codigo='CHILE', nombre='Banco de Chile')
+        cls.calif = CalificacionTributaria.objects.create(usuario=cls.usuario, instrumento=inst, descripcion='antes',
+                                                          factor_actualizacion=Decimal('1'))
+
+    def setUp(self):
+        caches['detalle'].clear()
+        self.client.login(username='corredor', password='x')
+        self.url = reverse('obtener_detalle', args=[self.calif.id])
+
+    def test_repetir_con_etag_responde_304_con_una_consulta_liviana(self):
+        primera = self.client.get(self.url)
+        self.assertEqual(primera.json()['data']['descripcion'], 'antes')
+        with CaptureQueriesContext(connection) as consultas:
+            segunda = self.client.get(self.url, headers={'If-None-Match': primera['ETag']})
+        self.assertEqual((segunda.status_code, segunda['ETag']), (304, primera['ETag']))
+        leidas = [q['sql'] for q in consultas.captured_queries if 'core_calificaciontributaria' in q['sql']]
+        self.assertEqual(len(leidas), 1)
+        self.assertNotIn('descripcion', leidas[0])
+
+    def test_cambios_sin_senal_se_ven_por_updated_at(self):
+        etag = self.client.get(self.url)['ETag']
+        self.calif.descripcion = 'despues'
+        self.calif.save()
+        respuesta = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual((respuesta.status_code, respuesta.json()['data']['descripcion']), (200, 'despues'))
+
+        # Como lo haría otro proceso: sin señales, solo cambia updated_at en la BD
+        CalificacionTributaria.objects.filter(id=self.calif.id).update(descripcion='en bloque', updated_at=timezone.now())
+        self.assertEqual(self.client.get(self.url).json()['data']['descripcion'], 'en bloque')
+
+        self.calif.delete()
+        self.assertEqual(self.client.get(self.url).json()['status'], 'error')
+
+    def test_otro_usuario_no_lee_la_cache(self):
+        self.client.get(self.url)
+        self.client.login(username='otro', password='x')
+        self.assertEqual(self.client.get(self.url).json()['status'], 'error')
+
+
+class OperacionesMasivasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.corredor = User.objects.create_user('corredor', password='x')
+        cls.otro = User.objects.create_user('otro', password='x')
+        mercado = Mercado.objects.create(codigo='BCS', nombre='Bolsa de Santiago')
+        cls.inst = Instrumento.objects.create(mercado=mercado, codigo='CHILE', nombre='Banco de Chile')
+        cls.califs = [
+            CalificacionTributaria.objects.create(
+                usuario=cls.corredor, instrumento=cls.inst, ejercicio=2024, secuencia=i, fecha_pago=date(2024, 5, i + 1),
+                descripcion='dividendo eventual', monto_historico=Decimal('1000'), factor_actualizacion=Decimal('1'),
+            ) for i in range(4)
+        ]
+        # Mismo dividendo que califs[2] pero de otro corredor: reasignar califs[2] a 'otro' choca con la clave natural
+        CalificacionTributaria.objects.create(usuario=cls.otro, instrumento=cls.inst, ejercicio=2024, secuencia=2, fecha_pago=date(2024, 5, 3),
+                                              monto_historico=Decimal('1'), factor_actualizacion=Decimal('1'))
+
+    def setUp(self):
+        invalidar_instrumentos()
+
+    def del_corredor(self):
+        return CalificacionTributaria.objects.filter(usuario=self.corredor)
+
+    def test_eliminar_por_lotes_limpia_tokens_huellas_y_resumen(self):
+        HuellaFila.objects.create(usuario=self.corredor, huella='x' * 32, calificacion=self.califs[1])
+        r = aplicar('eliminar', self.del_corredor().filter(secuencia__gte=1), autor=self.corredor, tamano_lote=2)
+
+        self.assertEqual((r.estado, r.revisadas, r.afectadas), ('terminado', 3, 3))
+        self.assertEqual(list(self.del_corredor().values_list('id', flat=True)), [self.califs[0].id])
+        self.assertFalse(HuellaFila.objects.exists())
+        self.assertFalse(TokenBusqueda.objects.filter(calificacion_id__in=[c.id for c in self.califs[1:]]).exists())
+        self.assertEqual(reconciliar(corregir=False), [])
+
+    def test_eliminar_no_hace_consultas_por_fila(self):
+        # Las consultas de un lote no dependen de cuántas filas tiene (sin post_delete por fila)
+        listar_instrumentos()  # el resumen lee los mercados de la caché de instrumentos
+        with CaptureQueriesContext(connection) as una:
+            aplicar('eliminar', self.del_corredor().filter(secuencia=0))
+        with CaptureQueriesContext(connection) as dos:
+            aplicar('eliminar', self.del_corredor().filter(secuencia__in=[1, 2]))
+        self.assertEqual(list(self.del_corredor().values_list('secuencia', flat=True)), [3])
+        self.assertEqual(len(dos), len(una))
+        self.assertEqual(reconciliar(corregir=False), [])
+
+    def test_error_inesperado_deja_la_operacion_fallida(self):
+        with mock.patch.dict('core.operaciones._ESCRIBIR', {'ejercicio': mock.Mock(side_effect=OperationalError('database is locked'))}):
+            with self.assertRaises(OperationalError):
+                aplicar('ejercicio', self.del_corredor(), valor='2025', tamano_lote=2)
+        registro = OperacionMasiva.objects.get()
+        self.assertEqual((registro.estado, registro.afectadas), ('fallido', 0))
+        self.assertIn('OperationalError: database is locked', registro.error)
+        self.assertIsNotNone(registro.terminado_en)
+
+    def test_cambiar_factor_recalcula_el_monto(self):
+        r = aplicar('factor', self.del_corredor(), valor='1,5', tamano_lote=3)
+        self.assertEqual((r.afectadas, r.filtros), (4, {}))
+        self.assertEqual(set(self.del_corredor().values_list('monto_total', flat=True)), {Decimal('1500.00')})
+        self.assertEqual(aplicar('factor', self.del_corredor(), valor='1.5').afectadas, 0)
+        self.assertEqual(reconciliar(corregir=False), [])
+        with self.assertRaises(ValueError):
+            aplicar('factor', self.del_corredor(), valor='-1')
+
+    def test_reasignar_que_choca_queda_fallida_con_lo_anterior(self):
+        r = aplicar('reasignar', self.del_corredor().filter(secuencia__lte=2), valor='otro', tamano_lote=1)
+        self.assertEqual((r.estado, r.afectadas, r.ultimo_id), ('fallido', 2, self.califs[1].id))
+        self.assertIn('clave natural', r.error)
+        # El lote de califs[2] se deshizo; califs[3] no estaba en el filtro
+        self.assertEqual(list(self.del_corredor().values_list('secuencia', flat=True).order_by('id')), [2, 3])
+        self.assertEqual(reconciliar(corregir=False), [])
+        self.assertEqual(OperacionMasiva.objects.get().estado, 'fallido')
+
+    def test_mantenedor_aplica_a_las_filas_marcadas_del_usuario(self):
+        self.client.login(username='otro', password='x')
+        ids = ','.join(str(c.id) for c in CalificacionTributaria.objects.all())
+        self.client.post(reverse('operacion_masiva'), {'operacion': 'ejercicio', 'valor': '2025', 'ids': ids})
+        self.assertEqual(CalificacionTributaria.objects.filter(ejercicio=2025).get().usuario, self.otro)
+        self.client.post(reverse('operacion_masiva'), {'operacion': 'reasignar', 'valor': 'otro', 'ejercicio': '2024'})
+        self.assertEqual(self.del_corredor().count(), 4)
+
+    def test_comando_simula_y_aplica_por_filtros(self):
+        salida = io.StringIO()
+        call_command('operacion_masiva', 'ejercicio', valor='2030', usuario='corredor', simular=True, stdout=salida)
+        self.assertIn('4 cambiarían', salida.getvalue())
+        self.assertFalse(OperacionMasiva.objects.exists())
+        call_command('operacion_masiva', 'eliminar', ids=[self.califs[0].id], autor='corredor', stdout=io.StringIO())
+        self.assertEqual(OperacionMasiva.objects.get().usuario, self.corredor)
+        with self.assertRaises(CommandError):
+            call_command('operacion_masiva', 'eliminar', stdout=io.StringIO())
+
+
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        mercado = Mercado.objects.create(codigo='BCS', nombre='Bolsa de Santiago')
+        Instrumento.objects.bulk_create(Instrumento(mercado=mercado, codigo=f'INST{i}', nombre='x') for i in range(3))
+
+    def setUp(self):
+        invalidar_instrumentos()
+
+    def test_variantes_de_archivo_cargan_lo_mismo(self):
+        cargado = []
+        for nombre, extension, argumentos in VARIANTES_CARGA:
+            usuario = User.objects.create_user(nombre)
+            contenido = archivo_carga(20, ['INST0', 'INST1', 'INST2'], **argumentos)
+            guardados, errores = procesar_carga_masiva(SimpleUploadedFile(f'b.{extension}', contenido), usuario)
+            self.assertEqual((guardados, errores), (20, []), nombre)
+            cargado.append(list(CalificacionTributaria.objects.filter(usuario=usuario).order_by('secuencia').values_list(
+                'rut_propietario', 'fecha_pago', 'descripcion', 'monto_total', 'factor_08', 'factor_37')))
+        self.assertTrue(all(filas == cargado[0] for filas in cargado))
+
+    def test_comparar_con_linea_base(self):
+        base = {'resultados': {'a': {'mediana_ms': 100}, 'b': {'mediana_ms': 100}, 'c': {'mediana_ms': 100}}}
+        actual = {'resultados': {'a': {'mediana_ms': 105}, 'b': {'mediana_ms': 130}, 'c': {'mediana_ms': 50}, 'd': {'mediana_ms': 1}}}
+        self.assertEqual([(clave, estado) for clave, *_, estado in comparar(actual, base, 0.1)],
+                         [('a', 'igual'), ('b', 'lento'), ('c', 'rapido')])
+
+
+class PaginacionMantenedorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('corredor', password='x')
+        bcs = Mercado.objects.create(codigo='BCS', nombre='Bolsa de Santiago')
+        otro = Mercado.objects.create(codigo='BVL', nombre='Bolsa de Lima')
+        chile = Instrumento.objects.create(mercado=bcs, codigo='CHILE', nombre='Banco de Chile')
+        lima = Instrumento.objects.create(mercado=otro, codigo='LIMA', nombre='Lima')
+        CalificacionTributaria.objects.bulk_create(
+            CalificacionTributaria(usuario=cls.usuario, instrumento=chile if i % 3 else lima, secuencia=i)
+            for i in range(12)
+        )
+        # Fechas repetidas de a pares para probar el desempate por id
+        base = timezone.now()
+        for calif in CalificacionTributaria.objects.all():
+            CalificacionTributaria.objects.filter(id=calif.id).update(created_at=base - timedelta(minutes=calif.secuencia // 2))
+
+    def test_recorre_hacia_adelante_y_atras_sin_repetir(self):
+        qs = CalificacionTributaria.objects.all()
+        orden = list(qs.order_by('-created_at', '-id').values_list('id', flat=True))
+
+        vistos, cursor, paginas = [], None, []
+        while True:
+            filas, cursor, anterior = paginar_keyset(qs, despues=cursor, tamano=5)
+            vistos += [f.id for f in filas]
+            paginas.append((filas, anterior))
+            if not cursor: break
+        self.assertEqual(vistos, orden)
+
+        filas, _, anterior = paginar_keyset(qs, antes=paginas[2][1], tamano=5)
+        self.assertEqual([f.id for f in filas], orden[5:10])
+        filas, _, anterior = paginar_keyset(qs, antes=anterior, tamano=5)
+        self.assertEqual([f.id for f in filas], orden[:5])
+        self.assertIsNone(anterior)
+
+    def test_api_de_la_grilla_pagina_con_filtro_y_factores_en_lista(self):
+        self.client.login(username='corredor', password='x')
+        url = reverse('calificaciones_api')
+        respuesta = self.client.get(url, {'q_mercado': 'santiago', 'tam': 5}).json()
+        self.assertEqual(len(respuesta['filas']), 5)
+        fila = dict(zip(respuesta['columnas'], respuesta['filas'][0]))
+        self.assertEqual(fila['instrumento_codigo'], 'CHILE')
+        self.assertEqual(len(fila['factores']), 30)
+
+        respuesta = self.client.get(url, {'q_mercado': 'santiago', 'tam': 5, 'despues': respuesta['siguiente']}).json()
+        self.assertEqual(len(respuesta['filas']), 3)
+        self.assertIsNone(respuesta['siguiente'])
+
+        # El mantenedor embebe la primera ventana con el mismo formato
+        pagina = self.client.get(reverse('mantenedor'), {'tam': 5}).context['pagina_inicial']
+        self.assertEqual(len(pagina['filas']), 5)
+        self.assertIsNotNone(pagina['siguiente'])
+
+    def test_cantidad_de_consultas_no_crece_con_las_filas(self):
+        User.objects.create_superuser('admin', password='x')
+        self.client.login(username='admin', password='x')
+
+        def consultas():
+            invalidar_instrumentos()  # La caché de instrumentos no debe cambiar la cuenta
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.client.get(reverse('mantenedor'), {'tam': 100}).status_code, 200)
+            return len(ctx.captured_queries)
+
+        antes = consultas()
+        # Filas nuevas con instrumentos y usuarios distintos entre sí
+        mercado = Mercado.objects.first()
+        for i in range(10):
+            dueno = User.objects.create_user(f'corredor{i}', password='x')
+            inst = Instrumento.objects.create(mercado=mercado, codigo=f'INST{i}', nombre=f'Instrumento {i}')
+            CalificacionTributaria.objects.create(usuario=dueno, instrumento=inst)
+        self.assertEqual(consultas(), antes)
+
+
+class GuardadoManualTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('corredor', password='x')
+        mercado = Mercado.objects.create(codigo='BCS', nombre='Bolsa de Santiago')
+        cls.inst = Instrumento.objects.create(mercado=mercado, codigo='CHILE', nombre='Banco de Chile')
+
+    def setUp(self):
+        self.client.login(username='corredor', password='x')
+
+    def formulario(self, **extra):
+        datos = {
+            'rut_propietario': '11111111-1', 'instrumento': self.inst.id, 'ejercicio': '2025',
+            'fecha_pago': '2025-05-10', 'descripcion': 'Dividendo', 'secuencia': '1',
+            'monto_historico': '1.000', 'factor_actualizacion': '1,5', 'f08': '150', 'f09': '300',
+        }
+        return {**datos, **extra}
+
+    def escrituras(self, datos):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse('mantenedor'), datos)
+        tabla = CalificacionTributaria._meta.db_table
+        return [q['sql'] for q in ctx.captured_queries if q['sql'].startswith((f'INSERT INTO "{tabla}"', f'UPDATE "{tabla}"'))]
+
+    def test_calculos_puros(self):
+        self.assertEqual(calcular_monto_total(Decimal('1000'), Decimal('1.0055')), Decimal('1005.50'))
+        self.assertEqual(calcular_monto_total(Decimal('0'), Decimal('1.5'), Decimal('7.00')), Decimal('7.00'))
+        self.assertEqual(calcular_factores([Decimal('1'), Decimal('0')], Decimal('3')), [Decimal('0.333333'), Decimal('0')])
+        self.assertEqual(calcular_factores([Decimal('5')], Decimal('0')), [Decimal('0')])
+
+    def test_alta_es_un_solo_insert(self):
+        sql = self.escrituras(self.formulario())
+        self.assertEqual(len(sql), 1)
+        self.assertTrue(sql[0].startswith('INSERT'))
+        calif = CalificacionTributaria.objects.get()
+        self.assertEqual(calif.monto_total, Decimal('1500.00'))
+        self.assertEqual((calif.factor_08, calif.factor_09, calif.factor_10), (Decimal('0.1'), Decimal('0.2'), Decimal('0')))
+
+    def test_edicion_solo_escribe_columnas_cambiadas(self):
+        self.client.post(reverse('mantenedor'), self.formulario())
+        calif = CalificacionTributaria.objects.get()
+
+        sql = self.escrituras(self.formulario(id_edicion=calif.id, f08='450'))
+        self.assertEqual(len(sql), 1)
+        self.assertIn('"factor_08"', sql[0])
+        self.assertNotIn('"rut_propietario"', sql[0])
+        self.assertNotIn('"factor_09"', sql[0])
+        calif.refresh_from_db()
+        self.assertEqual(calif.factor_08, Decimal('0.3'))
+
+        # Cambia el histórico: se recalcula y escribe también monto_total y los factores
+        self.escrituras(self.formulario(id_edicion=calif.id, monto_historico='2.000', f08='450'))
+        calif.refresh_from_db()
+        self.assertEqual((calif.monto_total, calif.factor_08), (Decimal('3000.00'), Decimal('0.15')))
+
+        # Sin cambios no hay escritura
+        self.assertEqual(self.escrituras(self.formulario(id_edicion=calif.id, monto_historico='2.000', f08='450')), [])
+
+
+class BusquedaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('corredor', password='x')
+        mercado = Mercado.objects.create(codigo='BCS', nombre='Bolsa de Santiago')
+        cls.chile = Instrumento.objects.create(mercado=mercado, codigo='CHILE', nombre='Banco de Chile')
+        cls.falabella = Instrumento.objects.create(mercado=mercado, codigo='FALABELLA', nombre='Falabella')
+        cls.a = CalificacionTributaria.objects.create(
+            usuario=cls.usuario, instrumento=cls.chile, rut_propietario='12.345.678-5',
+            descripcion='Dividendo definitivo', ejercicio=2024, fecha_pago=date(2024, 5, 10))
+        cls.b = CalificacionTributaria.objects.create(
+            usuario=cls.usuario, instrumento=cls.falabella, rut_propietario='9876543-K',
+            descripcion='Dividendo provisorio Único', ejercicio=2025, fecha_pago=date(2025, 1, 20))
+
+    def setUp(self):
+        invalidar_instrumentos()
+
+    def ids(self, **parametros):
+        return set(buscar(CalificacionTributaria.objects.all(), parametros).values_list('id', flat=True))
+
+    def test_tokenizar(self):
+        self.assertEqual(tokenizar('12.345.678-5'), {'123456785'})
+        self.assertEqual(tokenizar('Dividendo  Único/2025'), {'DIVIDENDO', 'UNICO', '2025'})
+
+    def test_busca_por_rut_instrumento_descripcion_y_fechas(self):
+        self.assertEqual(self.ids(q='12345678'), {self.a.id})
+        self.assertEqual(self.ids(q='9.876.543-k'), {self.b.id})
+        self.assertEqual(self.ids(q='fala'), {self.b.id})
+        self.assertEqual(self.ids(q='banco'), {self.a.id})
+        self.assertEqual(self.ids(q='unico'), {self.b.id})
+        self.assertEqual(self.ids(q='dividendo'), {self.a.id, self.b.id})
+        self.assertEqual(self.ids(q='dividendo chile'), {self.a.id})
+        self.assertEqual(self.ids(ejercicio='2025'), {self.b.id})
+        self.assertEqual(self.ids(desde='2024-06-01', hasta='2025-12-31'), {self.b.id})
+        self.assertEqual(self.ids(desde='no-es-fecha'), {self.a.id, self.b.id})
+
+    def test_tokens_al_editar_cargar_y_eliminar(self):
+        self.b.descripcion = 'Reparto extraordinario'
+        self.b.save(update_fields=['descripcion'])
+        self.assertEqual(self.ids(q='extraordinario'), {self.b.id})
+        self.assertEqual(self.ids(q='provisorio'), set())
+
+        guardados, _ = procesar_carga_masiva(archivo_csv([
+            'RUT;INSTRUMENTO;MONTO HISTORICO', '11.111.111-1;chile;1000',
+        ]), self.usuario)
+        self.assertEqual(guardados, 1)
+        self.assertEqual(len(self.ids(q='11111111')), 1)
+
+        self.a.delete()
+        self.assertFalse(TokenBusqueda.objects.filter(calificacion_id=self.a.id).exists())
+
+        antes = sorted(TokenBusqueda.objects.values_list('calificacion_id', 'token'))
+        call_command('reindexar_busqueda', stdout=io.StringIO())
+        self.assertEqual(sorted(TokenBusqueda.objects.values_list('calificacion_id', 'token')), antes)
+
+    def test_grilla_usa_la_busqueda(self):
+        self.client.login(username='corredor', password='x')
+        respuesta = self.client.get(reverse('calificaciones_api'), {'q': 'falabella', 'ejercicio': '2025'}).json()
+        self.assertEqual([f[0] for f in respuesta['filas']], [self.b.id])
+
+
+class CertificadoTests(TestCase):
+    def test_cada_factor_una_sola_vez_con_indices(self):
+        cert = certificado_para()
+        ids = [f.id for s in cert.secciones for f in s.factores]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(ids, [f'f{i:02d}' for i in range(8, 38)])
+        self.assertEqual(cert.por_factor['f31'].seccion, 'SECCION_4_STUT')
+        self.assertEqual(cert.por_factor['f31'].campo, 'factor_31')
+        self.assertIn(cert.por_factor['f08'], cert.por_seccion['SECCION_A_RENTAS_AFECTAS'].factores)
+        self.assertIs(certificado_para(2010), cert)
+        with self.assertRaises(TypeError):
+            cert.por_factor['f08'] = None
+
+    def test_rechaza_factor_repetido(self):
+        secciones = [('A', 'A', 'primary', [(f'f{i:02d}', '', '') for i in range(8, 38)] + [('f31', '', '')])]
+        with self.assertRaisesMessage(ValueError, "['f31']"):
+            _armar('x', 2025, secciones)
+
+    def test_formulario_de_factores_queda_en_cache(self):
+        User.objects.create_user('corredor', password='x')
+        self.client.login(username='corredor', password='x')
+        cache.clear()
+        clave = make_template_fragment_key('formulario_factores', [certificado_para().version])
+        html = self.client.get(reverse('mantenedor')).content.decode()
+        self.assertIsNotNone(cache.get(clave))
+        self.assertEqual(html.count('name="f31"'), 1)
+
+
+class MatrizFactoresTests(TestCase):
+    def test_lote_igual_a_decimal_fila_por_fila(self):
+        rnd = random.Random(7)
+        montos = [
+            [Decimal(rnd.choice([0, rnd.randint(0, 10**7), rnd.randint(-10**6, 10**9) / 100])).quantize(Decimal('0.01'))
+             for _ in range(30)]
+            for _ in range(300)
+        ]
+        totales = [Decimal(rnd.randint(0, 10**8)) / 100 for _ in range(300)]
+        # Empates exactos, montos con 3 decimales (van por Decimal) y total 0
+        montos += [[Decimal(i) / 100 for i in range(30)], [Decimal('1.005')] * 30, [Decimal('5')] * 30]
+        totales += [Decimal('0.08'), Decimal('3.00'), Decimal('0')]
+
+        matriz = calcular_factores_lote(montos, totales)
+        for i, (fila, total) in enumerate(zip(montos, totales)):
+            self.assertEqual(matriz.decimales(i), calcular_factores(fila, total))
+
+    def test_vistas_y_textos(self):
+        calif = CalificacionTributaria(id=5, factor_08=Decimal('0.5'), factor_37=Decimal('-1.0000005'))
+        matriz = MatrizFactores.desde_objetos([calif])
+        self.assertEqual(matriz.ids, (5,))
+        self.assertEqual(matriz.columna(8).tolist(), [500000])
+        self.assertEqual(matriz.fila(0)[-1], a_entero(Decimal('-1.0000005')))
+        self.assertEqual(matriz.textos(0, separador=',')[0], '0,500000')
+        self.assertEqual(matriz.textos(0)[-1], '-1.000001')
+        matriz.columna(9)[:] = 250000  # la columna es una vista de la matriz
+        otra = CalificacionTributaria()
+        matriz.asignar(0, otra)
+        self.assertEqual((otra.factor_08, otra.factor_09), (Decimal('0.5'), Decimal('0.25')))
+
+
+class RecalculoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        usuario = User.objects.create_user('corredor', password='x')
+        bcs = Mercado.objects.create(codigo='BCS', nombre='Bolsa de Santiago')
+        bvl = Mercado.objects.create(codigo='BVL', nombre='Bolsa de Lima')
+        chile = Instrumento.objects.create(mercado=bcs, codigo='CHILE', nombre='Banco de Chile')
+        lima = Instrumento.objects.create(mercado=bvl, codigo='LIMA', nombre='Lima')
+        cls.ids = [
+            CalificacionTributaria.objects.create(
+                usuario=usuario, instrumento=chile if i % 2 else lima, ejercicio=2024 + i % 2,
+                monto_historico=Decimal(1000 + i), factor_actualizacion=Decimal('1.5')).id
+            for i in range(10)
+        ]
+        # Simula un cambio de regla: los montos guardados quedan desactualizados
+        CalificacionTributaria.objects.update(monto_total=0)
+
+    def montos(self):
+        return dict(CalificacionTributaria.objects.values_list('id', 'monto_total'))
+
+    def test_simular_no_escribe(self):
+        r = recalcular_montos(filtrar(), simular=True)
+        self.assertEqual((r.revisadas, r.cambiadas, r.ultimo_id), (10, 10, self.ids[-1]))
+        self.assertEqual(r.ejemplos[0], (self.ids[0], Decimal('0'), Decimal('1500.00')))
+        self.assertEqual(set(self.montos().values()), {Decimal('0')})
+
+    def test_recalcula_solo_lo_filtrado_por_lotes(self):
+        tokens = TokenBusqueda.objects.count()
+        r = recalcular_montos(filtrar(ejercicios=[2025], mercado='bcs'), tamano_lote=2)
+        self.assertEqual((r.revisadas, r.cambiadas), (5, 5))
+        montos = self.montos()
+        self.assertEqual(montos[self.ids[1]], Decimal('1501.50'))
+        self.assertEqual(montos[self.ids[0]], Decimal('0'))
+        self.assertEqual(TokenBusqueda.objects.count(), tokens)
+        # Una segunda pasada ya no encuentra diferencias
+        self.assertEqual(recalcular_montos(filtrar(ejercicios=[2025])).cambiadas, 0)
+
+    def test_comando_continua_desde_el_checkpoint(self):
+        with tempfile.TemporaryDirectory() as carpeta:
+            checkpoint = f'{carpeta}/recalculo.json'
+            with open(checkpoint, 'w') as f:
+                f.write('{"filtros": {"ejercicios": null, "mercado": null, "usuario": null}, "ultimo_id": %d}' % self.ids[4])
+            salida = io.StringIO()
+            call_command('recalcular_calificaciones', checkpoint=checkpoint, lote=3, stdout=salida)
+            self.assertIn('5 revisadas, 5 actualizadas', salida.getvalue())
+        montos = self.montos()
+        self.assertEqual([montos[i] > 0 for i in self.ids], [False] * 5 + [True] * 5)
+
+
+class ResumenTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('corredor', password='x')
+        bcs = Mercado.objects.create(codigo='BCS', nombre='Bolsa de Santiago')
+        bvl = Mercado.objects.create(codigo='BVL', nombre='Bolsa de Lima')
+        cls.chile = Instrumento.objects.create(mercado=bcs, codigo='CHILE', nombre='Banco de Chile')
+        cls.lima = Instrumento.objects.create(mercado=bvl, codigo='LIMA', nombre='Lima')
+
+    def setUp(self):
+        invalidar_instrumentos()
+
+    def assertCuadra(self):
+        self.assertEqual(reconciliar(corregir=False), [])
+
+    def test_se_mantiene_en_cada_escritura(self):
+        a = CalificacionTributaria.objects.create(
+            usuario=self.usuario, instrumento=self.chile, ejercicio=2024,
+            monto_historico=Decimal('1000'), factor_actualizacion=Decimal('1'), factor_08=Decimal('0.25'), factor_19=Decimal('0.5'), factor_20=Decimal('0.9'))
+        self.assertCuadra()
+        grupo = ResumenCalificaciones.objects.get()
+        self.assertEqual((grupo.cantidad, grupo.monto_total, grupo.suma_bases), (1, Decimal('1000.00'), Decimal('0.75')))
+
+        # Edición que cambia de grupo (otro ejercicio y mercado), leída parcialmente
+        b = CalificacionTributaria.objects.only('id').get(id=a.id)
+        b.ejercicio, b.instrumento, b.monto_historico = 2025, self.lima, Decimal('500')
+        b.save(update_fields=['ejercicio', 'instrumento', 'monto_historico'])
+        self.assertCuadra()
+
+        procesar_carga_masiva(archivo_csv([
+            'RUT;INSTRUMENTO;EJERCICIO;MONTO HISTORICO;F08', '11111111-1;chile;2025;300;0,1', '22222222-2;lima;2025;200;0',
+        ]), self.usuario)
+        self.assertCuadra()
+
+        # update() no pasa por el hook: se reconcilia y luego el recálculo mueve el resumen
+        CalificacionTributaria.objects.update(monto_total=0)
+        self.assertEqual(len(reconciliar()), 2)
+        recalcular_montos(filtrar())
+        self.assertCuadra()
+
+        CalificacionTributaria.objects.get(id=a.id).delete()
+        self.assertCuadra()
+        self.assertEqual(ResumenCalificaciones.objects.count(), 2)
+
+    def test_reconciliacion_y_dashboard(self):
+        for inst, monto in ((self.chile, 100), (self.chile, 50), (self.lima, 10)):
+            CalificacionTributaria.objects.create(usuario=self.usuario, instrumento=inst, ejercicio=2025,
+                                                  monto_historico=Decimal(monto), factor_actualizacion=Decimal('1'))
+        ResumenCalificaciones.objects.filter(mercado=self.chile.mercado).update(cantidad=7)
+        with self.assertRaises(CommandError):
+            call_command('reconciliar_resumen', solo_verificar=True, stdout=io.StringIO())
+        call_command('reconciliar_resumen', stdout=io.StringIO())
+        self.assertCuadra()
+
+        self.client.login(username='corredor', password='x')
+        with self.assertNumQueries(3):  # sesión, usuario y la tabla de resumen
+            datos = self.client.get(reverse('resumen_api')).json()
+        self.assertEqual(datos['total']['cantidad'], 3)
+        self.assertEqual(datos['total']['monto_total'], '160.00')
+        self.assertEqual([(m['mercado'], m['cantidad']) for m in datos['por_mercado']],
+                         [('Bolsa de Lima', 1), ('Bolsa de Santiago', 2)])
+
+
+class ExportacionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('corredor', password='x')
+        cls.otro = User.objects.create_user('otro', password='x')
+        mercado = Mercado.objects.create(codigo='BCS', nombre='Bolsa de Santiago')
+        chile = Instrumento.objects.create(mercado=mercado, codigo='CHILE', nombre='Banco de Chile')
+        falabella = Instrumento.objects.create(mercado=mercado, codigo='FALABELLA', nombre='Falabella')
+        for i, (inst, isfut) in enumerate(((chile, True), (falabella, False), (chile, False))):
+            CalificacionTributaria.objects.create(
+                usuario=cls.usuario, instrumento=inst, rut_propietario=f'1111111{i}-1', ejercicio=2023 + i,
+                fecha_pago=date(2024, 3, i + 1), secuencia=i, descripcion=f'Dividendo {i}; "ñ"' if i else None,
+                es_isfut=isfut, monto_historico=Decimal('1234.56'), factor_actualizacion=Decimal('1.013'),
+                factor_08=Decimal('0.123456'), factor_37=Decimal(i))
+
+    def setUp(self):
+        invalidar_instrumentos()
+        self.client.login(username='corredor', password='x')
+
+    def comparables(self, usuario):
+        campos = ['instrumento__codigo', 'rut_propietario', 'ejercicio', 'fecha_pago', 'secuencia', 'descripcion',
+                  'es_isfut', 'monto_historico', 'factor_actualizacion', 'monto_total', 'factor_08', 'factor_37']
+        return sorted(CalificacionTributaria.objects.filter(usuario=usuario).values_list(*campos))
+
+    def test_csv_en_streaming_vuelve_a_cargar_igual(self):
+        respuesta = self.client.get(reverse('exportar', args=['csv']))
+        self.assertTrue(respuesta.streaming)
+        contenido = b''.join(respuesta.streaming_content)
+        self.assertTrue(contenido.decode('utf-8-sig').startswith(';'.join(ENCABEZADOS[:3])))
+
+        guardados, errores = procesar_carga_masiva(SimpleUploadedFile('exportado.csv', contenido), self.otro)
+        self.assertEqual((guardados, errores), (3, []))
+        self.assertEqual(self.comparables(self.otro), self.comparables(self.usuario))
+
+    def test_xlsx_vuelve_a_cargar_igual_y_respeta_filtros(self):
+        respuesta = self.client.get(reverse('exportar', args=['xlsx']), {'q': 'chile'})
+        contenido = b''.join(respuesta.streaming_content)
+        filas = list(openpyxl.load_workbook(io.BytesIO(contenido), read_only=True).active.values)
+        self.assertEqual(len(filas), 3)
+
+        procesar_carga_masiva(SimpleUploadedFile('exportado.xlsx', contenido), self.otro)
+        self.assertEqual(self.comparables(self.otro), [c for c in self.comparables(self.usuario) if c[0] == 'CHILE'])
+
+    def test_parquet_opcional(self):
+        respuesta = self.client.get(reverse('exportar', args=['parquet']))
+        if parquet_disponible():
+            import pyarrow.parquet as pq
+            tabla = pq.read_table(io.BytesIO(b''.join(respuesta.streaming_content)))
+            self.assertEqual((tabla.num_rows, tabla.column_names), (3, ENCABEZADOS))
+        else:
+            self.assertRedirects(respuesta, reverse('mantenedor'))
+        self.assertEqual(self.client.get(reverse('exportar', args=['pdf'])).status_code, 404)
+
+
+class EmisionCertificadosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        usuario = User.objects.create_user('corredor', password='x')
+        mercado = Mercado.objects.create(codigo='BCS', nombre='Bolsa de Santiago')
+        inst = Instrumento.objects.create(mercado=mercado, codigo='CHILE', nombre='Banco de Chile')
+        for rut, ejercicio, f08 in (('2-7', 2025, '0.5'), ('1-9', 2025, '0.25'), ('1-9', 2025, '0.1'), ('1-9', 2024, '0')):
+            CalificacionTributaria.objects.create(
+                usuario=usuario, instrumento=inst, rut_propietario=rut, ejercicio=ejercicio,
+                monto_historico=Decimal('1000'), factor_actualizacion=Decimal('1'), factor_08=Decimal(f08))
+
+    def contenido(self, carpeta):
+        archivos = {}
+        for parte in sorted(Path(carpeta).glob('*.zip')):
+            with zipfile.ZipFile(parte) as z:
+                archivos.update((n, z.read(n).decode()) for n in z.namelist())
+        return archivos
+
+    def test_un_certificado_por_rut_y_ejercicio(self):
+        with tempfile.TemporaryDirectory() as carpeta:
+            r = emitir_certificados(carpeta, procesos=2, por_parte=2)
+            self.assertEqual((r.certificados, r.partes), (3, 2))
+            archivos = self.contenido(carpeta)
+        self.assertEqual(sorted(archivos), ['2024/certificado_70_1-9.html', '2025/certificado_70_1-9.html', '2025/certificado_70_2-7.html'])
+        html = archivos['2025/certificado_70_1-9.html']
+        self.assertIn('$ 2.000', html)
+        self.assertIn('>350<', html)  # total F08: 1000 * 0,25 + 1000 * 0,1
+        self.assertNotIn('F08', archivos['2024/certificado_70_1-9.html'])
+
+    def test_continua_desde_la_ultima_parte(self):
+        class Corte(Exception): pass
+        def cortar(certificados, parte): raise Corte
+
+        with tempfile.TemporaryDirectory() as carpeta:
+            with self.assertRaises(Corte):
+                emitir_certificados(carpeta, ejercicio=2025, por_parte=1, al_avanzar=cortar)
+            r = emitir_certificados(carpeta, ejercicio=2025, por_parte=1)
+            self.assertEqual((r.certificados, r.partes), (1, 1))
+            self.assertEqual(sorted(self.contenido(carpeta)), ['2025/certificado_70_1-9.html', '2025/certificado_70_2-7.html'])
+            with self.assertRaises(ValueError):
+                emitir_certificados(carpeta, ejercicio=2024)
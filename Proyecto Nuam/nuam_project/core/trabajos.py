@@ -0,0 +1,143 @@
+"""
+Cola de cargas masivas respaldada en la tabla TrabajoCarga.
+La vista solo guarda el archivo y encola; el comando 'procesar_cargas' ejecuta.
+"""
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.core.files import File
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import HuellaFila, TrabajoCarga
+from .rendimiento import medir
+from .utils import procesar_carga_masiva
+
+logger = logging.getLogger(__name__)
+
+# Mensajes de error que se guardan por trabajo (el total va en cantidad_errores)
+MAX_ERRORES_GUARDADOS = 100
+# Un trabajo 'procesando' sin latido en este plazo se da por abandonado (el worker murió) y se retoma.
+# Debe superar lo que tarda un bloque de la carga (TAMANO_BLOQUE filas), que es cada cuánto late
+TRABAJO_VENCIDO = timedelta(minutes=10)
+# Un archivo que tumba al worker una y otra vez no se reintenta sin fin
+MAX_INTENTOS = 3
+
+
+class _ArchivoConHuella(File):
+    """Archivo subido que va calculando su SHA-256 mientras el storage lo copia a disco."""
+    def __init__(self, archivo):
+        super().__init__(archivo, archivo.name)
+        self.sha256 = hashlib.sha256()
+
+    def chunks(self, chunk_size=None):
+        for pedazo in self.file.chunks(chunk_size):
+            self.sha256.update(pedazo)
+            yield pedazo
+
+
+def carga_identica(usuario, sha256):
+    """
+    Última carga terminada sin errores del mismo archivo (mismo SHA-256) cuyas
+    filas siguen todas en el registro de huellas (las que dejó o las que
+    omitió por venir ya cargadas), es decir, ninguna se cambió ni se borró
+    desde entonces. None si no hay.
+    """
+    anteriores = TrabajoCarga.objects.filter(
+        usuario=usuario, sha256=sha256, estado='terminado', cantidad_errores=0, huellas__gt=0,
+    ).order_by('-id')
+    for anterior in anteriores[:1]:
+        completa = anterior.huellas == anterior.insertados + anterior.actualizados + anterior.sin_cambios
+        registradas = HuellaFila.objects.filter(Q(trabajo=anterior) | Q(ultima_carga=anterior)).count()
+        if completa and registradas == anterior.huellas: return anterior
+    return None
+
+
+def encolar_carga(archivo, usuario, modo='insertar'):
+    """
+    Guarda el archivo subido en disco y crea el trabajo pendiente. Si el
+    archivo es idéntico a una carga anterior sin cambios (carga_identica), el
+    trabajo queda terminado de inmediato sin pasar por el worker.
+    """
+    trabajo = TrabajoCarga(usuario=usuario, nombre_archivo=archivo.name, modo=modo)
+    contenido = _ArchivoConHuella(archivo)
+    trabajo.archivo.save(archivo.name, contenido, save=False)
+    trabajo.sha256 = contenido.sha256.hexdigest()
+
+    anterior = carga_identica(usuario, trabajo.sha256)
+    if anterior:
+        trabajo.archivo.delete(save=False)
+        trabajo.estado, trabajo.duplicado_de = 'terminado', anterior
+        trabajo.filas_procesadas, trabajo.sin_cambios = anterior.filas_procesadas, anterior.huellas
+        trabajo.iniciado_en = trabajo.terminado_en = timezone.now()
+    trabajo.save()
+    return trabajo
+
+
+def _vencidos(ahora):
+    return Q(estado='procesando') & (Q(actualizado_en__lt=ahora - TRABAJO_VENCIDO) | Q(actualizado_en__isnull=True))
+
+
+def tomar_siguiente_trabajo():
+    """
+    Reserva el trabajo pendiente más antiguo, o uno 'procesando' cuyo worker
+    dejó de latir hace más de TRABAJO_VENCIDO (se vuelve a procesar entero:
+    las filas que alcanzó a guardar se omiten por sus huellas). Pasados
+    MAX_INTENTOS queda 'fallido'. El UPDATE condicionado al estado y al último
+    latido evita que dos workers tomen el mismo trabajo (funciona también en SQLite).
+    """
+    ahora = timezone.now()
+    for trabajo in TrabajoCarga.objects.filter(_vencidos(ahora), intentos__gte=MAX_INTENTOS):
+        logger.error("La carga #%s se abandonó %s veces: queda fallida", trabajo.id, trabajo.intentos)
+        trabajo.archivo.delete(save=False)
+        trabajo.estado, trabajo.terminado_en = 'fallido', ahora
+        trabajo.errores = [f"Error archivo: el worker se detuvo {trabajo.intentos} veces procesando la carga"]
+        trabajo.cantidad_errores = 1
+        trabajo.save()
+
+    disponibles = TrabajoCarga.objects.filter(Q(estado='pendiente') | _vencidos(ahora))
+    for trabajo_id, estado, latido in disponibles.order_by('id').values_list('id', 'estado', 'actualizado_en')[:10]:
+        tomado = TrabajoCarga.objects.filter(id=trabajo_id, estado=estado, actualizado_en=latido).update(
+            estado='procesando', iniciado_en=ahora, actualizado_en=ahora, intentos=F('intentos') + 1
+        )
+        if tomado:
+            if estado == 'procesando': logger.warning("Se retoma la carga #%s: sin latido desde %s", trabajo_id, latido)
+            return TrabajoCarga.objects.select_related('usuario').get(id=trabajo_id)
+    return None
+
+
+def ejecutar_trabajo(trabajo, procesos=None):
+    """
+    Procesa el archivo del trabajo informando el avance en la misma fila.
+    'procesos' reparte la validación (None = CARGA_MASIVA_PROCESOS).
+    """
+    conteo = {'insertados': 0, 'actualizados': 0, 'sin_cambios': 0, 'huellas': 0}
+
+    def al_avanzar(filas, guardados, errores):
+        TrabajoCarga.objects.filter(id=trabajo.id).update(
+            filas_procesadas=filas, guardados=guardados, **conteo, actualizado_en=timezone.now(),
+            cantidad_errores=len(errores), errores=errores[:MAX_ERRORES_GUARDADOS],
+        )
+
+    try:
+        with medir('procesar_carga'), trabajo.archivo.open('rb') as archivo:
+            guardados, errores = procesar_carga_masiva(
+                archivo, trabajo.usuario, al_avanzar=al_avanzar, procesos=procesos, modo=trabajo.modo, conteo=conteo, trabajo=trabajo,
+            )
+        estado = 'terminado'
+    except Exception as e:
+        logger.exception("Falló la carga #%s", trabajo.id)
+        guardados, errores, estado = 0, [f"Error archivo: {e}"], 'fallido'
+
+    trabajo.refresh_from_db(fields=['filas_procesadas'])
+    # El archivo ya no se necesita: el resultado queda en el trabajo
+    trabajo.archivo.delete(save=False)
+    trabajo.estado = estado
+    trabajo.guardados = guardados
+    for campo, valor in conteo.items(): setattr(trabajo, campo, valor)
+    trabajo.cantidad_errores = len(errores)
+    trabajo.errores = errores[:MAX_ERRORES_GUARDADOS]
+    trabajo.terminado_en = trabajo.actualizado_en = timezone.now()
+    trabajo.save()
+    return trabajo
@@ -11,5 +11,12 @@ urlpatterns = [
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
     path('carga-masiva/', views.carga_masiva_view, name='carga_masiva'),
+    path('carga-masiva/preview/', views.carga_masiva_preview_view, name='carga_masiva_preview'),
+    path('carga-masiva/<int:id>/estado/', views.estado_carga_view, name='estado_carga'),
+    path('operacion-masiva/', views.operacion_masiva_view, name='operacion_masiva'),
     path('obtener-detalle/<int:id>/', views.obtener_detalle_view, name='obtener_detalle'),
+    path('api/calificaciones/', views.calificaciones_api_view, name='calificaciones_api'),
+    path('api/resumen/', views.resumen_api_view, name='resumen_api'),
+    path('exportar/<str:formato>/', views.exportar_view, name='exportar'),
+    path('api/rendimiento/', views.rendimiento_api_view, name='rendimiento_api'),
 ]
\ No newline at end of file
@@ -1,220 +1,400 @@
+import hashlib
 import pandas as pd
-from decimal import Decimal
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
 from django.db import transaction
-from .models import CalificacionTributaria, Instrumento
+from django.db.models import Q
+from django.utils import timezone
+from .cache import resolver_instrumentos
+from .models import CLAVE_NATURAL, CalificacionTributaria, HuellaFila
+from .rendimiento import etapa, iterar_en_etapa
+from .resumen import CAMPOS_RESUMEN
+from .signals import calificaciones_modificadas
+from .validacion import planificar_columnas, validar_bloque
+import codecs
 import csv
-import io
-from datetime import datetime
+from itertools import chain, islice
+import openpyxl
 
-def procesar_carga_masiva(archivo, usuario_actual):
+# Filas por bulk_create (cada lote va en su propia transacción)
+TAMANO_LOTE = 2000
+# Filas que se leen del archivo a la vez (la memoria queda acotada a este bloque)
+TAMANO_BLOQUE = 20000
+# Bytes del inicio del archivo usados para detectar el separador
+MUESTRA_BYTES = 64 * 1024
+# Bytes por lectura al revisar la codificación de todo el archivo
+BLOQUE_BYTES = 1024 * 1024
+
+def _errores_instrumentos(desconocidos, max_filas=10):
+    """Un solo error por código desconocido, con las filas donde aparece."""
     errores = []
+    for codigo, filas in desconocidos.values():
+        detalle = ', '.join(str(f) for f in filas[:max_filas])
+        if len(filas) > max_filas: detalle += f" y {len(filas) - max_filas} más"
+        errores.append(f"Instrumento '{codigo}' no existe (filas {detalle}).")
+    return errores
+
+# --- PERSISTENCIA ---
+
+MODOS_CARGA = ('insertar', 'actualizar')
+# Contadores de una carga (los mismos campos en TrabajoCarga)
+CONTEOS = ('insertados', 'actualizados', 'sin_cambios', 'huellas')
+# La clave natural con los nombres de atributo que tienen los objetos y values()
+CLAVE = tuple(CalificacionTributaria._meta.get_field(c).attname for c in CLAVE_NATURAL)
+
+def _clave(obj):
+    # Sin fecha de pago la clave lleva None: la fila se busca con fecha nula aunque el índice único no la cubra
+    return tuple(getattr(obj, c) for c in CLAVE)
+
+def _existentes(objetos, campos):
+    """
+    Filas ya guardadas con la clave de algún objeto del lote: {clave: values()}.
+    Sin fecha de pago la BD puede tener varias con la misma clave (NULL no choca
+    en el índice único): queda la más reciente.
+    """
+    if not objetos: return {}
+    fechas = {o.fecha_pago for o in objetos}
+    con_fecha = Q(fecha_pago__in=fechas - {None})
+    if None in fechas: con_fecha |= Q(fecha_pago__isnull=True)
+    filas = CalificacionTributaria.objects.filter(
+        con_fecha,
+        usuario_id=objetos[0].usuario_id,
+        rut_propietario__in={o.rut_propietario for o in objetos},
+        instrumento_id__in={o.instrumento_id for o in objetos},
+        ejercicio__in={o.ejercicio for o in objetos},
+    ).order_by('id').values('id', *dict.fromkeys((*CLAVE, *CAMPOS_RESUMEN, *campos)))
+    claves = {_clave(o) for o in objetos}
+    return {clave: fila for fila in filas if (clave := tuple(fila[c] for c in CLAVE)) in claves}
+
+def _sin_cambios(obj, fila, campos):
+    return all(CalificacionTributaria._meta.get_field(c).to_python(getattr(obj, c)) == fila[c] for c in campos)
+
+def _huellas(datos):
+    """
+    Huella de 128 bits de cada fila validada (dos hashes de pandas con claves
+    distintas), con los nombres de columna en la clave: la misma fila con
+    otras columnas es otra fila. Va sobre los valores ya validados, así que
+    no cambia con el formato de fechas o números del archivo.
+    """
+    texto = datos.astype(str)
+    texto['codigo'] = texto['codigo'].str.upper()
+    clave = hashlib.sha256('|'.join(datos.columns).encode()).hexdigest()
+    a = pd.util.hash_pandas_object(texto, index=False, hash_key=clave[:16])
+    b = pd.util.hash_pandas_object(texto, index=False, hash_key=clave[16:32])
+    return pd.Series([f'{x:016x}{y:016x}' for x, y in zip(a, b)], index=datos.index)
+
+def _cargada_en(ids):
+    """{id de calificación: carga (TrabajoCarga) que la dejó como está}, según el registro de huellas."""
+    if not ids: return {}
+    return dict(HuellaFila.objects.filter(calificacion_id__in=ids, trabajo__isnull=False).values_list('calificacion_id', 'trabajo_id'))
+
+def _guardar_lote(objetos, etiquetas, huellas, errores, campos, modo='insertar', conteo=None, trabajo=None):
+    """
+    Escribe el lote y retorna cuántas filas guardó. Las filas cuya clave
+    natural ya existe son error en modo 'insertar'; en modo 'actualizar' se
+    actualizan con un bulk_update (o se cuentan como sin cambios si traen lo
+    mismo) y las nuevas van en un bulk_create con update_conflicts, que cubre
+    una fila creada entre la lectura y la escritura. Si la base rechaza el
+    lote, se reintenta fila a fila para reportar el error exacto de cada una.
+    Cada fila que queda en la BD se anota en HuellaFila con su huella.
+    """
+    conteo = dict.fromkeys(CONTEOS, 0) if conteo is None else conteo
+    # Una clave repetida dentro del lote: en 'actualizar' gana la última fila, en 'insertar' es error
+    por_clave = {}
+    for fila in zip(objetos, etiquetas, huellas):
+        clave = _clave(fila[0])
+        if clave in por_clave and modo == 'insertar':
+            errores.append(f"{fila[1]}: repite la clave de {por_clave[clave][1]}")
+        else: por_clave[clave] = fila
+
+    existentes = _existentes([obj for obj, _, _ in por_clave.values()], campos)
+    nuevos, cambiados, anteriores, registrar, repetidas = [], [], [], [], []
+    for clave, (obj, etiqueta, huella) in por_clave.items():
+        fila = existentes.get(clave)
+        if fila is None: nuevos.append((obj, etiqueta, huella))
+        elif modo == 'insertar': repetidas.append((etiqueta, fila['id']))
+        elif _sin_cambios(obj, fila, campos): registrar.append((fila['id'], huella))
+        else:
+            obj.pk = fila['id']
+            obj._state.adding = False
+            cambiados.append((obj, etiqueta, huella))
+            anteriores.append(fila)
+    cargadas = _cargada_en([id for _, id in repetidas])
+    for etiqueta, id in repetidas:
+        origen = f"la carga #{cargadas[id]}" if id in cargadas else "la base"
+        errores.append(f"{etiqueta}: ya existe en {origen} (use el modo actualizar para reemplazarla)")
+    conteo['sin_cambios'] += len(registrar)
+
+    try:
+        with transaction.atomic():
+            creadas = [obj for obj, _, _ in nuevos]
+            actualizadas = [obj for obj, _, _ in cambiados]
+            if modo == 'actualizar':
+                CalificacionTributaria.objects.bulk_create(
+                    creadas, update_conflicts=True, unique_fields=CLAVE, update_fields=[*campos, 'updated_at'],
+                )
+            else:
+                CalificacionTributaria.objects.bulk_create(creadas)
+            if actualizadas:
+                for obj in actualizadas: obj.updated_at = timezone.now()
+                CalificacionTributaria.objects.bulk_update(actualizadas, [*campos, 'updated_at'])
+            calificaciones_modificadas.send(
+                sender=CalificacionTributaria, creadas=creadas, actualizadas=actualizadas,
+                campos=campos, anteriores=anteriores,
+            )
+        insertados, actualizados = len(creadas), len(actualizadas)
+        registrar += [(obj.pk, huella) for obj, _, huella in chain(nuevos, cambiados)]
+    except Exception:
+        insertados = actualizados = 0
+        for (obj, etiqueta, huella), nuevo in chain(((n, True) for n in nuevos), ((c, False) for c in cambiados)):
+            if nuevo:
+                obj.pk = None
+                obj._state.adding = True
+            try:
+                with transaction.atomic():
+                    obj.save()
+                if nuevo: insertados += 1
+                else: actualizados += 1
+                registrar.append((obj.pk, huella))
+            except Exception as e:
+                errores.append(f"{etiqueta}: {str(e)}")
+
+    usuario_id = objetos[0].usuario_id if objetos else None
+    HuellaFila.objects.bulk_create(
+        HuellaFila(usuario_id=usuario_id, calificacion_id=id, huella=huella, trabajo=trabajo) for id, huella in registrar
+    )
+    conteo['insertados'] += insertados
+    conteo['actualizados'] += actualizados
+    conteo['huellas'] += len(registrar)
+    return insertados + actualizados
+
+def _nuevo_registro():
+    # Solo cuentan las huellas que había al empezar la carga; 'usadas' lleva cuántas filas omitió cada una
+    return {'hasta': HuellaFila.objects.order_by('-id').values_list('id', flat=True).first() or 0, 'usadas': Counter()}
+
+def _omitir_cargadas(datos, usuario_actual, conteo, trabajo, registro):
+    """
+    Quita del bloque las filas cuya huella ya está registrada para el usuario
+    (idénticas a una fila cargada antes y que no ha cambiado) y retorna
+    (datos, huellas) de las que quedan. Cada huella registrada cubre una sola
+    fila: si un archivo repite una fila que antes venía una sola vez, la
+    repetición no se omite (y choca con la clave de la primera). Las omitidas cuentan como sin cambios; en
+    su registro solo se anota esta carga como ultima_carga, y 'trabajo' sigue diciendo qué carga las dejó así.
+    """
+    huellas = _huellas(datos)
+    disponibles = defaultdict(list)
+    conocidas = HuellaFila.objects.filter(usuario=usuario_actual, huella__in=set(huellas), id__lte=registro['hasta'])
+    for id_, huella in conocidas.order_by('id').values_list('id', 'huella'): disponibles[huella].append(id_)
+    if not disponibles: return datos, huellas
+    usadas, cargadas, vistas = registro['usadas'], [], []
+    for huella in huellas:
+        libres = disponibles.get(huella, ())
+        cargadas.append(usadas[huella] < len(libres))
+        if cargadas[-1]:
+            vistas.append(libres[usadas[huella]])
+            usadas[huella] += 1
+    cargadas = pd.Series(cargadas, index=huellas.index)
+    if trabajo is not None: HuellaFila.objects.filter(id__in=vistas).update(ultima_carga=trabajo)
+    conteo['sin_cambios'] += int(cargadas.sum())
+    conteo['huellas'] += int(cargadas.sum())
+    return datos[~cargadas], huellas[~cargadas]
+
+def _guardar_bloque(datos, usuario_actual, desconocidos, errores, tamano_lote, modo='insertar', conteo=None,
+                    trabajo=None, registro=None):
+    """Resolución de instrumentos y escritura de un bloque ya validado (proceso principal)."""
+    conteo = dict.fromkeys(CONTEOS, 0) if conteo is None else conteo
+    registro = _nuevo_registro() if registro is None else registro
+    # Todos los códigos distintos del bloque se resuelven de una vez
+    claves = datos['codigo'].str.upper()
+    instrumentos, faltantes = resolver_instrumentos(claves.unique())
+    if faltantes:
+        for clave in faltantes:
+            filas = desconocidos.setdefault(clave, (datos['codigo'][claves == clave].iloc[0], []))[1]
+            filas.extend(i + 2 for i in datos.index[claves == clave])
+        datos = datos[~claves.isin(faltantes)]
+    if datos.empty: return 0
+    datos, huellas = _omitir_cargadas(datos, usuario_actual, conteo, trabajo, registro)
+
+    objetos, etiquetas = [], []
+    columnas = list(datos.columns[1:])
+    for index, codigo, *valores in datos.itertuples(name=None):
+        objetos.append(CalificacionTributaria(
+            usuario=usuario_actual, instrumento=instrumentos[codigo.upper()], origen='Carga Masiva',
+            **dict(zip(columnas, valores))
+        ))
+        etiquetas.append(f"Fila {index+2} ({codigo})")
+    huellas = list(huellas)
+
+    # Lo que se compara y se actualiza en una fila existente: las columnas del archivo fuera de la clave
+    campos = [c for c in columnas if c not in CLAVE] + ['origen']
     guardados = 0
+    for inicio in range(0, len(objetos), tamano_lote):
+        fin = inicio + tamano_lote
+        guardados += _guardar_lote(objetos[inicio:fin], etiquetas[inicio:fin], huellas[inicio:fin], errores, campos,
+                                   modo, conteo, trabajo)
+    return guardados
 
+# --- LECTURA POR BLOQUES ---
+
+def _codificacion_csv(archivo):
+    """
+    'utf-8-sig' si todo el archivo es UTF-8 válido, si no 'iso-8859-1'. Se
+    recorre entero por bloques (sin guardarlo): un Latin-1 puede traer su
+    primera 'ñ' muy abajo, en un RUT, un código o una descripción.
+    """
+    decodificador = codecs.getincrementaldecoder('utf-8-sig')()
+    archivo.seek(0)
     try:
-        # 1. LECTURA DEL ARCHIVO
-        if archivo.name.endswith('.csv'):
-            contenido_bytes = archivo.read()
-            # Intentar decodificar (UTF-8 o Latin-1)
-            try: texto = contenido_bytes.decode('utf-8-sig')
-            except: texto = contenido_bytes.decode('iso-8859-1')
-            
-            dialect = csv.Sniffer().sniff(texto[:2048])
-            df = pd.read_csv(io.StringIO(texto), sep=dialect.delimiter)
-        else:
-            df = pd.read_excel(archivo)
+        for bloque in iter(lambda: archivo.read(BLOQUE_BYTES), b''):
+            decodificador.decode(bloque)
+        decodificador.decode(b'', final=True)
+        return 'utf-8-sig'
+    except UnicodeDecodeError:
+        return 'iso-8859-1'
+    finally:
+        archivo.seek(0)
+
+def _detectar_formato_csv(archivo):
+    """Codificación (de todo el archivo) y separador (del primer bloque)."""
+    encoding = _codificacion_csv(archivo)
+    muestra = archivo.read(MUESTRA_BYTES)
+    archivo.seek(0)
+    # La muestra puede cortar un carácter UTF-8 al final; al sniffer no le importa
+    texto = muestra.decode(encoding, errors='ignore')
 
-        # 2. NORMALIZAR COLUMNAS (Mayúsculas y sin espacios)
+    # El sniffer necesita líneas completas: con 35+ columnas 2 KB cortan la primera fila
+    corte = texto.rfind('\n', 0, 8192)
+    dialect = csv.Sniffer().sniff(texto[:corte] if corte > 0 else texto[:8192])
+    return encoding, dialect.delimiter
+
+def _bloques_xlsx(archivo, tamano_bloque):
+    libro = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        encabezados = next(filas, None)
+        if encabezados is None: return
+        encabezados = [f"UNNAMED: {i}" if h is None else str(h) for i, h in enumerate(encabezados)]
+        ancho, inicio = len(encabezados), 0
+        while True:
+            lote = [(fila + (None,) * ancho)[:ancho] for fila in islice(filas, tamano_bloque)]
+            if not lote: return
+            yield pd.DataFrame(lote, columns=encabezados, index=range(inicio, inicio + len(lote)))
+            inicio += len(lote)
+    finally:
+        libro.close()
+
+def leer_archivo_por_bloques(archivo, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Itera el archivo en DataFrames de hasta tamano_bloque filas, sin cargarlo
+    entero en memoria. CSV (UTF-8 o Latin-1, separador detectado) con chunksize;
+    XLSX con openpyxl en modo read_only. El índice de cada bloque sigue la
+    numeración global de filas. Los encabezados quedan en mayúsculas y sin espacios.
+    """
+    nombre = archivo.name.lower()
+    if nombre.endswith('.csv'):
+        encoding, separador = _detectar_formato_csv(archivo)
+        # Al archivo de Django en memoria le falta 'mode' y pandas lo tomaría por texto (ignorando
+        # la codificación): se le pasa el archivo binario de abajo
+        bloques = pd.read_csv(getattr(archivo, 'file', archivo), sep=separador, encoding=encoding,
+                              chunksize=tamano_bloque)
+    elif nombre.endswith('.xlsx'):
+        bloques = _bloques_xlsx(archivo, tamano_bloque)
+    else:
+        df = pd.read_excel(archivo)  # .xls antiguos: sin lectura por filas
+        bloques = (df.iloc[i:i + tamano_bloque] for i in range(0, len(df), tamano_bloque))
+
+    for df in bloques:
         df.columns = df.columns.astype(str).str.strip().str.upper()
+        yield df
 
-        # 3. BUSCAR COLUMNAS CLAVE
-        def buscar_col(keywords):
-            for k in keywords:
-                for col in df.columns:
-                    if k in col: return col
-            return None
-
-        col_inst = buscar_col(['INSTRUMENTO', 'NEMO', 'CODIGO'])
-        if not col_inst: raise Exception("No se encontró columna de Instrumento")
-
-        # Columnas nuevas (Opcionales, tienen defaults)
-        col_rut = buscar_col(['RUT', 'PROPIETARIO'])
-        col_hist = buscar_col(['HISTORICO', 'MONTO HIST'])
-        col_factor = buscar_col(['FACTOR', 'ACTUALIZACION'])
-        col_fecha = buscar_col(['FECHA', 'PAGO'])
-        col_total = buscar_col(['MONTO TOTAL', 'MONTO ACTUALIZADO', 'MONTO']) # Fallback
-
-        # 4. ITERAR
-        for index, row in df.iterrows():
-            try:
-                codigo = str(row.get(col_inst)).strip()
-                if not codigo or codigo.lower() == 'nan': continue
+def previsualizar_carga(archivo, filas=5):
+    """
+    Simulación sin escribir en la BD: retorna el plan de columnas que usaría
+    procesar_carga_masiva y las primeras filas tal como vienen en el archivo.
+    """
+    df = next(leer_archivo_por_bloques(archivo, tamano_bloque=filas))
+    plan = planificar_columnas(df.columns)
+    resumen = plan.como_dict()
+    resumen['filas'] = df.astype(object).where(df.notna(), None).values.tolist()
+    resumen['encabezados'] = list(plan.encabezados)
+    if plan.instrumento is None:
+        resumen['error'] = "No se encontró columna de Instrumento"
+    return resumen
 
-                with transaction.atomic():
-                    # Buscar Instrumento
-                    try:
-                        inst = Instrumento.objects.get(codigo__iexact=codigo)
-                    except Instrumento.DoesNotExist:
-                        # Si no existe, podrías crearlo o saltarlo. Aquí lanzamos error.
-                        raise Exception(f"Instrumento '{codigo}' no existe.")
-
-                    obj = CalificacionTributaria()
-                    obj.usuario = usuario_actual
-                    obj.instrumento = inst
-                    obj.origen = 'Carga Masiva'
-
-                    # --- RUT ---
-                    if col_rut:
-                        obj.rut_propietario = str(row.get(col_rut, '0-0')).strip()
-
-                    # --- FECHA ---
-                    if col_fecha:
-                        val_fecha = str(row.get(col_fecha)).strip()
-                        try:
-                            # Intentar DD-MM-YYYY
-                            obj.fecha_pago = datetime.strptime(val_fecha, '%d-%m-%Y').strftime('%Y-%m-%d')
-                        except:
-                            try: obj.fecha_pago = datetime.strptime(val_fecha, '%Y-%m-%d').strftime('%Y-%m-%d')
-                            except: pass # Dejar null si falla
-                    
-                    # --- MONTOS (Lógica Nueva) ---
-                    # 1. Intentar leer Histórico y Factor
-                    monto_h = Decimal(0)
-                    factor = Decimal(1)
-
-                    if col_hist:
-                        try: monto_h = Decimal(str(row.get(col_hist, 0)).replace(',','.'))
-                        except: pass
-                    
-                    if col_factor:
-                        try: factor = Decimal(str(row.get(col_factor, 1)).replace(',','.'))
-                        except: pass
-
-                    # 2. Si no hay Histórico, buscar si viene el Total directo
-                    monto_t = Decimal(0)
-                    if col_total:
-                        try: monto_t = Decimal(str(row.get(col_total, 0)).replace(',','.'))
-                        except: pass
-
-                    # 3. Asignación Inteligente
-                    if monto_h > 0:
-                        obj.monto_historico = monto_h
-                        obj.factor_actualizacion = factor
-                        obj.monto_total = monto_h * factor # Calculamos el actualizado
-                    elif monto_t > 0:
-                        # Si solo viene el total, asumimos histórico = total y factor = 1
-                        obj.monto_historico = monto_t
-                        obj.factor_actualizacion = 1
-                        obj.monto_total = monto_t
-                    
-                    # --- FACTORES F08 - F37 ---
-                    suma_bases = Decimal(0)
-                    for i in range(8, 38):
-                        col_f = buscar_col([f"F{i:02d}", f"FACTOR {i:02d}"])
-                        val_f = Decimal(0)
-                        if col_f:
-                            try: val_f = Decimal(str(row.get(col_f, 0)).replace(',','.'))
-                            except: pass
-                        
-                        setattr(obj, f"factor_{i:02d}", val_f)
-                        if 8 <= i <= 19: suma_bases += val_f
+def _bloques_validados(bloques, plan, procesos):
+    """
+    Entrega (filas leídas, datos validados) por cada bloque, en orden.
+    Con procesos > 1 la validación corre en un ProcessPoolExecutor; se mantienen
+    a lo más 2 bloques por proceso en vuelo para que la memoria siga acotada.
+    """
+    if procesos <= 1:
+        for df in bloques:
+            with etapa('validacion'):
+                datos = validar_bloque(df, plan)
+            yield len(df), datos
+        return
 
-                    obj.save()
-                    guardados += 1
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        en_vuelo = deque()
+        for df in bloques:
+            en_vuelo.append((len(df), pool.submit(validar_bloque, df, plan)))
+            if len(en_vuelo) >= 2 * procesos:
+                filas, futuro = en_vuelo.popleft()
+                with etapa('validacion'):  # En paralelo solo se ve la espera por el resultado
+                    datos = futuro.result()
+                yield filas, datos
+        while en_vuelo:
+            filas, futuro = en_vuelo.popleft()
+            with etapa('validacion'):
+                datos = futuro.result()
+            yield filas, datos
 
-            except Exception as e:
-                errores.append(f"Fila {index+2} ({codigo}): {str(e)}")
+def procesar_carga_masiva(archivo, usuario_actual, tamano_lote=TAMANO_LOTE, tamano_bloque=TAMANO_BLOQUE,
+                          al_avanzar=None, procesos=None, modo='insertar', conteo=None, trabajo=None):
+    """
+    Carga el archivo y retorna (guardados, errores).
+    En modo 'actualizar' las filas cuya clave natural ya existe reemplazan a la
+    guardada en vez de ser error. Si se entrega el dict 'conteo', se le suman
+    'insertados', 'actualizados', 'sin_cambios' y 'huellas'.
+    Las filas idénticas a una ya cargada (registro HuellaFila) se omiten antes
+    de tocar la calificación; 'trabajo' es la carga a la que quedan anotadas.
+    La validación de cada bloque puede repartirse en 'procesos' procesos
+    (por defecto CARGA_MASIVA_PROCESOS); la escritura queda en este proceso.
+    Si se entrega al_avanzar, se llama después de cada bloque con
+    (filas_procesadas, guardados, errores) para informar el progreso.
+    """
+    if modo not in MODOS_CARGA: raise ValueError(f"Modo de carga desconocido: {modo}")
+    errores = []
+    guardados = 0
+    filas_procesadas = 0
+    desconocidos = {}  # CODIGO -> (código como viene, filas)
+    conteo = {} if conteo is None else conteo
+    for campo in CONTEOS: conteo.setdefault(campo, 0)
+    registro = _nuevo_registro()
+    if procesos is None: procesos = getattr(settings, 'CARGA_MASIVA_PROCESOS', 1)
+
+    try:
+        # 1. LECTURA POR BLOQUES
+        bloques = iterar_en_etapa(leer_archivo_por_bloques(archivo, tamano_bloque), 'lectura')
+        primero = next(bloques, None)
+        if primero is not None:
+            # 2. PLAN DE COLUMNAS (una vez por archivo)
+            with etapa('columnas'):
+                plan = planificar_columnas(primero.columns)
+            if plan.instrumento is None: raise Exception("No se encontró columna de Instrumento")
+            errores.extend(f"Columna ambigua: {a}" for a in plan.ambiguedades)
+
+            # 3. VALIDACIÓN (en serie o en paralelo) Y 4. ESCRITURA EN ESTE PROCESO
+            for filas, datos in _bloques_validados(chain([primero], bloques), plan, procesos):
+                with etapa('escritura'):
+                    guardados += _guardar_bloque(
+                        datos, usuario_actual, desconocidos, errores, tamano_lote, modo, conteo, trabajo, registro)
+                filas_procesadas += filas
+                if al_avanzar: al_avanzar(filas_procesadas, guardados, errores)
 
     except Exception as e:
         errores.append(f"Error archivo: {str(e)}")
 
+    errores.extend(_errores_instrumentos(desconocidos))
     return guardados, errores
-# utils.py
-
-def obtener_configuracion_certificado():
-    """
-    Retorna la estructura COMPLETA del Certificado N° 70 (Anexo 3, Res. 98).
-    Incluye F22 (Tasa Adicional) y F34, F35, F36 (Retiros en Exceso).
-    """
-    return {
-        # ----------------------------------------------------------------------
-        # 1. RENTAS AFECTAS (Base Imponible)
-        # ----------------------------------------------------------------------
-        "SECCION_A_RENTAS_AFECTAS": {
-            "titulo": "1. RENTAS AFECTAS A IMPUESTOS",
-            "color": "primary",
-            "factores": [
-                {"id": "f08", "label": "F08 - CON CRÉDITO POR IDPC GENERADOS A CONTAR DEL 01.01.2017", "ayuda": "Monto base para grandes empresas (27%)."},
-                {"id": "f09", "label": "F09 - CON CRÉDITO POR IDPC  ACUMULADOS  HASTA EL 31.12.2016", "ayuda": "Monto base Pyme o Histórico."},
-                {"id": "f10", "label": "F10 - CON DERECHO A CRÉDITO POR PAGO DE IDPC VOLUNTARIO", "ayuda": "Crédito pagado voluntariamente."},
-                {"id": "f11", "label": "F11 - SIN DERECHO A CRÉDITO", "ayuda": "Renta afecta pura."},
-            ]
-        },
-
-        # ----------------------------------------------------------------------
-        # 2. RENTAS EXENTAS / INR
-        # ----------------------------------------------------------------------
-        "SECCION_A_RENTAS_EXENTAS": {
-            "titulo": "2. RENTAS EXENTAS / TRIBUTACIÓN CUMPLIDA",
-            "color": "success",
-            "factores": [
-                {"id": "f12", "label": "F12 - RENTAS PROVENIENTES DEL REGISTRO RAP Y DIFERENCIA INICIAL DE SOCIEDAD ACOGIDA AL EX ART. 14 TER A) LIR", "ayuda": "Deuda pagada (2017-2019)."},
-                {"id": "f13", "label": "F13 - OTRAS RENTAS PERCIBIDAS SIN PRIORIDAD EN SU ORDEN DE IMPUTACIÓN", "ayuda": "Otras rentas cumplidas."},
-                {"id": "f14", "label": "F14 - EXCESO DISTRIBUCIONES DESPROPORCIONADAS (N°9 ART.14 A)", "ayuda": "Distribución desigual (Art 14A N°9)."},
-                {"id": "f15", "label": "F15 - UTILIDADES AFECTADAS CON IMPUESTO SUSTITUTIVO AL FUT (ISFUT) LEY N°20.780", "ayuda": "FUT Histórico sustitutivo."},
-                {"id": "f16", "label": "F16 - RENTAS GENERADAS HASTA EL 31.12.1983 Y/O UTILIDADES AFECTADAS CON IMPUESTO SUSTITUTIVO AL FUT (ISFUT) LEY N°21.21", "ayuda": "ISFUT Nuevo (Caso 3)."},
-                {"id": "f17", "label": "F17 - RENTAS EXENTAS DE IMPUESTO GLOBAL COMPLEMENTARIO (IGC) (ARTÍCULO 11, LEY 18.401), AFECTAS A IMPUESTO ADICIONAL", "ayuda": "Exentas por ley."},
-                {"id": "f18", "label": "F18 - RENTAS EXENTAS DE IMPUESTO GLOBAL COMPLEMENTARIO (IGC) Y/O IMPUESTO ADICIONAL (IA)", "ayuda": "Leyes regionales."},
-                {"id": "f19", "label": "F19 - INGRESOS NO CONSTITUTIVOS DE RENTA", "ayuda": "Devolución de Capital."},
-            ]
-        },
-
-        # ----------------------------------------------------------------------
-        # 3. CRÉDITOS (SAC y OTROS)
-        # ----------------------------------------------------------------------
-        "SECCION_4_CREDITOS": {
-            "titulo": "3. CRÉDITOS (Desde 2017)",
-            "color": "warning",
-            "factores": [
-                {"id": "f20", "label": "F20 - No Suj. Restitución sin Derecho a Devolución (Hasta 2019)", "ayuda": "Saldo antiguo SAC."},
-                {"id": "f21", "label": "F21 - No Suj. Restitución con Derecho a Devolución (Hasta 2019)", "ayuda": "Saldo antiguo SAC."},
-                {"id": "f22", "label": "F22 - No Suj. Restitución sin Derecho a Devolución (Desde 2020)", "ayuda": "Crédito Pyme (100%)."},
-                {"id": "f23", "label": "F23 - No Suj. Restitución con Derecho a Devolución (Desde 2020)", "ayuda": "Crédito Pyme (100%)."},
-                {"id": "f24", "label": "F24 - Sujetos a Restitución (14 A) sin Derecho a Devolución", "ayuda": "Crédito 27% (Devuelve 35%)."},
-                {"id": "f25", "label": "F25 - Sujetos a Restitución (14 A) con Derecho a Devolución", "ayuda": "Crédito 27% (Devuelve 35%)."},
-                {"id": "f26", "label": "F26 - Sujetos a Restitución (Exentas)", "ayuda": "Asociado a rentas exentas."},
-                {"id": "f27", "label": "F27 - Sujetos a Restitución (Exentas)", "ayuda": "Asociado a rentas exentas."},
-                {"id": "f28", "label": "F28 - Crédito IPE", "ayuda": "Impuesto Extranjero."},
-                {"id": "f31", "label": "F31 - Crédito Art. 33 Bis", "ayuda": "Activo Fijo."},
-            ]
-        },
-
-        # ----------------------------------------------------------------------
-        # 4. CRÉDITOS HISTÓRICOS (STUT)
-        # ----------------------------------------------------------------------
-        "SECCION_4_STUT": {
-            "titulo": "4. CRÉDITOS HISTÓRICOS (Hasta 2016)",
-            "color": "secondary",
-            "factores": [
-                {"id": "f29", "label": "F29 - Asociado a  Rentas Afectas sin Derecho a Devolución", "ayuda": "Solo para pago impuestos."},
-                {"id": "f30", "label": "F30 - Asociado a  Rentas Afectas con Derecho a Devolución", "ayuda": "Se devuelve en efectivo."},
-                {"id": "f31", "label": "F31 - Asociado a  Rentas Exentas sin Derecho a Devolución", "ayuda": "Solo para pago impuestos."},
-                {"id": "f32", "label": "F32 - Asociado a  Rentas Exentas con Derecho a Devolución", "ayuda": "Se devuelve en efectivo."},
-                {"id": "f33", "label": "F33 - Crédito IPE", "ayuda": "Impuesto Extranjero."},
-                {"id": "f34", "label": "F34 - Credito por Impuesto Tasa Adicional (Ex Art.21)", "ayuda": "Impuesto castigo pagado por la empresa."},
-
-            ]
-        },
-
-        # ----------------------------------------------------------------------
-        # 5. SALDOS Y CONTROL (Aquí van los F34, F35, F36)
-        # ----------------------------------------------------------------------
-        "SECCION_SALDOS": {
-            "titulo": "5. INFORMACIÓN DE SALDOS Y EXCESOS",
-            "color": "info",
-            "factores": [
-                {"id": "f35", "label": "F35 - Tasa Efec. Crédito FUT (TEF)", "ayuda": "Tasa Efectiva del Crédito del FUT. Se usa para asignar créditos antiguos."}, # <-- F35
-                {"id": "f36", "label": "F36 - Tasa Efec. Crédito FUNT (TEX)", "ayuda": "Tasa Efectiva del Crédito del FUNT (Ingresos No Renta)."}, # <-- F36
-                {"id": "f37", "label": "F37 - Devolución Capital (Art 17 N°7)", "ayuda": "Cantidades que NO constituyen renta (Devolución de capital real)."},
-            ]
-        }
-    }
\ No newline at end of file
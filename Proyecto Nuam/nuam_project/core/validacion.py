@@ -0,0 +1,185 @@
+"""
+Etapa de validación de la carga masiva: plan de columnas y conversión de
+bloques del archivo a valores tipados.
+
+Este módulo no importa Django a propósito: los procesos del pool que usa
+procesar_carga_masiva lo importan sin inicializar la aplicación.
+"""
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+import pandas as pd
+
+from .factores import CAMPOS_FACTORES, NUMEROS_FACTORES, calcular_monto_total
+
+# --- PLAN DE COLUMNAS (se arma una vez por archivo) ---
+
+# Palabras clave por campo, en orden de prioridad
+PALABRAS_CLAVE = (
+    ('instrumento', ('INSTRUMENTO', 'NEMO', 'CODIGO')),
+    ('rut', ('RUT', 'PROPIETARIO')),
+    ('historico', ('HISTORICO', 'MONTO HIST')),
+    ('factor', ('FACTOR', 'ACTUALIZACION')),
+    ('fecha', ('FECHA', 'PAGO')),
+    ('total', ('MONTO TOTAL', 'MONTO ACTUALIZADO', 'MONTO')),
+    ('ejercicio', ('EJERCICIO',)),
+    ('secuencia', ('SECUENCIA',)),
+    ('descripcion', ('DESCRIPCION', 'GLOSA')),
+    ('isfut', ('ISFUT',)),
+)
+# Valores de la columna ISFUT que cuentan como "sí"
+VALORES_SI = {'SI', 'SÍ', 'S', 'X', '1', 'TRUE', 'VERDADERO'}
+
+@dataclass(frozen=True)
+class PlanColumnas:
+    """
+    Posición de cada campo dentro del archivo (None si no viene).
+    'factores' trae una posición por factor, de F08 a F37.
+    """
+    encabezados: tuple
+    instrumento: int = None
+    rut: int = None
+    historico: int = None
+    factor: int = None
+    fecha: int = None
+    total: int = None
+    ejercicio: int = None
+    secuencia: int = None
+    descripcion: int = None
+    isfut: int = None
+    factores: tuple = (None,) * 30
+    ambiguedades: tuple = ()
+
+    def como_dict(self):
+        """Resumen legible del plan (encabezado asignado a cada campo)."""
+        nombre = lambda pos: None if pos is None else self.encabezados[pos]
+        usadas = {getattr(self, campo) for campo, _ in PALABRAS_CLAVE} | set(self.factores)
+        usadas.discard(None)
+        return {
+            'columnas': {campo: nombre(getattr(self, campo)) for campo, _ in PALABRAS_CLAVE},
+            'factores': {f"F{i:02d}": nombre(pos) for i, pos in zip(NUMEROS_FACTORES, self.factores)},
+            'sin_usar': [c for pos, c in enumerate(self.encabezados) if pos not in usadas],
+            'ambiguedades': list(self.ambiguedades),
+        }
+
+def planificar_columnas(encabezados):
+    """
+    Asigna cada campo a una columna buscando sus palabras clave dentro de los
+    encabezados (ya normalizados). Primero se toman las columnas de factores,
+    así 'FACTOR' no confunde 'FACTOR 08' con 'FACTOR ACTUALIZACION'.
+    Si una palabra clave calza con varias columnas libres se usa la primera
+    (o la que coincide exacto) y se deja registrada la ambigüedad.
+    """
+    encabezados = tuple(encabezados)
+    ocupadas = set()
+    ambiguedades = []
+
+    def asignar(campo, claves, reservar_todas=False):
+        for k in claves:
+            candidatas = [pos for pos, col in enumerate(encabezados) if k in col and pos not in ocupadas]
+            if not candidatas: continue
+            exactas = [pos for pos in candidatas if encabezados[pos] == k]
+            elegida = exactas[0] if exactas else candidatas[0]
+            if len(candidatas) > 1 and not exactas:
+                nombres = ', '.join(encabezados[pos] for pos in candidatas)
+                ambiguedades.append(f"'{campo}' calza con {nombres} (se usa {encabezados[elegida]})")
+            ocupadas.update(candidatas if reservar_todas else [elegida])
+            return elegida
+        return None
+
+    # Un factor puede venir como F08 o FACTOR 08: cualquiera de las dos queda reservada
+    factores = tuple(asignar(f"F{i:02d}", [f"F{i:02d}", f"FACTOR {i:02d}"], reservar_todas=True) for i in NUMEROS_FACTORES)
+    campos = {campo: asignar(campo, claves) for campo, claves in PALABRAS_CLAVE}
+    return PlanColumnas(encabezados=encabezados, factores=factores, ambiguedades=tuple(ambiguedades), **campos)
+
+# --- CONVERSIONES POR COLUMNA (VECTORIZADAS) ---
+
+def _columna_texto(serie):
+    """Texto sin espacios; las celdas vacías quedan como ''."""
+    return serie.astype(object).where(serie.notna(), '').astype(str).str.strip()
+
+def _columna_decimal(serie, defecto):
+    """
+    Convierte una columna completa a Decimal (acepta coma decimal).
+    Los valores vacíos o no numéricos quedan con el valor por defecto.
+    """
+    texto = _columna_texto(serie).str.replace(',', '.', regex=False)
+    numeros = pd.to_numeric(texto, errors='coerce').to_numpy(dtype=float)
+    validos = np.isfinite(numeros)
+
+    # Cada valor distinto se convierte una sola vez (los factores se repiten mucho)
+    tabla = {}
+    for valor in pd.unique(texto[validos]):
+        try: tabla[valor] = Decimal(valor)
+        except InvalidOperation: pass
+
+    resultado = texto.map(tabla)
+    return resultado.where(resultado.notna(), defecto)
+
+def _columna_entero(serie, defecto):
+    """Enteros (ejercicio, secuencia); lo vacío o no numérico queda con el valor por defecto."""
+    numeros = pd.to_numeric(_columna_texto(serie).str.replace(',', '.', regex=False), errors='coerce')
+    return numeros.fillna(defecto).astype(int)
+
+def _columna_fecha(serie):
+    """
+    Fechas en DD-MM-YYYY o YYYY-MM-DD (o celdas de fecha de Excel, que llegan
+    como '2024-03-01 00:00:00'); si no calza ninguna queda en None.
+    """
+    texto = _columna_texto(serie)
+    fechas = pd.to_datetime(texto, format='%d-%m-%Y', errors='coerce')
+    for formato in ('%Y-%m-%d', '%Y-%m-%d %H:%M:%S'):
+        if not fechas.isna().any(): break
+        fechas = fechas.fillna(pd.to_datetime(texto, format=formato, errors='coerce'))
+    return fechas.dt.date.astype(object).where(fechas.notna(), None)
+
+def validar_bloque(df, plan):
+    """
+    Etapa de parseo/validación: transforma un bloque leído del archivo en
+    columnas tipadas listas para construir CalificacionTributaria (una fila
+    por registro, con el mismo índice del bloque). Las columnas se leen por
+    posición según el plan. Las filas sin código de instrumento se descartan.
+
+    Es una función pura (no toca la BD): se puede llamar en serie o dentro
+    de un ProcessPoolExecutor.
+    """
+    columna = lambda pos: df.iloc[:, pos]
+    codigos = _columna_texto(columna(plan.instrumento))
+    filtro = ((codigos != '') & (codigos.str.lower() != 'nan')).to_numpy()
+    df, codigos = df[filtro], codigos[filtro]
+    datos = pd.DataFrame({'codigo': codigos}, index=df.index)
+
+    cero, uno = Decimal(0), Decimal(1)
+    vacia = pd.Series(cero, index=df.index, dtype=object)
+
+    datos['rut_propietario'] = _columna_texto(columna(plan.rut)).replace('', '0-0') if plan.rut is not None else '0-0'
+    datos['fecha_pago'] = _columna_fecha(columna(plan.fecha)) if plan.fecha is not None else None
+
+    # Sin columna se deja el valor por defecto del modelo
+    if plan.ejercicio is not None: datos['ejercicio'] = _columna_entero(columna(plan.ejercicio), 2025)
+    if plan.secuencia is not None: datos['secuencia'] = _columna_entero(columna(plan.secuencia), 0)
+    if plan.descripcion is not None:
+        descripcion = _columna_texto(columna(plan.descripcion))
+        datos['descripcion'] = descripcion.where(descripcion != '', None)
+    if plan.isfut is not None: datos['es_isfut'] = _columna_texto(columna(plan.isfut)).str.upper().isin(VALORES_SI)
+
+    # --- MONTOS ---
+    hist = _columna_decimal(columna(plan.historico), cero) if plan.historico is not None else vacia
+    factor = _columna_decimal(columna(plan.factor), uno) if plan.factor is not None else vacia.map(lambda _: uno)
+    total = _columna_decimal(columna(plan.total), cero) if plan.total is not None else vacia
+
+    # Si hay Histórico se usa con su factor; si solo viene el Total, histórico = total y factor = 1
+    usar_hist = hist > 0
+    usar_total = ~usar_hist & (total > 0)
+    datos['monto_historico'] = hist.where(usar_hist, total.where(usar_total, cero))
+    datos['factor_actualizacion'] = factor.where(usar_hist, uno)
+    datos['monto_total'] = [
+        calcular_monto_total(h, f) for h, f in zip(datos['monto_historico'], datos['factor_actualizacion'])
+    ]
+
+    # --- FACTORES F08 - F37 ---
+    for campo, pos in zip(CAMPOS_FACTORES, plan.factores):
+        datos[campo] = _columna_decimal(columna(pos), cero) if pos is not None else vacia
+
+    return datos
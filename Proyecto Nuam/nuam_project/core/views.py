@@ -1,14 +1,31 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, logout
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib import messages
 from django.db import transaction
-from django.http import JsonResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import parse_etags
 from decimal import Decimal, InvalidOperation
+import json
 import logging
-from .models import CalificacionTributaria, Instrumento
-from .utils import obtener_configuracion_certificado, procesar_carga_masiva
+import tempfile
+from .busqueda import buscar
+from .cache import detalle_en_cache, etag_detalle, guardar_detalle, listar_instrumentos
+from .certificado import certificado_para
+from .exportacion import exportar_csv, exportar_parquet, exportar_xlsx, parquet_disponible
+from .factores import CAMPOS_FACTORES, NUMEROS_FACTORES, MatrizFactores, calcular_factores_lote, calcular_monto_total
+from .models import CalificacionTributaria, ResumenCalificaciones, TrabajoCarga
+from .operaciones import aplicar
+from .paginacion import paginar_keyset, tamano_pagina
+from .resumen import TOTALES
+from . import rendimiento
+from .trabajos import encolar_carga
+from .utils import previsualizar_carga, procesar_carga_masiva
 from django.db.models import Max
 
 logger = logging.getLogger(__name__)
@@ -30,29 +47,145 @@ def limpiar_tributario(valor):
     except (InvalidOperation, ValueError):
         return Decimal('0')
 
+# Orden de las columnas en las filas compactas de la grilla. Los 30 factores van
+# como lista al final, en enteros escalados por 10^6 (MatrizFactores)
+COLUMNAS_GRILLA = [
+    'id', 'rut_propietario', 'instrumento_id', 'instrumento_codigo', 'instrumento_nombre', 'usuario',
+    'fecha_pago', 'ejercicio', 'secuencia', 'monto_historico', 'factor_actualizacion', 'monto_total',
+    'es_isfut', 'descripcion', 'factores',
+]
+
+def fila_grilla(c, factores):
+    return [
+        c.id, c.rut_propietario, c.instrumento.id, c.instrumento.codigo, c.instrumento.nombre, c.usuario.username,
+        c.fecha_pago, c.ejercicio, c.secuencia, c.monto_historico, c.factor_actualizacion, c.monto_total,
+        c.es_isfut, c.descripcion or '', factores,
+    ]
+
+def pagina_grilla(request):
+    """
+    Una ventana de la grilla del mantenedor como filas compactas.
+    Respeta los filtros de búsqueda, 'despues' (cursor keyset) y 'tam' de la URL.
+    """
+    calificaciones = buscar(CalificacionTributaria.objects.visibles_para(request.user).para_listado(), request.GET)
+
+    tamano = tamano_pagina(request.GET.get('tam'), settings.MANTENEDOR_TAMANO_PAGINA)
+    filas, siguiente, _ = paginar_keyset(calificaciones, despues=request.GET.get('despues'), tamano=tamano)
+    matriz = MatrizFactores.desde_objetos(filas)
+    return {
+        'columnas': COLUMNAS_GRILLA,
+        'filas': [fila_grilla(c, matriz.fila(i).tolist()) for i, c in enumerate(filas)],
+        'siguiente': siguiente,
+    }
+
 # --- AJAX: OBTENER DATOS PARA MODIFICAR ---
 @login_required
 def obtener_detalle_view(request, id):
+    # Una consulta liviana da el permiso y la versión (updated_at): con el mismo ETag, 304, y si esa
+    # versión está en caché no se lee la fila. Así una edición hecha por otro proceso se ve al momento
+    version = CalificacionTributaria.objects.visibles_para(request.user).filter(id=id).values_list('updated_at', flat=True).first()
+    if version is None:
+        return JsonResponse({'status': 'error', 'msg': 'CalificacionTributaria matching query does not exist.'})
+    etag = etag_detalle(id, version)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        respuesta = HttpResponseNotModified()
+    else:
+        cuerpo = detalle_en_cache(etag)
+        if cuerpo is None:
+            try:
+                calif = CalificacionTributaria.objects.get(id=id)
+
+                data = {
+                    'id': calif.id,
+                    'instrumento_id': calif.instrumento_id,
+                    'ejercicio': calif.ejercicio,
+                    'fecha_pago': calif.fecha_pago.strftime('%Y-%m-%d') if calif.fecha_pago else '',
+                    'monto_total': str(calif.monto_total),
+                    'descripcion': calif.descripcion or '',
+                    'secuencia': calif.secuencia,
+                    'es_isfut': calif.es_isfut,
+                    'factor_actualizacion': str(calif.factor_actualizacion),
+                    'monto_historico': str(calif.monto_historico),
+                    # CORRECCIÓN: Forzamos exactamente 6 decimales para el modal
+                    **dict(zip(CAMPOS_FACTORES, MatrizFactores.desde_objetos([calif]).textos(0, separador=',')))
+                }
+            except Exception as e:
+                return JsonResponse({'status': 'error', 'msg': str(e)})
+            # Si cambió entre las dos lecturas, se guarda y se responde con la versión leída
+            etag = etag_detalle(calif.id, calif.updated_at)
+            cuerpo = json.dumps({'status': 'ok', 'data': data}, cls=DjangoJSONEncoder).encode()
+            guardar_detalle(etag, cuerpo)
+        respuesta = HttpResponse(cuerpo, content_type='application/json')
+    respuesta['ETag'] = etag
+    # El navegador guarda la respuesta pero revalida cada vez (el detalle cambia con cada edición)
+    respuesta['Cache-Control'] = 'private, no-cache'
+    return respuesta
+
+# --- AJAX: VENTANAS DE LA GRILLA (SCROLL VIRTUAL) ---
+@login_required
+def calificaciones_api_view(request):
+    return JsonResponse({'status': 'ok', **pagina_grilla(request)})
+
+# --- AJAX: RESUMEN PARA EL DASHBOARD ---
+@login_required
+def resumen_api_view(request):
+    """Totales por ejercicio y por mercado, leídos solo de la tabla de resumen."""
+    grupos = ResumenCalificaciones.objects.select_related('mercado')
+    if not request.user.is_superuser: grupos = grupos.filter(usuario=request.user)
+
+    total, por_ejercicio, por_mercado = dict.fromkeys(TOTALES, 0), {}, {}
+    for g in grupos:
+        for acumulado in (total, por_ejercicio.setdefault(g.ejercicio, dict.fromkeys(TOTALES, 0)),
+                          por_mercado.setdefault(g.mercado.nombre, dict.fromkeys(TOTALES, 0))):
+            for campo in TOTALES: acumulado[campo] += getattr(g, campo)
+    return JsonResponse({
+        'status': 'ok',
+        'total': total,
+        'por_ejercicio': [{'ejercicio': e, **t} for e, t in sorted(por_ejercicio.items())],
+        'por_mercado': [{'mercado': m, **t} for m, t in sorted(por_mercado.items())],
+    })
+
+# --- AJAX: ESTADÍSTICAS DE RENDIMIENTO DE ESTE PROCESO ---
+@login_required
+def rendimiento_api_view(request):
+    if not request.user.is_superuser:
+        return JsonResponse({'status': 'error', 'msg': 'Solo administradores.'}, status=403)
+    return JsonResponse({'status': 'ok', 'vistas': rendimiento.estadisticas()})
+
+# --- OPERACIONES MASIVAS (FILAS MARCADAS O RESULTADO DEL FILTRO) ---
+CAMPOS_FILTRO = ('q', 'ejercicio', 'desde', 'hasta', 'q_mercado')
+
+@login_required
+def operacion_masiva_view(request):
+    if request.method != 'POST': return redirect('mantenedor')
+    operacion = request.POST.get('operacion')
+    # Reasignar saca las filas de la vista del corredor: solo el administrador
+    if operacion == 'reasignar' and not request.user.is_superuser:
+        messages.error(request, "Solo un administrador puede reasignar calificaciones.")
+        return redirect('mantenedor')
+
+    calificaciones = CalificacionTributaria.objects.visibles_para(request.user)
+    ids = [int(i) for i in request.POST.get('ids', '').split(',') if i.strip().isdigit()]
+    if ids:
+        filtros = {'ids': ids}
+        calificaciones = calificaciones.filter(id__in=ids)
+    else:
+        filtros = {campo: request.POST[campo] for campo in CAMPOS_FILTRO if request.POST.get(campo)}
+        calificaciones = buscar(calificaciones, filtros)
+    if not filtros:
+        messages.error(request, "Marque filas o aplique un filtro antes de una operación masiva.")
+        return redirect('mantenedor')
+
     try:
-        calif = CalificacionTributaria.objects.get(id=id) if request.user.is_superuser else CalificacionTributaria.objects.get(id=id, usuario=request.user)
-        
-        data = {
-            'id': calif.id,
-            'instrumento_id': calif.instrumento.id,
-            'ejercicio': calif.ejercicio,
-            'fecha_pago': calif.fecha_pago.strftime('%Y-%m-%d') if calif.fecha_pago else '',
-            'monto_total': str(calif.monto_total),
-            'descripcion': calif.descripcion or '',
-            'secuencia': calif.secuencia,
-            'es_isfut': calif.es_isfut,
-            'factor_actualizacion': str(calif.factor_actualizacion),
-            'monto_historico': str(calif.monto_historico),
-            # CORRECCIÓN: Forzamos exactamente 6 decimales para el modal
-            **{f'factor_{i:02d}': "{:.6f}".format(getattr(calif, f'factor_{i:02d}')).replace('.', ',') for i in range(8, 38)}
-        }
-        return JsonResponse({'status': 'ok', 'data': data})
-    except Exception as e:
-        return JsonResponse({'status': 'error', 'msg': str(e)})
+        r = aplicar(operacion, calificaciones, valor=request.POST.get('valor'), autor=request.user, filtros=filtros)
+    except ValueError as e:
+        messages.error(request, f"Error: {e}")
+        return redirect('mantenedor')
+    if r.estado == 'fallido':
+        messages.error(request, f"Operación #{r.id} detenida tras {r.afectadas} filas: {r.error}")
+    else:
+        messages.success(request, f"✅ {r.get_operacion_display()}: {r.afectadas} de {r.revisadas} registros (operación #{r.id}).")
+    return redirect('mantenedor')
 
 # --- VISTA PRINCIPAL (MANTENEDOR) ---
 
@@ -63,19 +196,19 @@ def mantenedor_view(request):
             id_eliminar = request.POST.get('id_seleccionado')
             if id_eliminar:
                 try:
-                    obj = CalificacionTributaria.objects.get(id=id_eliminar) if request.user.is_superuser else CalificacionTributaria.objects.get(id=id_eliminar, usuario=request.user)
+                    obj = CalificacionTributaria.objects.visibles_para(request.user).get(id=id_eliminar)
                     obj.delete()
                     messages.success(request, "Registro eliminado correctamente.")
                 except CalificacionTributaria.DoesNotExist:
                     messages.error(request, "Error: No se encontró el registro.")
             return redirect('mantenedor')
-        
+
         else:
             try:
                 with transaction.atomic():
                     id_edicion = request.POST.get('id_edicion')
                     if id_edicion:
-                        nueva = get_object_or_404(CalificacionTributaria, id=id_edicion) if request.user.is_superuser else get_object_or_404(CalificacionTributaria, id=id_edicion, usuario=request.user)
+                        nueva = get_object_or_404(CalificacionTributaria.objects.visibles_para(request.user), id=id_edicion)
                     else:
                         nueva = CalificacionTributaria(usuario=request.user, origen='Corredor')
 
@@ -90,25 +223,17 @@ def mantenedor_view(request):
                     nueva.monto_historico = limpiar_tributario(request.POST.get('monto_historico'))
                     nueva.factor_actualizacion = limpiar_tributario(request.POST.get('factor_actualizacion'))
                     
-                    # GUARDADO 1: Activa el cálculo de monto_total en el modelo
-                    nueva.save() 
-
-                    # 2. Cálculo de factores con precisión de 6 decimales
-                    seis_dec = Decimal('0.000001') 
-
-                    for i in range(8, 38):
-                        # Obtenemos monto de entrada y lo limpiamos
-                        monto_f = limpiar_tributario(request.POST.get(f'f{i:02d}'))
-                        
-                        if nueva.monto_total > 0:
-                            # Calculamos y redondeamos a 6 decimales
-                            factor_calc = (monto_f / nueva.monto_total).quantize(seis_dec, rounding='ROUND_HALF_UP')
-                            setattr(nueva, f'factor_{i:02d}', factor_calc)
-                        else:
-                            setattr(nueva, f'factor_{i:02d}', Decimal('0.000000'))
-
-                    # GUARDADO FINAL
-                    nueva.save() 
+                    # 2. Montos y factores se calculan antes de escribir (una sola escritura)
+                    nueva.monto_total = calcular_monto_total(nueva.monto_historico, nueva.factor_actualizacion, nueva.monto_total)
+                    montos = [limpiar_tributario(request.POST.get(f.id)) for f in certificado_para().factores]
+                    calcular_factores_lote([montos], [nueva.monto_total]).asignar(0, nueva)
+
+                    # GUARDADO ÚNICO: en edición solo se escriben las columnas que cambiaron
+                    if id_edicion:
+                        cambios = nueva.campos_modificados()
+                        if cambios: nueva.save(update_fields=cambios)
+                    else:
+                        nueva.save()
                     messages.success(request, "✅ Registro guardado con éxito.")
                     return redirect('mantenedor')
 
@@ -116,23 +241,37 @@ def mantenedor_view(request):
                 messages.error(request, f"Error al guardar: {e}")
                 return redirect('mantenedor')
 
-    # Lógica GET para cargar la tabla
-    calificaciones = CalificacionTributaria.objects.all() if request.user.is_superuser else CalificacionTributaria.objects.filter(usuario=request.user)
-    calificaciones = calificaciones.order_by('-created_at')
-    
-    # Filtros (Mantenidos igual)
-    q_mercado = request.GET.get('q_mercado')
-    if q_mercado: calificaciones = calificaciones.filter(instrumento__mercado__nombre__icontains=q_mercado)
-
+    # Lógica GET: la primera ventana va embebida; el resto la pide la grilla a la API al hacer scroll
     return render(request, 'core/mantenedor.html', {
-        'calificaciones': calificaciones,
-        'instrumentos': Instrumento.objects.all().order_by('codigo'),
-        'grupos': obtener_configuracion_certificado(), 
-        'rango_factores': range(8, 38),
+        'pagina_inicial': pagina_grilla(request),
+        'filtros': {campo: request.GET.get(campo, '') for campo in CAMPOS_FILTRO},
+        'instrumentos': listar_instrumentos(),
+        'certificado': certificado_para(),
+        'rango_factores': NUMEROS_FACTORES,
         'proximo_id': (CalificacionTributaria.objects.aggregate(Max('id'))['id__max'] or 0) + 1
     })
 
 # --- OTRAS VISTAS ---
+# --- EXPORTACIÓN (MISMOS FILTROS QUE EL MANTENEDOR) ---
+@login_required
+def exportar_view(request, formato):
+    calificaciones = buscar(CalificacionTributaria.objects.visibles_para(request.user), request.GET).order_by('-created_at', '-id')
+    nombre = f"calificaciones_{timezone.localdate():%Y%m%d}.{formato}"
+    if formato == 'csv':
+        respuesta = StreamingHttpResponse(exportar_csv(calificaciones), content_type='text/csv; charset=utf-8')
+        respuesta['Content-Disposition'] = f'attachment; filename="{nombre}"'
+        return respuesta
+    if formato not in ('xlsx', 'parquet'): raise Http404
+    if formato == 'parquet' and not parquet_disponible():
+        messages.error(request, "La exportación a Parquet requiere instalar pyarrow.")
+        return redirect('mantenedor')
+
+    # XLSX y Parquet se escriben a un temporal en disco; FileResponse lo envía por partes y lo cierra (y borra)
+    destino = tempfile.TemporaryFile()
+    (exportar_xlsx if formato == 'xlsx' else exportar_parquet)(calificaciones, destino)
+    destino.seek(0)
+    return FileResponse(destino, as_attachment=True, filename=nombre)
+
 def mantenedor_redirect(request): return redirect('mantenedor')
 
 def login_view(request):
@@ -152,9 +291,48 @@ def logout_view(request):
 
 @login_required
 def carga_masiva_view(request):
+    # El archivo queda en disco y lo procesa el worker ('manage.py procesar_cargas')
     if request.method == 'POST' and request.FILES.get('archivo_excel'):
-        guardados, errores = procesar_carga_masiva(request.FILES['archivo_excel'], request.user)
-        if guardados > 0: messages.success(request, f"✅ Se cargaron {guardados} registros.")
-        if errores: 
-            for error in errores[:3]: messages.error(request, error)
-    return redirect('mantenedor')
\ No newline at end of file
+        modo = 'actualizar' if request.POST.get('modo') == 'actualizar' else 'insertar'
+        trabajo = encolar_carga(request.FILES['archivo_excel'], request.user, modo)
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse({'status': 'ok', 'id': trabajo.id, 'url_estado': reverse('estado_carga', args=[trabajo.id])})
+        if trabajo.duplicado_de_id:
+            messages.info(request, f"El archivo es idéntico a la carga #{trabajo.duplicado_de_id} y sus registros no han cambiado: no se volvió a procesar.")
+        else:
+            messages.info(request, f"Carga #{trabajo.id} en cola. Los registros aparecerán al terminar el proceso.")
+    return redirect('mantenedor')
+
+# --- AJAX: PROGRESO DE UNA CARGA MASIVA ---
+@login_required
+def estado_carga_view(request, id):
+    try:
+        trabajo = TrabajoCarga.objects.get(id=id) if request.user.is_superuser else TrabajoCarga.objects.get(id=id, usuario=request.user)
+        return JsonResponse({'status': 'ok', 'data': {
+            'id': trabajo.id,
+            'archivo': trabajo.nombre_archivo,
+            'estado': trabajo.estado,
+            'filas_procesadas': trabajo.filas_procesadas,
+            'guardados': trabajo.guardados,
+            'modo': trabajo.modo,
+            'insertados': trabajo.insertados,
+            'actualizados': trabajo.actualizados,
+            'sin_cambios': trabajo.sin_cambios,
+            'duplicado_de': trabajo.duplicado_de_id,
+            'cantidad_errores': trabajo.cantidad_errores,
+            'errores': trabajo.errores[:5],
+            'terminado': trabajo.estado in ('terminado', 'fallido'),
+        }})
+    except TrabajoCarga.DoesNotExist:
+        return JsonResponse({'status': 'error', 'msg': 'No se encontró la carga.'})
+
+# --- AJAX: SIMULAR CARGA (PLAN DE COLUMNAS SIN GUARDAR) ---
+@login_required
+def carga_masiva_preview_view(request):
+    archivo = request.FILES.get('archivo_excel')
+    if request.method != 'POST' or not archivo:
+        return JsonResponse({'status': 'error', 'msg': 'Debe adjuntar un archivo.'})
+    try:
+        return JsonResponse({'status': 'ok', 'data': previsualizar_carga(archivo)})
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'msg': str(e)})
@@ -9,7 +9,9 @@ https://docs.djangoproject.com/en/5.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
+from decouple import config
 from django.contrib.messages import constants as messages
+from django.core.exceptions import ImproperlyConfigured
 from pathlib import Path
 import os
 
@@ -51,6 +53,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.RendimientoMiddleware',
 ]
 
 ROOT_URLCONF = 'nuam_project.urls'
@@ -76,12 +79,60 @@ WSGI_APPLICATION = 'nuam_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Perfil elegido por variables de entorno (o un archivo .env, vía python-decouple):
+#   DB_MOTOR=sqlite (por defecto): WAL, busy_timeout y transacciones IMMEDIATE, para que las cargas
+#     masivas y las páginas no choquen con "database is locked". DB_SQLITE_AJUSTADO=False deja
+#     SQLite tal como viene en Django (sirve para comparar con benchmarks/concurrencia.py).
+#   DB_MOTOR=postgres: conexiones persistentes (DB_CONN_MAX_AGE) o, con DB_POOL=True, el pool
+#     nativo de Django (requiere 'psycopg[pool]'; Django no admite ambos a la vez).
+DB_MOTOR = config('DB_MOTOR', default='sqlite')
+
+if DB_MOTOR == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NOMBRE', default='nuam'),
+            'USER': config('DB_USUARIO', default='nuam'),
+            'PASSWORD': config('DB_CLAVE', default=''),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PUERTO', default='5432'),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
     }
-}
+    if config('DB_POOL', default=False, cast=bool):
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': config('DB_POOL_MIN', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX', default=20, cast=int),
+            'timeout': config('DB_POOL_ESPERA', default=10, cast=int),
+        }
+    else:
+        DATABASES['default']['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=60, cast=int)
+elif DB_MOTOR == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DB_NOMBRE', default=str(BASE_DIR / 'db.sqlite3')),
+        }
+    }
+    if config('DB_SQLITE_AJUSTADO', default=True, cast=bool):
+        espera = config('DB_SQLITE_ESPERA', default=20, cast=int)  # segundos esperando un bloqueo antes de fallar
+        DATABASES['default']['OPTIONS'] = {
+            'timeout': espera,
+            # Toma el bloqueo de escritura al empezar la transacción: sin esto, una lectura que luego
+            # escribe no puede esperar (busy_timeout no aplica) y falla con "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ';'.join([
+                'PRAGMA journal_mode=WAL',        # lectores y un escritor a la vez
+                'PRAGMA synchronous=NORMAL',      # seguro con WAL; fsync solo en los checkpoints
+                f'PRAGMA busy_timeout={espera * 1000}',
+                'PRAGMA cache_size=-65536',       # 64 MB de caché de páginas por conexión
+                'PRAGMA temp_store=MEMORY',
+                'PRAGMA mmap_size=268435456',     # 256 MB
+            ]),
+        }
+else:
+    raise ImproperlyConfigured(f"DB_MOTOR debe ser 'sqlite' o 'postgres', no '{DB_MOTOR}'")
 
 
 # Password validation
@@ -128,6 +179,60 @@ NUMBER_GROUPING = 3
 STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
+# Archivos subidos (las cargas masivas quedan aquí hasta que el worker las procesa)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Filas por ventana que la grilla del mantenedor pide a la API (se puede cambiar con ?tam=, hasta 500)
+MANTENEDOR_TAMANO_PAGINA = 200
+
+# Procesos que validan los bloques de una carga masiva (1 = en serie)
+CARGA_MASIVA_PROCESOS = config('CARGA_MASIVA_PROCESOS', default=1, cast=int)
+
+# Caché del JSON de detalle de cada calificación (core/cache.py): DETALLE_CACHE=memoria (por proceso) o
+# archivos (en DETALLE_CACHE_DIR, compartida por los procesos del servidor). La clave lleva updated_at,
+# que se revisa en cada pedido: una edición en otro proceso nunca deja un detalle viejo en ninguna de las dos
+DETALLE_CACHE = config('DETALLE_CACHE', default='memoria')
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+if DETALLE_CACHE == 'memoria':
+    CACHES['detalle'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'detalle',
+        'TIMEOUT': config('DETALLE_CACHE_TTL', default=60, cast=int),
+        'OPTIONS': {'MAX_ENTRIES': config('DETALLE_CACHE_MAX', default=5000, cast=int)},
+    }
+elif DETALLE_CACHE == 'archivos':
+    CACHES['detalle'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('DETALLE_CACHE_DIR', default=str(BASE_DIR / 'cache' / 'detalle')),
+        'TIMEOUT': config('DETALLE_CACHE_TTL', default=3600, cast=int),
+        'OPTIONS': {'MAX_ENTRIES': config('DETALLE_CACHE_MAX', default=20000, cast=int)},
+    }
+else:
+    raise ImproperlyConfigured(f"DETALLE_CACHE debe ser 'memoria' o 'archivos', no '{DETALLE_CACHE}'")
+
+# Medición por request (core/rendimiento.py): presupuesto de consultas por vista (nombre de URL);
+# pasarlo deja un warning en el logger 'core.rendimiento'. RENDIMIENTO_MEMORIA mide el pico con tracemalloc (lento)
+RENDIMIENTO_PRESUPUESTOS = {
+    'mantenedor': 12,
+    'obtener_detalle': 6,
+    'calificaciones_api': 8,
+    'carga_masiva': 8,
+}
+RENDIMIENTO_MEMORIA = config('RENDIMIENTO_MEMORIA', default=False, cast=bool)
+
+# Un JSON por request en 'core.rendimiento' con RENDIMIENTO_LOG=INFO; por defecto solo los presupuestos pasados
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'consola': {'class': 'logging.StreamHandler'}},
+    'loggers': {
+        'core.rendimiento': {'handlers': ['consola'], 'level': config('RENDIMIENTO_LOG', default='WARNING'), 'propagate': False},
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 